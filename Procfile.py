@@ -9,7 +9,13 @@ web_config = {
     'port': 5000,
     'host': '0.0.0.0',
     'workers': 2,
-    'timeout': 30
+    'timeout': 30  # 同步worker：翻译进度SSE每个连接不超过25秒（TRANSLATION_EVENTS_MAX_SECONDS），之后浏览器自动重连
+}
+
+# 翻译任务worker配置（独立进程，与web workers共享数据库中的任务表）
+worker_config = {
+    'command': 'flask --app app run-translation-worker',
+    'concurrency': 2  # 对应环境变量 TRANSLATION_WORKERS
 }
 
 # 数据库配置
@@ -34,4 +40,5 @@ logging_config = {
 if __name__ == "__main__":
     print("Procfile配置加载完成")
     print(f"Web配置: {web_config}")
+    print(f"Worker配置: {worker_config}")
     print(f"数据库配置: {db_config}")
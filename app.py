@@ -1,20 +1,37 @@
 import os
 import json
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, make_response, jsonify
+import time
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, send_file, abort, make_response, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, TextAreaField
 from wtforms.validators import DataRequired, Length
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from functools import wraps
 from datetime import datetime
-import uuid
-from models import db, User, Novel, Chapter, Comment, UserNovel
-from novel_importer import NovelImporter, DatabaseImporter
+import click
+from models import db, User, Novel, Chapter, Comment, UserNovel, GlossaryTerm, upgrade_schema, missing_columns, backfill_chapter_numbers, backfill_word_counts, backfill_chapter_stats, backfill_chapter_fingerprints, sample_chapter_texts, compress_chapters
+from novel_importer import NovelImporter, ReferenceNovelImporter, DatabaseImporter, Language, NovelInfo, ChapterInfo
+from search_index import novel_search
+from page_cache import page_cache, conditional_get
+from staging_store import staging_store
+from upload_stream import UploadRequest
+from content_codec import chapter_codec
+from cover_images import cover_images
+from static_assets import static_assets
+from response_compression import compress
+from sitemap import sitemaps
+from concurrent.futures import ThreadPoolExecutor
+from bulk_insert import bulk_insert_chapters
+from fingerprint import import_chapters, ChapterIndex, chapter_fingerprint
+from translation_executor import TranslationExecutor
+from glossary import glossary_key, save_candidates, load_glossary, list_terms
+from translation_jobs import (enqueue_job, get_job_status, get_job_snapshot, get_job_result_meta, list_job_chapters,
+                              run_worker, QueueFullError, LocalTranslator)
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 # 设置固定的SECRET_KEY，避免重启后session失效
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-fixed-secret-key-for-development-12345')
 
@@ -28,7 +45,30 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///' +
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.path.join('static', 'img')  # 图片保存目录
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}  # 允许的文件扩展名
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.getenv('MAX_UPLOAD_MB', '256')) * 1024 * 1024)  # 上传大小上限，超出返回413
+app.config['UPLOAD_TMP_DIR'] = os.path.join(app.instance_path, 'uploads')  # 上传文件直接写入这里（不在static下）
+app.config['ANALYZE_SYNC_MAX_BYTES'] = int(float(os.getenv('ANALYZE_SYNC_MAX_MB', '8')) * 1024 * 1024)  # 超过该大小的小说在后台解析
+app.config['ANALYZE_WORKERS'] = int(os.getenv('ANALYZE_WORKERS', '2'))
+app.config['SEARCH_INDEX_CHAPTERS'] = os.getenv('SEARCH_INDEX_CHAPTERS', '0') == '1'  # 是否索引章节正文
+app.config['CHAPTER_COMPRESSION'] = os.getenv('CHAPTER_COMPRESSION', '0') == '1'  # 新写入的章节正文是否压缩存储
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))  # 小于该字节数的响应不压缩
+app.config['COMPRESS_BODY_CACHE_MAX_BYTES'] = int(os.getenv('COMPRESS_BODY_CACHE_MB', '16')) * 1024 * 1024  # 按ETag缓存的压缩结果容量
+app.config['TRANSLATION_BACKEND'] = os.getenv('TRANSLATION_BACKEND', 'qwen')  # 'qwen' 或离线测试用的 'local'
+app.config['TRANSLATION_WORKERS'] = int(os.getenv('TRANSLATION_WORKERS', '2'))  # 同时执行的翻译任务数
+app.config['TRANSLATION_MAX_PENDING_JOBS'] = int(os.getenv('TRANSLATION_MAX_PENDING_JOBS', '20'))
+app.config['TRANSLATION_MAX_IN_FLIGHT'] = int(os.getenv('TRANSLATION_MAX_IN_FLIGHT', '4'))  # 每个worker进程同时进行的翻译请求数
+app.config['TRANSLATION_RATE_LIMIT'] = float(os.getenv('TRANSLATION_RATE_LIMIT', '2'))  # 每秒请求数（令牌桶）
+app.config['TRANSLATION_RATE_BURST'] = int(os.getenv('TRANSLATION_RATE_BURST', '4'))
+app.config['TRANSLATION_COST_PER_1K_TOKENS'] = float(os.getenv('TRANSLATION_COST_PER_1K_TOKENS', '0.02'))  # 用于费用估算（输入+输出）
 db.init_app(app)
+novel_search.init_app(app)
+page_cache.init_app(app)
+staging_store.init_app(app)
+chapter_codec.init_app(app)
+cover_images.init_app(app)
+static_assets.init_app(app)
+compress.init_app(app)
+sitemaps.init_app(app)
 
 # 初始化 Flask-Login
 login_manager = LoginManager()
@@ -40,44 +80,26 @@ login_manager.login_message = '请先登录访问此页面'
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-#定义根目录
-ROOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
-
 # 检查文件扩展名
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 # 处理封面图片上传
 def handle_cover_upload(cover_file):
-    """处理封面图片上传，返回文件名或None"""
+    """处理封面图片上传，返回文件名或None（按内容哈希保存，重复上传的图片共用同一个文件）"""
     if cover_file and cover_file.filename != '' and allowed_file(cover_file.filename):
-        # 生成唯一的文件名
-        filename = secure_filename(cover_file.filename)
-        name, ext = os.path.splitext(filename)
-        unique_filename = f"{uuid.uuid4().hex[:8]}_{name}{ext}"
-        
-        # 确保上传目录存在
-        upload_dir = os.path.join(ROOT_DIRECTORY, app.config['UPLOAD_FOLDER'])
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # 保存文件
-        file_path = os.path.join(upload_dir, unique_filename)
-        cover_file.save(file_path)
-        
-        return unique_filename
+        filename = cover_images.store(cover_file)
+        cover_images.schedule(filename)  # 后台生成各规格的缩略图
+        return filename
     return None
 
-# 删除旧的封面文件
-def delete_old_cover(cover_filename):
-    """删除旧的封面文件"""
-    if cover_filename and cover_filename not in ['cover.jpg', 'cover_fantasy.jpg', 'cover_romance.jpg']:
-        # 不删除默认封面文件
-        old_file_path = os.path.join(ROOT_DIRECTORY, app.config['UPLOAD_FOLDER'], cover_filename)
-        try:
-            if os.path.exists(old_file_path):
-                os.remove(old_file_path)
-        except Exception as e:
-            print(f"无法删除旧封面文件: {e}")
+# 释放不再使用的封面文件
+def release_cover(cover_filename):
+    """小说不再使用该封面时调用（须在提交之后）：没有其他小说引用时删除文件"""
+    try:
+        cover_images.release(cover_filename)
+    except Exception as e:
+        print(f"无法删除旧封面文件: {e}")
 
 # 模板过滤器
 @app.template_filter('safe_strftime')
@@ -197,8 +219,31 @@ def logout():
     flash('已成功退出登录')
     return redirect(url_for('index'))
 
+# 条件请求校验值（只查询时间戳列和页面缓存的标签版本号，不加载页面数据）
+def novel_validators(novel_id, page):
+    updated_at = db.session.query(Novel.updated_at).filter(Novel.id == novel_id).scalar()
+    if updated_at is None:
+        return None
+    # 相关小说和封面缩略图的变化不会更新这本小说的时间戳，但会使页面缓存的标签失效；
+    # 这些变化没有可用的修改时间，因此不返回Last-Modified
+    tags = page_cache.tag_version(['novels', f'novel:{novel_id}'])
+    return f'novel-{novel_id}-{page}-{updated_at.timestamp()}-{tags}', None
+
+def chapter_validators(novel_id, chapter_id):
+    row = db.session.query(Chapter.updated_at, Novel.updated_at).join(
+        Novel, Novel.id == Chapter.novel_id
+    ).filter(Chapter.id == chapter_id, Chapter.novel_id == novel_id).first()
+    if row is None or row[1] is None:
+        return None
+    # 章节页同时依赖章节本身和小说目录（上一章/下一章）
+    last_modified = max(value for value in row if value is not None)
+    stamps = '-'.join(str(value.timestamp()) if value else '0' for value in row)
+    tags = page_cache.tag_version([f'novel:{novel_id}', f'chapter:{chapter_id}'])
+    return f'chapter-{chapter_id}-{stamps}-{tags}', last_modified
+
 # 路由
 @app.route('/')
+@page_cache.cached(tags=lambda: ['novels'])
 def index():
     # 获取推荐小说（最新添加的4本小说）
     recommended_novels = Novel.query.order_by(Novel.id.desc()).limit(4).all()
@@ -220,35 +265,33 @@ def keep_alive():
 
 @app.route('/novel/<int:novel_id>')
 @app.route('/novel/<int:novel_id>/page/<int:page>')
+@conditional_get(lambda novel_id, page=1: novel_validators(novel_id, page))
+@page_cache.cached(tags=lambda novel_id, page=1: ['novels', f'novel:{novel_id}'])
 def novel(novel_id, page=1):
     novel = Novel.query.get_or_404(novel_id)
     related_novels = Novel.query.filter_by(category=novel.category).filter(Novel.id != novel_id).limit(3).all()
     
     # 分页设置：每页20章
     per_page = 20
-    chapters = Chapter.query.filter_by(novel_id=novel_id).order_by(Chapter.id).paginate(
-        page=page, per_page=per_page, error_out=False
+    chapters = Chapter.list_query(novel_id).paginate(
+        page=page, per_page=per_page, error_out=False, count=False
     )
+    # 总章节数直接使用冗余字段，避免额外的count查询
+    chapters.total = novel.chapter_count
     
     return render_template('novel.html', novel=novel, related_novels=related_novels, chapters=chapters)
 
 @app.route('/novel/<int:novel_id>/chapter/<int:chapter_id>')
+@conditional_get(lambda novel_id, chapter_id: chapter_validators(novel_id, chapter_id))
+@page_cache.cached(tags=lambda novel_id, chapter_id: [f'novel:{novel_id}', f'chapter:{chapter_id}'])
 def chapter(novel_id, chapter_id):
-    chapter = Chapter.query.get_or_404(chapter_id)
+    chapter = Chapter.query.options(db.undefer_group('content')).get_or_404(chapter_id)
     if chapter.novel_id != novel_id:
         flash('Chapter does not belong to this novel')  # '章节不属于该小说'
         return redirect(url_for('novel', novel_id=novel_id))
 
-    # 获取当前小说的所有章节，按 id 排序
-    chapters = Chapter.query.filter_by(novel_id=novel_id).order_by(Chapter.id).all()
-    chapter_ids = [c.id for c in chapters]
-
-    # 找到当前章节的索引
-    current_index = chapter_ids.index(chapter_id)
-
-    # 计算上一章和下一章的 ID
-    prev_chapter_id = chapter_ids[current_index - 1] if current_index > 0 else None
-    next_chapter_id = chapter_ids[current_index + 1] if current_index < len(chapter_ids) - 1 else None
+    # 按章节序号查找上一章和下一章（两次索引查询，与小说长度无关）
+    prev_chapter_id, next_chapter_id = chapter.neighbour_ids()
 
     form = CommentForm()
     return render_template('chapter.html', chapter=chapter, form=form,
@@ -276,10 +319,14 @@ def add_comment(chapter_id):
     if form.validate_on_submit():
         comment = Comment(content=form.content.data, user_id=current_user.id, chapter_id=chapter_id)
         db.session.add(comment)
+        # 评论会显示在章节页面上，更新时间戳使条件请求失效
+        Chapter.query.filter_by(id=chapter_id).update({'updated_at': datetime.utcnow()})
         db.session.commit()
+        page_cache.invalidate(f'chapter:{chapter_id}')
     return redirect(url_for('chapter', novel_id=Chapter.query.get(chapter_id).novel_id, chapter_id=chapter_id))
 
 @app.route('/category/<string:category>')
+@page_cache.cached(tags=lambda category: ['novels'])
 def category(category):
     if category == 'Recommended':
         # 对于推荐小说，显示最新添加的12本小说
@@ -300,18 +347,22 @@ def add_to_shelf(novel_id):
     return redirect(url_for('novel', novel_id=novel_id))
 
 @app.route('/privacy-policy')
+@page_cache.cached(tags=lambda: ['pages'])
 def privacy_policy():
     return render_template('privacy_policy.html')
 
 @app.route('/terms-of-service')
+@page_cache.cached(tags=lambda: ['pages'])
 def terms_of_service():
     return render_template('terms_of_service.html')
 
 @app.route('/contact')
+@page_cache.cached(tags=lambda: ['pages'])
 def contact():
     return render_template('contact.html')
 
 @app.route('/about')
+@page_cache.cached(tags=lambda: ['pages'])
 def about():
     return render_template('about.html')
 
@@ -327,21 +378,8 @@ def search():
         novels = []
         total = 0
     else:
-        # 使用SQLAlchemy的模糊匹配功能
-        # 搜索标题、作者、描述中包含关键词的小说
-        search_filter = db.or_(
-            Novel.title.contains(query),
-            Novel.author.contains(query),
-            Novel.description.contains(query),
-            Novel.category.contains(query)
-        )
-        
-        # 执行搜索并分页
-        novels_pagination = Novel.query.filter(search_filter).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
-        novels = novels_pagination.items
-        total = novels_pagination.total
+        # 使用全文索引按相关度检索标题、作者、分类和描述
+        novels, total = novel_search.search(query, page=page, per_page=per_page)
     
     return render_template('search_results.html', 
                          novels=novels, 
@@ -350,64 +388,21 @@ def search():
                          total=total,
                          per_page=per_page)
 
-# @app.route('/sitemap.xml')
-# def sitemap():
-    from flask import make_response
-    
-    # xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    # xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-    #
-    # # 添加主页
-    # xml += '<url><loc>https://taletap.org/</loc><lastmod>2025-01-01</lastmod><changefreq>daily</changefreq><priority>1.0</priority></url>\n'
-    #
-    # # 添加重要页面
-    # important_pages = [
-    #     ('about', 'monthly', '0.8'),
-    #     ('contact', 'monthly', '0.6'),
-    #     ('privacy-policy', 'monthly', '0.5'),
-    #     ('terms-of-service', 'monthly', '0.5'),
-    # ]
-    #
-    # for page, freq, priority in important_pages:
-    #     xml += f'<url><loc>https://taletap.org/{page}</loc><lastmod>2025-01-01</lastmod><changefreq>{freq}</changefreq><priority>{priority}</priority></url>\n'
-    #
-    # # 添加分类页面
-    # categories = ['Fantasy', 'Romance', 'Sci-Fi', 'Mystery', 'Thriller', 'Recommended']
-    # for category in categories:
-    #     xml += f'<url><loc>https://taletap.org/category/{category}</loc><lastmod>2025-01-01</lastmod><changefreq>weekly</changefreq><priority>0.8</priority></url>\n'
-    #
-    # # 添加小说页面
-    # novels = Novel.query.all()
-    # for novel in novels:
-    #     xml += f'<url><loc>https://taletap.org/novel/{novel.id}</loc><lastmod>2025-01-01</lastmod><changefreq>weekly</changefreq><priority>0.7</priority></url>\n'
-    #
-    #     # 添加章节页面（只添加前几章，避免sitemap过大）
-    #     chapters = Chapter.query.filter_by(novel_id=novel.id).limit(5).all()
-    #     for chapter in chapters:
-    #         xml += f'<url><loc>https://taletap.org/novel/{novel.id}/chapter/{chapter.id}</loc><lastmod>2025-01-01</lastmod><changefreq>monthly</changefreq><priority>0.6</priority></url>\n'
-    #
-    # xml += '</urlset>'
-    
-    # response = make_response()
-    # response.headers['Content-Type'] = 'application/xml'
-    # return response
-
-
 @app.route('/sitemap.xml')
 def sitemap():
-    # xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    # xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-    # xml += f'<url><loc>https://taletap.org/</loc></url>\n'
-    # for novel in Novel.query.all():
-    #     xml += f'<url><loc>https://taletap.org/novel/{novel.id}</loc></url>\n'
-    #     for chapter in novel.chapters:
-    #         xml += f'<url><loc>https://taletap.org/novel/{novel.id}/chapter/{chapter.id}</loc></url>\n'
-    # xml += '</urlset>'
-    # response = make_response(xml)
-    # response.headers['Content-Type'] = 'application/xml'
-    # return response
-    #返回根目录sitemap.xml文件
-    return send_from_directory(ROOT_DIRECTORY, 'sitemap.xml')
+    """站点地图索引，按数据实时生成（分片见sitemap.py）"""
+    response = make_response(sitemaps.index())
+    response.mimetype = 'application/xml'
+    return response
+
+@app.route('/sitemaps/<name>.xml')
+def sitemap_shard(name):
+    if not sitemaps.is_shard(name):
+        abort(404)
+    path = sitemaps.shard_path(name)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='application/xml', conditional=True)
 
 @app.route('/robots.txt')
 def robots():
@@ -418,7 +413,8 @@ def robots():
 @admin_required
 def admin_dashboard():
     novels = Novel.query.all()
-    return render_template('admin/dashboard.html', novels=novels)
+    chapters_by_novel = Chapter.summaries_by_novel([novel.id for novel in novels])
+    return render_template('admin/dashboard.html', novels=novels, chapters_by_novel=chapters_by_novel)
 
 @app.route('/admin/novel/new', methods=['GET', 'POST'], endpoint='add_novel')
 @admin_required
@@ -440,7 +436,9 @@ def add_novel():
             category=form.category.data
         )
         db.session.add(novel)
+        novel_search.index_novel(novel)
         db.session.commit()
+        page_cache.invalidate_novel(novel.id)
         flash('小说添加成功！')
         return redirect(url_for('admin_dashboard'))
     
@@ -461,10 +459,10 @@ def edit_novel(novel_id):
         # 处理封面上传
         cover_file = request.files.get('cover')
         new_cover_filename = handle_cover_upload(cover_file)
+        old_cover_filename = novel.cover_image
         
-        # 如果有新封面，删除旧封面（除非是默认封面）
+        # 如果有新封面，提交后释放旧封面（其他小说仍在使用时保留）
         if new_cover_filename:
-            delete_old_cover(novel.cover_image)
             novel.cover_image = new_cover_filename
         
         # 更新其他字段
@@ -472,8 +470,12 @@ def edit_novel(novel_id):
         novel.description = form.description.data
         novel.category = form.category.data
         novel.updated_at = datetime.utcnow()
+        novel_search.index_novel(novel)
         
         db.session.commit()
+        if new_cover_filename and new_cover_filename != old_cover_filename:
+            release_cover(old_cover_filename)
+        page_cache.invalidate_novel(novel.id)
         flash('小说更新成功！')
         return redirect(url_for('admin_dashboard'))
     
@@ -491,13 +493,9 @@ def delete_novel(novel_id):
     novel = Novel.query.get_or_404(novel_id)
     
     try:
-        # 删除关联的封面文件
-        if novel.cover_image:
-            delete_old_cover(novel.cover_image)
-        
         # 先删除所有相关的评论
-        for chapter in novel.chapters:
-            Comment.query.filter_by(chapter_id=chapter.id).delete()
+        chapter_ids = db.session.query(Chapter.id).filter(Chapter.novel_id == novel_id)
+        Comment.query.filter(Comment.chapter_id.in_(chapter_ids.scalar_subquery())).delete(synchronize_session=False)
         
         # 删除所有相关的章节
         Chapter.query.filter_by(novel_id=novel_id).delete()
@@ -506,8 +504,13 @@ def delete_novel(novel_id):
         UserNovel.query.filter_by(novel_id=novel_id).delete()
         
         # 最后删除小说记录
+        novel_search.remove_novel(novel_id)
+        cover_filename = novel.cover_image
         db.session.delete(novel)
         db.session.commit()
+        # 提交后释放封面文件（其他小说仍在使用时保留）
+        release_cover(cover_filename)
+        page_cache.invalidate_novel(novel_id)
         flash('小说删除成功！')
         
     except Exception as e:
@@ -525,11 +528,15 @@ def add_chapter(novel_id):
     if form.validate_on_submit():
         chapter = Chapter(
             novel_id=novel_id,
+            chapter_number=novel.next_chapter_number(),
             title=form.title.data,
             content=form.content.data
         )
         db.session.add(chapter)
+        novel.refresh_chapter_stats()
+        novel_search.index_chapter(chapter)
         db.session.commit()
+        page_cache.invalidate_novel(novel_id)
         flash('章节添加成功！')
         return redirect(url_for('admin_dashboard'))
     return render_template('admin/chapter_form.html', form=form, novel=novel, title='添加章节')
@@ -537,12 +544,15 @@ def add_chapter(novel_id):
 @app.route('/admin/novel/<int:novel_id>/chapter/<int:chapter_id>/edit', methods=['GET', 'POST'], endpoint='edit_chapter')
 @admin_required
 def edit_chapter(novel_id, chapter_id):
-    chapter = Chapter.query.get_or_404(chapter_id)
+    chapter = Chapter.query.options(db.undefer_group('content')).get_or_404(chapter_id)
     form = ChapterForm(obj=chapter)
     if form.validate_on_submit():
         chapter.title = form.title.data
         chapter.content = form.content.data
+        chapter.novel.refresh_chapter_stats()
+        novel_search.index_chapter(chapter)
         db.session.commit()
+        page_cache.invalidate_novel(chapter.novel_id)
         flash('章节更新成功！')
         return redirect(url_for('admin_dashboard'))
     return render_template('admin/chapter_form.html', form=form, novel=chapter.novel, title='编辑章节')
@@ -557,8 +567,12 @@ def delete_chapter(novel_id, chapter_id):
         Comment.query.filter_by(chapter_id=chapter_id).delete()
         
         # 删除章节
+        novel = chapter.novel
+        novel_search.remove_chapter(chapter_id)
         db.session.delete(chapter)
+        novel.refresh_chapter_stats()
         db.session.commit()
+        page_cache.invalidate_novel(novel.id)
         flash('章节删除成功！')
         
     except Exception as e:
@@ -589,67 +603,66 @@ def analyze_novel():
         if not file.filename.lower().endswith('.txt'):
             return jsonify({'success': False, 'error': '只支持TXT格式文件'})
         
-        # 保存临时文件
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{uuid.uuid4().hex[:8]}_{filename}")
+        # 接收请求时上传内容已直接写入临时文件并计算了哈希（见upload_stream.py），无需再保存一次
+        upload = file.stream
+        upload_info = {'filename': file.filename, 'sha256': upload.sha256, 'size': upload.size}
         
-        # 确保上传目录存在
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(temp_path)
-        
-        try:
-            # 使用导入器分析文件
-            importer = NovelImporter()
-            novel_info, issues = importer.process_novel_file(temp_path)
-            
-            # 生成预览数据
-            preview_data = importer.generate_preview_data(novel_info)
-            preview_data['issues'] = issues
-            
-            # 生成唯一ID用于标识这次解析
-            analysis_id = uuid.uuid4().hex
-            
-            # 保存完整的解析数据到临时文件（用于后续导入）
-            analysis_data = {
-                'novel_info': {
-                    'title': novel_info.title,
-                    'author': novel_info.author,
-                    'description': novel_info.description,
-                    'language': novel_info.language.value,
-                    'category': novel_info.category,
-                    'chapters': [
-                        {
-                            'title': ch.title,
-                            'content': ch.content,
-                            'chapter_number': ch.chapter_number
-                        }
-                        for ch in novel_info.chapters
-                    ]
-                },
-                'timestamp': datetime.utcnow().isoformat()
-            }
-            
-            # 保存到临时JSON文件
-            temp_json_path = os.path.join(app.config['UPLOAD_FOLDER'], f"analysis_{analysis_id}.json")
-            with open(temp_json_path, 'w', encoding='utf-8') as f:
-                json.dump(analysis_data, f, ensure_ascii=False, indent=2)
-            
-            # 在预览数据中包含analysis_id
-            preview_data['analysis_id'] = analysis_id
-            
+        writer = staging_store.create()
+        if upload.size > app.config['ANALYZE_SYNC_MAX_BYTES']:
+            # 大文件交给后台线程解析并立即返回，前端通过analysis-status查询结果
+            analyze_executor.submit(analyze_upload_in_background, upload.detach(), writer, upload_info)
             return jsonify({
                 'success': True,
-                'data': preview_data
+                'pending': True,
+                'analysis_id': writer.key,
+                'status_url': url_for('analysis_status', analysis_id=writer.key)
             })
-            
-        finally:
-            # 清理原始临时文件
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        
+        # 流式解析文件，章节逐个压缩写入暂存区（用于后续导入），内存占用与文件大小无关
+        with writer:
+            preview_data = NovelImporter().analyze_to_staging(upload.name, writer, extra={'upload': upload_info})
+        
+        # 在预览数据中包含analysis_id（暂存条目ID）
+        preview_data['analysis_id'] = writer.key
+        preview_data['upload'] = upload_info
+        
+        return jsonify({
+            'success': True,
+            'data': preview_data
+        })
                 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+# 大文件的解析在后台线程中进行，避免长时间占用web worker（gunicorn超时30秒）
+analyze_executor = ThreadPoolExecutor(max_workers=app.config['ANALYZE_WORKERS'], thread_name_prefix='analyze')
+
+def analyze_upload_in_background(path, writer, upload_info):
+    """后台解析上传的小说，结果写入暂存区；临时文件由这里负责删除"""
+    try:
+        NovelImporter().analyze_to_staging(path, writer, extra={'upload': upload_info})
+    except Exception as e:
+        print(f"后台解析失败: {e}")
+        writer.fail(str(e))
+    finally:
+        os.remove(path)
+
+@app.route('/admin/analysis-status/<analysis_id>', methods=['GET'], endpoint='analysis_status')
+@admin_required
+def analysis_status(analysis_id):
+    """查询后台解析状态，完成后返回与analyze-novel相同的预览数据"""
+    status = staging_store.get_status(analysis_id)
+    if status is None:
+        return jsonify({'success': False, 'error': '解析数据已过期，请重新上传文件'})
+    if status['status'] == 'error':
+        return jsonify({'success': False, 'error': status['error']})
+    if status['status'] == 'pending':
+        return jsonify({'success': True, 'pending': True, 'analysis_id': analysis_id})
+    
+    header = status['header']
+    preview_data = dict(header.get('preview', {}), analysis_id=analysis_id, upload=header.get('upload'))
+    return jsonify({'success': True, 'data': preview_data})
+
 @app.route('/admin/import-novel', methods=['POST'], endpoint='import_novel')
 @admin_required
 def import_novel():
@@ -664,6 +677,7 @@ def import_novel():
             description = request.form.get('description')
             category = request.form.get('category')
             cover_file = request.files.get('cover_file')
+            force_new = request.form.get('force_new') == 'true'
         else:
             # JSON格式请求
             data = request.get_json()
@@ -676,6 +690,7 @@ def import_novel():
             description = data.get('description')
             category = data.get('category')
             cover_file = None
+            force_new = bool(data.get('force_new'))
         
         if not analysis_id:
             return jsonify({'success': False, 'error': '缺少分析ID'})
@@ -687,17 +702,16 @@ def import_novel():
             if uploaded_cover:
                 cover_filename = uploaded_cover
         
-        # 读取之前保存的解析数据
-        temp_json_path = os.path.join(app.config['UPLOAD_FOLDER'], f"analysis_{analysis_id}.json")
-        
-        if not os.path.exists(temp_json_path):
+        # 读取之前暂存的解析数据
+        analysis_data = staging_store.get_header(analysis_id)
+        if analysis_data is None:
             return jsonify({'success': False, 'error': '解析数据已过期，请重新解析文件'})
         
         try:
-            with open(temp_json_path, 'r', encoding='utf-8') as f:
-                analysis_data = json.load(f)
-            
             novel_info = analysis_data['novel_info']
+            chapters_source = staging_store.iter_chapters(analysis_id)
+            # 术语表按解析出的原始书名和作者保存（预览翻译时生成）
+            glossary = load_glossary(glossary_key(novel_info['title'], novel_info['author']))
             
             # 使用用户修改后的数据覆盖原始数据
             novel_info['title'] = title or novel_info['title']
@@ -715,9 +729,9 @@ def import_novel():
                 try:
                     from novel_importer import NovelImporter, NovelInfo, ChapterInfo, Language
                     
-                    # 重构数据为NovelInfo对象
+                    # 重构数据为NovelInfo对象（翻译需要完整的章节列表）
                     chapters = []
-                    for ch_data in novel_info['chapters']:
+                    for ch_data in chapters_source:
                         chapters.append(ChapterInfo(
                             title=ch_data['title'],
                             content=ch_data['content'],
@@ -737,16 +751,16 @@ def import_novel():
                     importer = NovelImporter()
                     if custom_prompt:
                         print(f"使用自定义提示词: {custom_prompt[:50]}...")
-                        translated_novel = importer.translate_novel_simple(novel_obj, custom_prompt=custom_prompt, prompt_type=prompt_type)
+                        translated_novel = importer.translate_novel_simple(novel_obj, custom_prompt=custom_prompt, prompt_type=prompt_type, glossary=glossary)
                     else:
-                        translated_novel = importer.translate_novel_simple(novel_obj, prompt_type=prompt_type)
+                        translated_novel = importer.translate_novel_simple(novel_obj, prompt_type=prompt_type, glossary=glossary)
                     
                     # 更新数据
                     novel_info['title'] = translated_novel.title
                     novel_info['description'] = translated_novel.description
                     novel_info['language'] = translated_novel.language.value
                     novel_info['category'] = translated_novel.category
-                    novel_info['chapters'] = [
+                    chapters_source = [
                         {
                             'title': ch.title,
                             'content': ch.content,
@@ -758,52 +772,41 @@ def import_novel():
                 except Exception as e:
                     print(f"翻译过程出错: {e}")
                     flash('翻译过程中出现错误，将保存原文版本')
+                    chapters_source = staging_store.iter_chapters(analysis_id)
             
-            # 创建小说记录
-            novel = Novel(
-                title=novel_info['title'],
-                author=novel_info['author'],
-                description=novel_info['description'],
-                category=novel_info['category'],
-                cover_image=cover_filename
+            # 已导入过的小说只追加新章节，否则创建小说记录（逐个读取章节，避免一次性载入整本小说）
+            outcome = import_chapters(
+                lambda: Novel(
+                    title=novel_info['title'],
+                    author=novel_info['author'],
+                    description=novel_info['description'],
+                    category=novel_info['category'],
+                    cover_image=cover_filename
+                ),
+                novel_info['title'], novel_info['author'],
+                ((ch['title'], ch['content']) for ch in chapters_source),
+                force_new=force_new
             )
+            novel = outcome.novel
             
-            db.session.add(novel)
-            db.session.flush()
-            
-            # 批量创建章节记录
-            chapters_to_add = []
-            for chapter_data in novel_info['chapters']:
-                chapter = Chapter(
-                    novel_id=novel.id,
-                    title=chapter_data['title'],
-                    content=chapter_data['content']
-                )
-                chapters_to_add.append(chapter)
-                
-                # 分批提交，避免内存问题
-                if len(chapters_to_add) >= 50:
-                    db.session.add_all(chapters_to_add)
-                    db.session.flush()
-                    chapters_to_add = []
-            
-            # 提交剩余的章节
-            if chapters_to_add:
-                db.session.add_all(chapters_to_add)
-            
+            novel.refresh_chapter_stats()
+            novel_search.reindex_novel(novel)
             db.session.commit()
+            page_cache.invalidate_novel(novel.id)
             
             return jsonify({
                 'success': True,
                 'novel_id': novel.id,
-                'message': '小说导入成功',
-                'chapters_imported': len(novel_info['chapters'])
+                'message': '小说导入成功' if outcome.created
+                           else f'小说《{novel.title}》已存在，追加了 {outcome.inserted} 个新章节',
+                'duplicate': not outcome.created,
+                'chapters_imported': outcome.inserted,
+                'chapters_skipped': outcome.skipped
             })
             
         finally:
-            # 清理临时分析文件
-            if os.path.exists(temp_json_path):
-                os.remove(temp_json_path)
+            # 清理暂存的解析数据
+            staging_store.delete(analysis_id)
                 
     except Exception as e:
         db.session.rollback()
@@ -845,14 +848,10 @@ def save_parsed_novel():
         if not category:
             return jsonify({'success': False, 'error': '请选择小说类型'})
         
-        # 从缓存获取解析数据
-        cache = app.config.get('NOVEL_PARSE_CACHE', {})
-        if session_key not in cache:
+        # 从暂存区获取解析数据
+        if staging_store.get_header(session_key) is None:
             return jsonify({'success': False, 'error': '解析数据不存在，请重新解析'})
         
-        cached_data = cache[session_key]
-        novel_info = cached_data['novel_info']
-        
         # 处理封面上传
         cover_filename = 'cover_default.jpg'
         if cover_file and cover_file.filename != '':
@@ -860,48 +859,37 @@ def save_parsed_novel():
             if not cover_filename:
                 return jsonify({'success': False, 'error': '封面上传失败'})
         
-        # 创建小说记录
-        novel = Novel(
-            title=title,
-            author=author,
-            description=description if description else '',
-            category=category,
-            cover_image=cover_filename
+        # 已导入过的小说只追加新章节，否则创建小说记录
+        outcome = import_chapters(
+            lambda: Novel(
+                title=title,
+                author=author,
+                description=description if description else '',
+                category=category,
+                cover_image=cover_filename
+            ),
+            title, author,
+            ((ch['title'], ch['content']) for ch in staging_store.iter_chapters(session_key)),
+            force_new=request.form.get('force_new') == 'true'
         )
+        novel = outcome.novel
         
-        db.session.add(novel)
-        db.session.flush()  # 获取novel.id
-        
-        # 批量创建章节记录
-        chapters_to_add = []
-        for i, chapter in enumerate(novel_info.chapters):
-            db_chapter = Chapter(
-                novel_id=novel.id,
-                title=chapter.title,
-                content=chapter.content,
-                chapter_number=chapter.chapter_number
-            )
-            chapters_to_add.append(db_chapter)
-            
-            # 分批提交，避免内存问题
-            if len(chapters_to_add) >= 50:
-                db.session.add_all(chapters_to_add)
-                db.session.flush()
-                chapters_to_add = []
-        
-        # 提交剩余章节
-        if chapters_to_add:
-            db.session.add_all(chapters_to_add)
-        
+        novel.refresh_chapter_stats()
+        novel_search.reindex_novel(novel)
         db.session.commit()
+        page_cache.invalidate_novel(novel.id)
         
-        # 清理缓存
-        cache.pop(session_key, None)
+        # 清理暂存数据
+        staging_store.delete(session_key)
         
         return jsonify({
             'success': True, 
-            'message': f'小说《{title}》已成功保存到数据库',
-            'novel_id': novel.id
+            'message': f'小说《{title}》已成功保存到数据库' if outcome.created
+                       else f'小说《{novel.title}》已存在，追加了 {outcome.inserted} 个新章节',
+            'novel_id': novel.id,
+            'duplicate': not outcome.created,
+            'chapters_imported': outcome.inserted,
+            'chapters_skipped': outcome.skipped
         })
         
     except Exception as e:
@@ -929,11 +917,8 @@ def parse_novel():
         if not api_key:
             return jsonify({'success': False, 'error': '请提供API Key'})
         
-        # 保存临时文件
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='wb', suffix='.txt', delete=False) as temp_file:
-            file.save(temp_file.name)
-            temp_file_path = temp_file.name
+        # 上传内容在接收请求时已写入临时文件（见upload_stream.py），直接解析该文件
+        temp_file_path = file.stream.name
         
         # 处理封面文件
         cover_file = request.files.get('cover_file')
@@ -978,16 +963,22 @@ def parse_novel():
                     ]
                 }
                 
-                # 保存解析数据到session（简单方案）
-                import json
-                session_key = f"novel_data_{datetime.now().timestamp()}"
-                app.config.setdefault('NOVEL_PARSE_CACHE', {})
-                app.config['NOVEL_PARSE_CACHE'][session_key] = {
-                    'novel_info': novel_info,
+                # 解析数据写入暂存区，session_key即暂存条目ID
+                session_key = staging_store.put({
+                    'novel_info': {
+                        'title': novel_info.title,
+                        'author': novel_info.author,
+                        'description': novel_info.description,
+                        'language': novel_info.language.value,
+                        'category': novel_info.category,
+                    },
                     'api_key': api_key,
                     'cover_filename': cover_filename,
                     'category': category
-                }
+                }, (
+                    {'title': ch.title, 'content': ch.content, 'chapter_number': ch.chapter_number}
+                    for ch in novel_info.chapters
+                ))
                 
                 return jsonify({
                     'success': True,
@@ -1008,6 +999,12 @@ def parse_novel():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.errorhandler(413)
+def handle_upload_too_large(e):
+    """上传文件超过MAX_CONTENT_LENGTH"""
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'success': False, 'error': f'上传文件过大，最大允许 {limit_mb} MB'}), 413
+
 @app.errorhandler(500)
 def handle_internal_error(e):
     """处理500内部服务器错误"""
@@ -1042,150 +1039,33 @@ def translate_novel():
         if not session_key:
             return jsonify({'success': False, 'error': '会话已过期，请重新解析'})
         
-        # 从缓存获取数据
-        cache = app.config.get('NOVEL_PARSE_CACHE', {})
-        if session_key not in cache:
+        # 从暂存区获取数据
+        cached_data = staging_store.get_header(session_key)
+        if cached_data is None:
             return jsonify({'success': False, 'error': '解析数据不存在，请重新解析'})
         
-        cached_data = cache[session_key]
-        novel_info = cached_data['novel_info']
+        novel_info = dict(cached_data['novel_info'], chapters=list(staging_store.iter_chapters(session_key)))
         
         # 处理封面文件上传
         cover_filename = None
         if cover_file and cover_file.filename != '':
             cover_filename = handle_cover_upload(cover_file)
         
-        # 更新缓存中的封面和类型信息
-        cached_data['cover_filename'] = cover_filename
-        cached_data['category'] = category
-        
         print(f"翻译启动 - 封面文件名: {cover_filename}")
         print(f"翻译启动 - 小说类型: {category}")
         
-        # 创建翻译任务ID
-        import uuid
-        task_id = str(uuid.uuid4())
-        
-        # 启动后台翻译任务（简化版本，实际应用建议使用Celery等任务队列）
-        import threading
-        
-        def translation_worker():
-            try:
-                from novel_translator_qwen import QwenNovelTranslator
-                translator = QwenNovelTranslator(api_key=api_key)
-                
-                # 从缓存获取最新的封面和类型信息
-                current_cover_filename = cached_data.get('cover_filename')
-                current_category = cached_data.get('category')
-                
-                print(f"翻译线程 - 封面文件名: {current_cover_filename}")
-                print(f"翻译线程 - 小说类型: {current_category}")
-                
-                # 创建进度跟踪
-                progress_cache = app.config.setdefault('TRANSLATION_PROGRESS', {})
-                progress_cache[task_id] = {
-                    'status': 'translating',
-                    'progress': {
-                        'current_chapter': 0,
-                        'total_chapters': len(novel_info.chapters),
-                        'current_chapter_title': '',
-                        'success_count': 0,
-                        'error_count': 0,
-                        'estimated_cost': 0.0,
-                        'elapsed_time': 0.0,
-                        'progress_percent': 0.0,
-                        'success_rate': 100.0
-                    },
-                    'log_messages': [],
-                    'cover_filename': current_cover_filename,
-                    'category': current_category
-                }
-                
-                # 进度回调函数
-                def progress_callback(progress):
-                    progress_data = progress_cache[task_id]
-                    progress_data['progress'] = {
-                        'current_chapter': progress.current_chapter,
-                        'total_chapters': progress.total_chapters,
-                        'current_chapter_title': progress.current_chapter_title,
-                        'success_count': progress.success_count,
-                        'error_count': progress.error_count,
-                        'estimated_cost': progress.estimated_cost,
-                        'elapsed_time': progress.elapsed_time,
-                        'progress_percent': progress.progress_percent,
-                        'success_rate': progress.success_rate
-                    }
-                    progress_data['log_message'] = f"正在翻译: {progress.current_chapter_title}"
-                    progress_data['log_level'] = 'info'
-                
-                # 更新小说信息（如果有自定义描述）
-                if description:
-                    novel_info.description = description
-                
-                # 开始翻译
-                success, translated_novel, message = translator.translate_novel(
-                    novel_info,
-                    custom_prompt=custom_prompt,
-                    progress_callback=progress_callback
-                )
-                
-                if success:
-                    # 保存翻译结果
-                    import tempfile
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as temp_file:
-                        translator.save_translated_novel(translated_novel, temp_file.name)
-                        
-                        # 读取内容
-                        with open(temp_file.name, 'r', encoding='utf-8') as f:
-                            translated_content = f.read()
-                    
-                    progress_cache[task_id]['status'] = 'completed'
-                    progress_cache[task_id]['result'] = {
-                        'title': translated_novel.title,
-                        'author': translated_novel.author,
-                        'description': translated_novel.description,
-                        'content': translated_content,
-                        'category': current_category or translated_novel.category,
-                        'cover_filename': current_cover_filename,
-                        'chapters': [
-                            {
-                                'title': chapter.title,
-                                'content': chapter.content,
-                                'chapter_number': chapter.chapter_number
-                            }
-                            for chapter in translated_novel.chapters
-                        ]
-                    }
-                    
-                    print(f"翻译完成 - 保存的封面文件名: {current_cover_filename}")
-                    print(f"翻译完成 - 保存的小说类型: {current_category or translated_novel.category}")
-                    progress_cache[task_id]['stats'] = {
-                        'success_count': progress_cache[task_id]['progress']['success_count'],
-                        'error_count': progress_cache[task_id]['progress']['error_count'],
-                        'total_cost': translator.total_cost,
-                        'elapsed_time': progress_cache[task_id]['progress']['elapsed_time'],
-                        'success_rate': progress_cache[task_id]['progress']['success_rate']
-                    }
-                else:
-                    progress_cache[task_id]['status'] = 'error'
-                    progress_cache[task_id]['error'] = message
-                    
-            except Exception as e:
-                if task_id in progress_cache:
-                    progress_cache[task_id]['status'] = 'error'
-                    progress_cache[task_id]['error'] = str(e)
-                else:
-                    # 如果进度缓存不存在，创建一个错误记录
-                    progress_cache = app.config.setdefault('TRANSLATION_PROGRESS', {})
-                    progress_cache[task_id] = {
-                        'status': 'error',
-                        'error': str(e)
-                    }
-        
-        # 启动翻译线程
-        thread = threading.Thread(target=translation_worker)
-        thread.daemon = True
-        thread.start()
+        # 创建翻译任务，由独立的worker进程执行（flask run-translation-worker）
+        try:
+            task_id = enqueue_job('novel', {
+                'novel_info': novel_info,
+                'description': description,
+                'category': category,
+                'cover_filename': cover_filename,
+                'custom_prompt': custom_prompt,
+                'api_key': api_key
+            }, max_pending=app.config['TRANSLATION_MAX_PENDING_JOBS'])
+        except QueueFullError as e:
+            return jsonify({'success': False, 'error': str(e)})
         
         return jsonify({'success': True, 'task_id': task_id})
         
@@ -1200,15 +1080,11 @@ def translate_novel():
 def translation_progress(task_id):
     """获取翻译进度"""
     try:
-        progress_cache = app.config.get('TRANSLATION_PROGRESS', {})
+        progress_data = get_job_status(task_id)
         
-        if task_id not in progress_cache:
+        if progress_data is None:
             return jsonify({'success': False, 'error': '翻译任务不存在'})
         
-        progress_data = progress_cache[task_id]
-        # print(f"返回翻译进度数据: {progress_data}")
-
-
         return jsonify(progress_data)
         
     except Exception as e:
@@ -1231,45 +1107,35 @@ def save_translated_novel():
         print(f"保存小说数据: {novel_info}")
         print(f"封面文件名: {novel_info.get('cover_filename', 'cover_fantasy.jpg')}")
         
-        # 创建小说记录
-        novel = Novel(
-            title=novel_info['title'],
-            author=novel_info['author'],
-            description=novel_info['description'],
-            category=novel_info['category'],
-            cover_image=novel_info.get('cover_filename', 'cover_fantasy.jpg')
+        # 已导入过的小说只追加新章节，否则创建小说记录
+        outcome = import_chapters(
+            lambda: Novel(
+                title=novel_info['title'],
+                author=novel_info['author'],
+                description=novel_info['description'],
+                category=novel_info['category'],
+                cover_image=novel_info.get('cover_filename', 'cover_fantasy.jpg')
+            ),
+            novel_info['title'], novel_info['author'],
+            ((ch['title'], ch['content']) for ch in novel_info['chapters']),
+            force_new=bool(data.get('force_new'))
         )
+        novel = outcome.novel
         
-        db.session.add(novel)
-        db.session.flush()  # 获取novel.id
-        
-        # 批量创建章节记录
-        chapters_to_add = []
-        for i, chapter_data in enumerate(novel_info['chapters']):
-            chapter = Chapter(
-                novel_id=novel.id,
-                title=chapter_data['title'],
-                content=chapter_data['content']
-            )
-            chapters_to_add.append(chapter)
-            
-            # 分批提交
-            if len(chapters_to_add) >= 50:
-                db.session.add_all(chapters_to_add)
-                db.session.flush()
-                chapters_to_add = []
-        
-        # 提交剩余章节
-        if chapters_to_add:
-            db.session.add_all(chapters_to_add)
-        
+        novel.refresh_chapter_stats()
+        novel_search.reindex_novel(novel)
         db.session.commit()
+        page_cache.invalidate_novel(novel.id)
         
         return jsonify({
             'success': True,
             'novel_id': novel.id,
-            'message': '小说已成功保存到数据库',
-            'chapters_count': len(novel_info['chapters'])
+            'message': '小说已成功保存到数据库' if outcome.created
+                       else f'小说已存在，追加了 {outcome.inserted} 个新章节',
+            'chapters_count': len(novel_info['chapters']),
+            'duplicate': not outcome.created,
+            'chapters_imported': outcome.inserted,
+            'chapters_skipped': outcome.skipped
         })
         
     except Exception as e:
@@ -1326,13 +1192,8 @@ def analyze_chapters():
         if not novel_id:
             return jsonify({'success': False, 'error': '缺少小说ID'})
         
-        # 保存临时文件
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_chapters_{uuid.uuid4().hex[:8]}_{filename}")
-        
-        # 确保上传目录存在
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(temp_path)
+        # 上传内容在接收请求时已写入临时文件（见upload_stream.py），直接解析该文件
+        temp_path = file.stream.name
         
         try:
             # 使用翻译器分析文件
@@ -1365,37 +1226,24 @@ def analyze_chapters():
                     'issues': issues
                 }
                 
-                # 生成唯一ID用于标识这次解析
-                analysis_id = uuid.uuid4().hex
-                
-                # 保存完整的解析数据到临时文件
-                analysis_data = {
+                # 保存完整的解析数据到暂存区，条目ID用于标识这次解析
+                analysis_id = staging_store.put({
                     'novel_info': {
                         'title': novel_info.title,
                         'author': novel_info.author,
                         'description': novel_info.description,
                         'language': novel_info.language.value,
                         'category': novel_info.category,
-                        'chapters': [
-                            {
-                                'title': ch.title,
-                                'content': ch.content,
-                                'chapter_number': ch.chapter_number
-                            }
-                            for ch in novel_info.chapters
-                        ]
                     },
                     'novel_id': novel_id,
                     'api_key': api_key,
                     'custom_prompt': custom_prompt,
                     'preview_mode': preview_mode,
                     'timestamp': datetime.utcnow().isoformat()
-                }
-                
-                # 保存到临时JSON文件
-                temp_json_path = os.path.join(app.config['UPLOAD_FOLDER'], f"chapter_analysis_{analysis_id}.json")
-                with open(temp_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(analysis_data, f, ensure_ascii=False, indent=2)
+                }, (
+                    {'title': ch.title, 'content': ch.content, 'chapter_number': ch.chapter_number}
+                    for ch in novel_info.chapters
+                ))
                 
                 # 在预览数据中包含analysis_id
                 preview_data['analysis_id'] = analysis_id
@@ -1435,161 +1283,34 @@ def translate_chapters():
         if not novel_id:
             return jsonify({'success': False, 'error': '缺少小说ID'})
         
-        # 读取之前保存的解析数据
-        temp_json_path = os.path.join(app.config['UPLOAD_FOLDER'], f"chapter_analysis_{analysis_id}.json")
-        
-        if not os.path.exists(temp_json_path):
+        # 读取之前暂存的解析数据
+        analysis_data = staging_store.get_header(analysis_id)
+        if analysis_data is None:
             return jsonify({'success': False, 'error': '解析数据已过期，请重新解析文件'})
         
         try:
-            with open(temp_json_path, 'r', encoding='utf-8') as f:
-                analysis_data = json.load(f)
-            
             # 更新自定义提示词
             if custom_prompt:
                 analysis_data['custom_prompt'] = custom_prompt
             
-            # 创建翻译任务ID
-            task_id = str(uuid.uuid4())
-            
-            # 启动后台翻译任务
-            import threading
-            
-            def chapter_translation_worker():
-                try:
-                    from novel_translator_qwen import QwenNovelTranslator
-                    from novel_importer import NovelInfo, ChapterInfo, Language
-                    
-                    # 重构数据为NovelInfo对象
-                    chapters = []
-                    for ch_data in analysis_data['novel_info']['chapters']:
-                        chapters.append(ChapterInfo(
-                            title=ch_data['title'],
-                            content=ch_data['content'],
-                            chapter_number=ch_data.get('chapter_number', 0)
-                        ))
-                    
-                    novel_obj = NovelInfo(
-                        title=analysis_data['novel_info']['title'],
-                        author=analysis_data['novel_info']['author'],
-                        description=analysis_data['novel_info']['description'],
-                        language=Language.CHINESE,
-                        category=analysis_data['novel_info']['category'],
-                        chapters=chapters
-                    )
-                    
-                    # 初始化翻译器
-                    translator = QwenNovelTranslator(api_key=analysis_data.get('api_key'))
-                    
-                    # 创建进度跟踪
-                    progress_cache = app.config.setdefault('CHAPTER_TRANSLATION_PROGRESS', {})
-                    progress_cache[task_id] = {
-                        'status': 'translating',
-                        'progress': {
-                            'current_chapter': 0,
-                            'total_chapters': len(novel_obj.chapters),
-                            'current_chapter_title': '',
-                            'success_count': 0,
-                            'error_count': 0,
-                            'estimated_cost': 0.0,
-                            'elapsed_time': 0.0,
-                            'progress_percent': 0.0,
-                            'success_rate': 100.0
-                        },
-                        'log_messages': [],
-                        'novel_id': novel_id
-                    }
-                    
-                    # 进度回调函数
-                    def progress_callback(progress):
-                        print(f"进度回调: status={progress.status}, current_chapter={progress.current_chapter}/{progress.total_chapters}")
-                        progress_data = progress_cache[task_id]
-                        progress_data['progress'] = {
-                            'current_chapter': progress.current_chapter,
-                            'total_chapters': progress.total_chapters,
-                            'current_chapter_title': progress.current_chapter_title,
-                            'success_count': progress.success_count,
-                            'error_count': progress.error_count,
-                            'estimated_cost': progress.estimated_cost,
-                            'elapsed_time': progress.elapsed_time,
-                            'progress_percent': progress.progress_percent,
-                            'success_rate': progress.success_rate
-                        }
-                        
-                        # 更新状态
-                        if hasattr(progress, 'status'):
-                            progress_data['status'] = progress.status
-                            print(f"更新状态为: {progress.status}")
-                        
-                        # 更新日志消息
-                        if progress.status == 'completed':
-                            progress_data['log_message'] = f"翻译完成！共 {progress.total_chapters} 章"
-                            progress_data['log_level'] = 'success'
-                            print(f"翻译完成，设置完成状态")
-                        elif progress.status == 'error':
-                            progress_data['log_message'] = f"翻译出错: {progress.current_chapter_title}"
-                            progress_data['log_level'] = 'error'
-                        else:
-                            progress_data['log_message'] = f"正在翻译: {progress.current_chapter_title}"
-                            progress_data['log_level'] = 'info'
-                    
-                    # 开始翻译
-                    success, translated_novel, message = translator.translate_novel(
-                        novel_obj,
-                        custom_prompt=analysis_data.get('custom_prompt'),
-                        progress_callback=progress_callback
-                    )
-                    
-                    if success:
-                        print(f"翻译成功，设置最终完成状态")
-                        progress_cache[task_id]['status'] = 'completed'
-                        progress_cache[task_id]['result'] = {
-                            'title': translated_novel.title,
-                            'author': translated_novel.author,
-                            'description': translated_novel.description,
-                            'chapters': [
-                                {
-                                    'title': chapter.title,
-                                    'content': chapter.content,
-                                    'chapter_number': chapter.chapter_number
-                                }
-                                for chapter in translated_novel.chapters
-                            ]
-                        }
-                        progress_cache[task_id]['stats'] = {
-                            'success_count': progress_cache[task_id]['progress']['success_count'],
-                            'error_count': progress_cache[task_id]['progress']['error_count'],
-                            'total_cost': translator.total_cost,
-                            'elapsed_time': progress_cache[task_id]['progress']['elapsed_time'],
-                            'success_rate': progress_cache[task_id]['progress']['success_rate']
-                        }
-                    else:
-                        progress_cache[task_id]['status'] = 'error'
-                        progress_cache[task_id]['error'] = message
-                        
-                except Exception as e:
-                    if task_id in progress_cache:
-                        progress_cache[task_id]['status'] = 'error'
-                        progress_cache[task_id]['error'] = str(e)
-                    else:
-                        # 如果进度缓存不存在，创建一个错误记录
-                        progress_cache = app.config.setdefault('CHAPTER_TRANSLATION_PROGRESS', {})
-                        progress_cache[task_id] = {
-                            'status': 'error',
-                            'error': str(e)
-                        }
-            
-            # 启动翻译线程
-            thread = threading.Thread(target=chapter_translation_worker)
-            thread.daemon = True
-            thread.start()
+            # 创建翻译任务，由独立的worker进程执行（flask run-translation-worker）
+            novel_data = dict(analysis_data['novel_info'], language='zh',
+                              chapters=list(staging_store.iter_chapters(analysis_id)))
+            try:
+                task_id = enqueue_job('chapters', {
+                    'novel_info': novel_data,
+                    'novel_id': novel_id,
+                    'custom_prompt': analysis_data.get('custom_prompt'),
+                    'api_key': analysis_data.get('api_key')
+                }, max_pending=app.config['TRANSLATION_MAX_PENDING_JOBS'])
+            except QueueFullError as e:
+                return jsonify({'success': False, 'error': str(e)})
             
             return jsonify({'success': True, 'task_id': task_id})
             
         finally:
-            # 清理临时分析文件
-            if os.path.exists(temp_json_path):
-                os.remove(temp_json_path)
+            # 清理暂存的解析数据
+            staging_store.delete(analysis_id)
         
     except Exception as e:
         import traceback
@@ -1602,17 +1323,75 @@ def translate_chapters():
 def chapter_translation_progress(task_id):
     """获取章节翻译进度"""
     try:
-        progress_cache = app.config.get('CHAPTER_TRANSLATION_PROGRESS', {})
+        progress_data = get_job_status(task_id)
         
-        if task_id not in progress_cache:
+        if progress_data is None:
             return jsonify({'success': False, 'error': '翻译任务不存在'})
         
-        progress_data = progress_cache[task_id]
         return jsonify({'success': True, **progress_data})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+# SSE连接的最长保持时间：web使用同步worker（见Procfile.py，超时30秒），每个连接必须在worker超时前结束，
+# 之后浏览器的EventSource按retry间隔自动重连，重连后重新发送一次完整进度
+TRANSLATION_EVENTS_MAX_SECONDS = 25
+TRANSLATION_EVENTS_RETRY_MS = 1000
+
+@app.route('/admin/translation-jobs/<task_id>/events', methods=['GET'], endpoint='translation_events')
+@admin_required
+def translation_events(task_id):
+    """以SSE推送翻译进度：只发送发生变化的字段，完成后发送结果信息（不含译文）"""
+    if get_job_snapshot(task_id) is None:
+        return jsonify({'success': False, 'error': '翻译任务不存在'}), 404
+    
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    def stream():
+        yield f"retry: {TRANSLATION_EVENTS_RETRY_MS}\n\n"
+        last = {}
+        last_sent = started = time.monotonic()
+        while time.monotonic() - started < TRANSLATION_EVENTS_MAX_SECONDS:
+            snapshot = get_job_snapshot(task_id)
+            # 结束读事务，下一次读取才能看到worker提交的新进度
+            db.session.rollback()
+            if snapshot is None:
+                yield event('error', {'error': '翻译任务不存在'})
+                return
+            delta = {key: value for key, value in snapshot.items() if last.get(key) != value}
+            if delta:
+                last = snapshot
+                last_sent = time.monotonic()
+                yield event('progress', delta)
+            if snapshot['status'] in ('completed', 'error'):
+                done = {'status': snapshot['status'], 'error': snapshot.get('error'), 'stats': snapshot.get('stats', {})}
+                if snapshot['status'] == 'completed':
+                    done['result'] = get_job_result_meta(task_id)
+                    done['chapters_url'] = url_for('translation_job_chapters', task_id=task_id)
+                yield event('done', done)
+                return
+            if time.monotonic() - last_sent >= 15:
+                last_sent = time.monotonic()
+                yield ': keepalive\n\n'
+            time.sleep(1)
+    
+    return app.response_class(stream_with_context(stream()), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/admin/translation-jobs/<task_id>/chapters', methods=['GET'], endpoint='translation_job_chapters')
+@admin_required
+def translation_job_chapters(task_id):
+    """分页获取翻译任务中已完成的章节"""
+    try:
+        if get_job_snapshot(task_id) is None:
+            return jsonify({'success': False, 'error': '翻译任务不存在'})
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 50, type=int)
+        return jsonify({'success': True, **list_job_chapters(task_id, page=page, per_page=per_page)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/admin/save-translated-chapters', methods=['POST'], endpoint='save_translated_chapters')
 @admin_required
 def save_translated_chapters():
@@ -1636,32 +1415,26 @@ def save_translated_chapters():
         if not novel:
             return jsonify({'success': False, 'error': '小说不存在'})
         
-        # 批量创建章节记录
-        chapters_to_add = []
-        for chapter_data in chapters:
-            chapter = Chapter(
-                novel_id=novel_id,
-                title=chapter_data['title'],
-                content=chapter_data['content']
-            )
-            chapters_to_add.append(chapter)
-            
-            # 分批提交，避免内存问题
-            if len(chapters_to_add) >= 50:
-                db.session.add_all(chapters_to_add)
-                db.session.flush()
-                chapters_to_add = []
-        
-        # 提交剩余的章节
-        if chapters_to_add:
-            db.session.add_all(chapters_to_add)
+        # 批量写入章节，序号接在已有章节之后；小说中已有的章节跳过
+        index = ChapterIndex.for_novel(novel.id)
+        saved = bulk_insert_chapters(
+            novel.id, index.filter_new((ch['title'], ch['content']) for ch in chapters),
+            start_number=novel.next_chapter_number()
+        ).rows
         
+        novel.refresh_chapter_stats()
+        novel_search.reindex_novel(novel)
         db.session.commit()
+        page_cache.invalidate_novel(novel.id)
         
+        message = f'成功保存 {saved} 个章节到小说《{novel.title}》'
+        if index.skipped:
+            message += f'（跳过已存在的章节 {index.skipped} 个）'
         return jsonify({
             'success': True,
-            'chapters_saved': len(chapters),
-            'message': f'成功保存 {len(chapters)} 个章节到小说《{novel.title}》'
+            'chapters_saved': saved,
+            'chapters_skipped': index.skipped,
+            'message': message
         })
         
     except Exception as e:
@@ -1685,14 +1458,24 @@ def preview_translation():
             return jsonify({'success': False, 'error': '缺少分析ID'})
         
         # 读取解析数据
-        temp_json_path = os.path.join(app.config['UPLOAD_FOLDER'], f"analysis_{analysis_id}.json")
-        if not os.path.exists(temp_json_path):
+        analysis_data = staging_store.get_header(analysis_id)
+        if analysis_data is None:
             return jsonify({'success': False, 'error': '解析数据已过期，请重新解析文件'})
         
-        with open(temp_json_path, 'r', encoding='utf-8') as f:
-            analysis_data = json.load(f)
-        
+        # 解析时提取的候选术语存入术语表，返回已确认的译名
         novel_info = analysis_data['novel_info']
+        term_key = glossary_key(novel_info['title'], novel_info['author'])
+        save_candidates(term_key, analysis_data.get('term_candidates', []))
+        
+        # 按分段估算的token计算费用；译文token数按与原文相当估算
+        estimated_tokens = analysis_data.get('estimated_tokens')
+        if estimated_tokens is not None:
+            estimated_full_cost = round(estimated_tokens * 2 / 1000 * app.config['TRANSLATION_COST_PER_1K_TOKENS'], 2)
+        else:
+            estimated_full_cost = analysis_data['chapter_count'] * 0.06
+        
+        # 预览只需要前3章（只解压这3章）
+        preview_chapters = [staging_store.get_chapter(analysis_id, i) for i in range(min(3, analysis_data['chapter_count']))]
         
         # 模拟翻译预览结果（实际应该调用翻译服务）
         # 这里提供一个简化的示例响应
@@ -1708,16 +1491,14 @@ def preview_translation():
                     'cost': 0.05 + i * 0.01,  # 示例成本
                     'quality_score': 0.9 - i * 0.02  # 示例质量分数
                 }
-                for i, chapter in enumerate(novel_info['chapters'][:3])  # 前3章
+                for i, chapter in enumerate(preview_chapters)  # 前3章
             ],
-            'terminology_mapping': {
-                '杨凌晨': 'Yang Lingchen',
-                '东方云冰': 'Dongfang Yunbing', 
-                '天武大陆': 'Tianwu Continent',
-                '太仓山脉': 'Taicang Mountain Range'
-            },
+            'glossary_key': term_key,
+            'terminology_mapping': load_glossary(term_key),
+            'term_candidates': list_terms(term_key),
             'preview_cost': 0.18,
-            'estimated_full_cost': len(novel_info['chapters']) * 0.06
+            'estimated_tokens': estimated_tokens,
+            'estimated_full_cost': estimated_full_cost
         }
         
         return jsonify({
@@ -1729,14 +1510,417 @@ def preview_translation():
         return jsonify({'success': False, 'error': str(e)})
 
 
+@app.route('/admin/glossary/<novel_key>', methods=['GET'], endpoint='get_glossary')
+@admin_required
+def get_glossary(novel_key):
+    """获取术语表（候选术语和已确认的译名）"""
+    return jsonify({'success': True, 'terms': list_terms(novel_key)})
+
+@app.route('/admin/glossary/<novel_key>', methods=['POST'], endpoint='save_glossary')
+@admin_required
+def save_glossary(novel_key):
+    """确认或修改术语译名：{"terms": [{"source": ..., "target": ..., "approved": true}]}"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('terms'), list):
+            return jsonify({'success': False, 'error': '无效的数据'})
+        
+        existing = {term.source: term for term in GlossaryTerm.query.filter_by(novel_key=novel_key)}
+        for item in data['terms']:
+            source = (item.get('source') or '').strip()
+            if not source:
+                continue
+            term = existing.get(source)
+            if term is None:
+                term = GlossaryTerm(novel_key=novel_key, source=source)
+                db.session.add(term)
+            term.target = (item.get('target') or '').strip() or None
+            term.approved = bool(item.get('approved', True)) and term.target is not None
+        db.session.commit()
+        
+        return jsonify({'success': True, 'terminology_mapping': load_glossary(novel_key)})
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/admin/cache-stats', methods=['GET'], endpoint='cache_stats')
+@admin_required
+def cache_stats():
+    """页面缓存和压缩结果缓存的命中率和容量统计"""
+    return jsonify({'success': True, 'stats': page_cache.stats(), 'compression': compress.stats()})
+
+# 命令行工具
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """升级数据库结构并回填新增的列（部署新版本时运行一次，web进程启动时不再修改表结构）"""
+    db.create_all()
+    upgrade_schema()
+    print("✅ 数据库结构已升级")
+    numbered = backfill_chapter_numbers()
+    print(f"✅ 已为 {numbered} 本小说的章节补齐序号")
+    counted = backfill_word_counts()
+    print(f"✅ 已为 {counted} 个章节计算字数")
+    count = backfill_chapter_stats()
+    print(f"✅ 已回填 {count} 本小说的章节统计")
+    novel_search.backend
+    print("✅ 检索索引已就绪")
+
+@app.cli.command('backfill-chapter-stats')
+def backfill_chapter_stats_command():
+    """回填章节序号以及小说的章节汇总字段（chapter_count等）"""
+    numbered = backfill_chapter_numbers()
+    print(f"✅ 已为 {numbered} 本小说的章节补齐序号")
+    counted = backfill_word_counts()
+    print(f"✅ 已为 {counted} 个章节计算字数")
+    count = backfill_chapter_stats()
+    print(f"✅ 已回填 {count} 本小说的章节统计")
+
+@app.cli.command('backfill-chapter-fingerprints')
+def backfill_chapter_fingerprints_command():
+    """为旧章节计算内容指纹（用于识别重复导入）"""
+    count = backfill_chapter_fingerprints()
+    db.session.commit()
+    print(f"✅ 已为 {count} 个章节计算指纹")
+
+@app.cli.command('compress-chapters')
+@click.option('--batch-size', default=200, show_default=True, help='每批转换的章节数')
+@click.option('--train/--no-train', default=True, show_default=True, help='转换前按语言训练新的压缩字典')
+@click.option('--decompress', is_flag=True, help='把压缩的章节还原为明文')
+def compress_chapters_command(batch_size, train, decompress):
+    """把已有章节的正文转换为压缩存储（可以随时中断，重新运行会从未转换的章节继续）"""
+    if train and not decompress:
+        for language, texts in sample_chapter_texts().items():
+            dictionary = chapter_codec.train(language, texts)
+            if dictionary is not None:
+                print(f"✅ 已用 {len(texts)} 个章节训练 {language} 字典（{chapter_codec.codec}，{len(dictionary.data)} 字节）")
+        db.session.commit()
+    raw_total = stored_total = 0
+    done = 0
+    for done, raw_bytes, stored_bytes in compress_chapters(batch_size=batch_size, decompress=decompress):
+        raw_total += raw_bytes
+        stored_total += stored_bytes
+        print(f"已处理 {done} 个章节")
+    if decompress:
+        print(f"✅ 已还原 {done} 个章节")
+    else:
+        ratio = stored_total / raw_total if raw_total else 0
+        print(f"✅ 已压缩 {done} 个章节：{raw_total} → {stored_total} 字节（{ratio:.1%}）")
+
+@app.cli.command('benchmark-chapter-compression')
+@click.option('--sample-size', default=200, show_default=True)
+def benchmark_chapter_compression_command(sample_size):
+    """抽样统计当前字典下的压缩率和单章解压耗时（不修改数据）"""
+    for language, texts in sample_chapter_texts(sample_size).items():
+        stats = chapter_codec.benchmark(texts)
+        print(f"{language}: {stats['chapters']} 章，{stats['raw_bytes']} → {stats['stored_bytes']} 字节"
+              f"（压缩率 {stats['ratio']}），解压平均 {stats['decode_avg_ms']} ms，P95 {stats['decode_p95_ms']} ms")
+
+@app.cli.command('benchmark-import')
+@click.option('--size-mb', default=500, show_default=True, help='生成的测试小说大小')
+@click.option('--chapter-kb', default=12, show_default=True, help='每章正文大小')
+def benchmark_import_command(size_mb, chapter_kb):
+    """生成一本大体积的GBK小说，用tracemalloc测量流式解析（analyze_to_staging）的峰值内存
+    tracemalloc会让解析慢数倍，测试500MB文件需要较长时间；另外输出进程的最大常驻内存供参考。
+    """
+    import resource
+    import tempfile
+    import tracemalloc
+    paragraph = '夜色渐深，山风吹过松林，远处的灯火一盏一盏熄灭，他握紧了手中的剑。\n'
+    body = (paragraph * (chapter_kb * 1024 // len(paragraph.encode('gbk')) + 1)).encode('gbk')
+    with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as f:
+        path = f.name
+        f.write('书名：压力测试\n作者：基准\n'.encode('gbk'))
+        number = 0
+        while f.tell() < size_mb * 1024 * 1024:
+            number += 1
+            f.write(f'第{number}章 第{number}章的标题\n'.encode('gbk'))
+            f.write(body)
+    print(f"已生成 {size_mb} MB 测试文件，{number} 章")
+    writer = staging_store.create()
+    try:
+        tracemalloc.start()
+        started = time.perf_counter()
+        with writer:
+            preview = NovelImporter().analyze_to_staging(path, writer)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        os.remove(path)
+        staging_store.delete(writer.key)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"解析 {preview['chapter_count']} 章用时 {elapsed:.1f} 秒，"
+          f"Python峰值内存 {peak / 1024 / 1024:.1f} MB，进程最大常驻内存 {max_rss:.0f} MB（文件 {size_mb} MB）")
+
+@app.cli.command('benchmark-split-chapters')
+@click.option('--chapters', default=10000, show_default=True, help='生成的测试小说章节数')
+@click.option('--lines', default=30, show_default=True, help='每章正文行数')
+@click.option('--rounds', default=3, show_default=True, help='每种实现重复次数（取最快一次）')
+def benchmark_split_chapters_command(chapters, lines, rounds):
+    """对比预编译匹配器和逐条规则re.match的旧实现：分章结果是否一致，以及吞吐量"""
+    samples = {
+        Language.CHINESE: ('第{n}章 风起云涌', '他抬头望向远方，第{n}次想起那个夜晚，心中五味杂陈。'),
+        Language.ENGLISH: ('Chapter {n}: The Long Road', 'Each morning {n} riders left the gate and rode north.'),
+    }
+    for language, (heading, paragraph) in samples.items():
+        parts = []
+        for n in range(1, chapters + 1):
+            parts.append(heading.format(n=n))
+            parts.extend(paragraph.format(n=i) for i in range(lines))
+        text = '\n'.join(parts)
+        size_mb = len(text.encode('utf-8')) / 1024 / 1024
+        results = {}
+        for name, importer in (('旧实现', ReferenceNovelImporter()), ('预编译', NovelImporter())):
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                split = importer.split_chapters(text, language)
+                timings.append(time.perf_counter() - started)
+            results[name] = split
+            best = min(timings)
+            print(f"{language.value} {name}: {len(split)} 章，{best:.2f} 秒，"
+                  f"{len(split) / best:.0f} 章/秒，{size_mb / best:.1f} MB/秒")
+        if results['旧实现'] != results['预编译']:
+            print(f"❌ {language.value} 两种实现的分章结果不一致")
+        else:
+            print(f"✅ {language.value} 分章结果一致")
+
+@app.cli.command('benchmark-bulk-insert')
+@click.option('--chapters', default=5000, show_default=True, help='测试小说的章节数')
+@click.option('--chapter-kb', default=8, show_default=True, help='每章正文大小')
+def benchmark_bulk_insert_command(chapters, chapter_kb):
+    """对比逐个ORM对象每50条flush一次和bulk_insert_chapters写入同一本小说的速度（在当前DATABASE_URL上运行，结束后回滚）"""
+    paragraph = '夜色渐深，山风吹过松林，远处的灯火一盏一盏熄灭。\n'
+    body = paragraph * (chapter_kb * 1024 // len(paragraph.encode('utf-8')) + 1)
+    source = [(f'第{n}章', f'{n}\n{body}') for n in range(1, chapters + 1)]
+    print(f"数据库：{db.engine.dialect.name}，{chapters} 章，每章约 {chapter_kb} KB")
+
+    def new_novel():
+        novel = Novel(title='写入基准', author='基准', description='基准测试', category='测试')
+        db.session.add(novel)
+        db.session.flush()
+        return novel
+
+    # 两种写法都要计算内容指纹（ORM由content属性触发），单独计时以便看出写入本身的差别
+    started = time.perf_counter()
+    fingerprints = [chapter_fingerprint(content) for _, content in source]
+    fingerprint_seconds = time.perf_counter() - started
+    print(f"内容指纹计算：{fingerprint_seconds:.2f} 秒")
+
+    try:
+        novel = new_novel()
+        started = time.perf_counter()
+        pending = []
+        for number, (title, content) in enumerate(source, start=1):
+            pending.append(Chapter(novel_id=novel.id, chapter_number=number, title=title, content=content))
+            if len(pending) >= 50:
+                db.session.add_all(pending)
+                db.session.flush()
+                pending = []
+        db.session.add_all(pending)
+        db.session.flush()
+        elapsed = time.perf_counter() - started
+        print(f"ORM逐个写入（含指纹）：{elapsed:.2f} 秒，{chapters / elapsed:.0f} 行/秒；"
+              f"扣除指纹约 {chapters / max(elapsed - fingerprint_seconds, 1e-6):.0f} 行/秒")
+        db.session.rollback()
+
+        novel = new_novel()
+        result = bulk_insert_chapters(
+            novel.id, ((title, content, fingerprint) for (title, content), fingerprint in zip(source, fingerprints)))
+        mode = 'COPY' if db.engine.dialect.name == 'postgresql' else 'executemany'
+        total = result.seconds + fingerprint_seconds
+        print(f"批量写入（{mode}，含指纹）：{total:.2f} 秒，{chapters / total:.0f} 行/秒；"
+              f"仅写入 {result.rows_per_second:.0f} 行/秒")
+    finally:
+        db.session.rollback()
+
+@app.cli.command('generate-cover-variants')
+@click.option('--force', is_flag=True, help='重新生成已存在的规格图')
+def generate_cover_variants_command(force):
+    """为已有封面生成缩略图/卡片/详情规格图"""
+    if not cover_images.enabled:
+        print("❌ 未安装Pillow，无法生成封面规格图")
+        return
+    filenames = [row[0] for row in db.session.query(Novel.cover_image).filter(Novel.cover_image.isnot(None)).distinct()]
+    generated = cover_images.backfill(filenames, force=force)
+    page_cache.invalidate('novels')
+    print(f"✅ 已为 {generated} 张封面生成规格图（{', '.join(cover_images.formats)}）")
+
+@app.cli.command('migrate-covers')
+@click.option('--remove-originals', is_flag=True, help='迁移后删除不再被引用的旧封面文件（默认封面除外）')
+def migrate_covers_command(remove_originals):
+    """把按上传文件名保存的旧封面迁移到内容哈希目录，相同的图片合并为一个文件"""
+    default_covers = {'cover.jpg', 'cover_default.jpg', 'cover_fantasy.jpg', 'cover_romance.jpg'}
+    filenames = [row[0] for row in db.session.query(Novel.cover_image).filter(Novel.cover_image.isnot(None)).distinct()]
+    migrated = {}
+    for filename in filenames:
+        if cover_images.is_content_addressed(filename) or filename in default_covers:
+            continue
+        if not os.path.exists(os.path.join(cover_images.root, filename)):
+            print(f"封面文件不存在，跳过: {filename}")
+            continue
+        migrated[filename] = cover_images.import_file(filename)
+        db.session.execute(db.update(Novel).where(Novel.cover_image == filename).values(cover_image=migrated[filename]))
+    db.session.commit()
+    for new_filename in set(migrated.values()):
+        cover_images.schedule(new_filename)
+    if remove_originals:
+        for filename in migrated:
+            os.remove(os.path.join(cover_images.root, filename))
+            cover_images.delete(filename)
+    page_cache.invalidate('novels')
+    print(f"✅ 已迁移 {len(migrated)} 个封面，合并为 {len(set(migrated.values()))} 个文件")
+
+@app.cli.command('gc-covers')
+def gc_covers_command():
+    """删除没有任何小说引用的封面文件"""
+    removed = cover_images.collect_garbage()
+    print(f"✅ 已删除 {removed} 个未使用的封面")
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """构建带内容哈希的CSS/JS及其.gz/.br版本，并输出构建前后的大小对比（构建后需重启应用）"""
+    report = static_assets.build()
+    print(f"{'文件':<24}{'原始':>12}{'构建后':>12}{'gzip':>12}{'brotli':>12}")
+    for row in report:
+        brotli_bytes = row['brotli_bytes'] if row['brotli_bytes'] is not None else '-'
+        print(f"{row['name']:<24}{row['source_bytes']:>12}{row['built_bytes']:>12}{row['gzip_bytes']:>12}{brotli_bytes:>12}")
+    source_total = sum(row['source_bytes'] for row in report)
+    wire_total = sum(row['brotli_bytes'] or row['gzip_bytes'] for row in report)
+    print(f"✅ 已构建 {len(report)} 个文件：{source_total} → {wire_total} 字节（压缩后传输）")
+
+@app.cli.command('benchmark-compression')
+@click.option('--chapter-id', type=int, help='测试的章节（默认取正文最接近20KB的章节）')
+@click.option('--requests', 'rounds', default=50, show_default=True)
+def benchmark_compression_command(chapter_id, rounds):
+    """统计章节页在各压缩方式下的传输字节数和每次请求的CPU耗时（冷：每次重新压缩，热：命中压缩缓存）"""
+    if chapter_id is None:
+        chapter = Chapter.query.order_by(db.func.abs(db.func.coalesce(Chapter.word_count, 0) * 3 - 20 * 1024)).first()
+    else:
+        chapter = db.session.get(Chapter, chapter_id)
+    if chapter is None:
+        print("❌ 没有可测试的章节")
+        return
+    with app.test_request_context():
+        url = url_for('chapter', novel_id=chapter.novel_id, chapter_id=chapter.id)
+    client = app.test_client()
+    client.get(url)  # 预热页面缓存，只测量压缩本身的差异
+    for label, encoding, warm in (('identity', '', False), ('gzip', 'gzip', False),
+                                  ('br', 'br', False), ('br (cached)', 'br', True)):
+        started = time.process_time()
+        for _ in range(rounds):
+            if not warm:
+                compress.bodies.clear()
+            response = client.get(url, headers={'Accept-Encoding': encoding})
+        cpu_ms = (time.process_time() - started) / rounds * 1000
+        print(f"{label:<12} {len(response.get_data()):>8} 字节  {cpu_ms:.2f} ms CPU/请求")
+    print(f"章节 {chapter.id}（{chapter.word_count} 字），压缩缓存: {compress.stats()}")
+
+@app.cli.command('build-sitemaps')
+@click.option('--clear', is_flag=True, help='先删除全部缓存的分片')
+def build_sitemaps_command(clear):
+    """生成（或按数据变化更新）全部站点地图分片"""
+    if clear:
+        sitemaps.clear()
+    count = sitemaps.build_all()
+    print(f"✅ 站点地图共 {count} 个分片，保存在 {sitemaps.root}")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """重建小说（及可选的章节）全文索引"""
+    count = novel_search.rebuild()
+    print(f"✅ 已使用 {novel_search.backend.name} 重建 {count} 本小说的索引")
+
+@app.cli.command('benchmark-search')
+@click.option('--queries', 'query_count', default=50, show_default=True, help='从已有小说的书名/作者中抽取的搜索词数量')
+@click.option('--rounds', default=5, show_default=True)
+def benchmark_search_command(query_count, rounds):
+    """对比LIKE模糊匹配和当前全文检索后端的搜索耗时（P50/P95）"""
+    from search_index import LikeSearchBackend
+    queries = []
+    for title, author in db.session.query(Novel.title, Novel.author).order_by(Novel.id.desc()).limit(query_count):
+        queries.extend(q for q in (title[:2], title, author) if q)
+    if not queries:
+        print("❌ 没有可用作搜索词的小说")
+        return
+    backends = [LikeSearchBackend(), novel_search.backend]
+    for backend in backends:
+        timings = []
+        for _ in range(rounds):
+            for query in queries:
+                started = time.perf_counter()
+                backend.search(query, 1, 12)
+                timings.append((time.perf_counter() - started) * 1000)
+                db.session.rollback()
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{backend.name:<18} {len(timings)} 次查询  P50 {p50:.2f} ms  P95 {p95:.2f} ms")
+    print(f"小说总数 {Novel.query.count()}")
+
+@app.cli.command('benchmark-translation')
+@click.option('--chapters', default=200, show_default=True, help='测试小说的章节数')
+@click.option('--latency', default=0.2, show_default=True, help='替身翻译器每次请求的延迟（秒）')
+@click.option('--concurrency', default='1,2,4,8,16', show_default=True, help='逗号分隔的并发数（max_in_flight）')
+@click.option('--rate', default=1000.0, show_default=True, help='令牌桶速率（请求/秒），默认足够大以便只看并发的影响')
+@click.option('--throttle-ratio', default=0.0, show_default=True, help='随机返回429限流的请求比例，用于观察退避')
+def benchmark_translation_command(chapters, latency, concurrency, rate, throttle_ratio):
+    """用注入延迟的本地替身翻译器测量不同并发数下的章节翻译吞吐量，并检查结果顺序"""
+    import random
+
+    class Throttled(Exception):
+        status_code = 429
+        retry_after = latency
+
+    translator = LocalTranslator(delay=latency)
+    novel_info = NovelInfo(title='基准', author='基准', description='', language=Language.CHINESE,
+                           category='测试', chapters=[])
+    source = [ChapterInfo(title=f'第{n}章', content=f'第{n}章的正文。', chapter_number=n)
+              for n in range(1, chapters + 1)]
+
+    def translate(chapter):
+        if throttle_ratio and random.random() < throttle_ratio:
+            raise Throttled('429 Too Many Requests')
+        return translator.translate_chapter(novel_info, chapter)
+
+    print(f"{chapters} 章，每次请求延迟 {latency} 秒，令牌桶 {rate}/秒，限流比例 {throttle_ratio:.0%}")
+    baseline = None
+    for in_flight in (int(value) for value in concurrency.split(',')):
+        executor = TranslationExecutor(max_in_flight=in_flight, rate=rate, burst=in_flight,
+                                       base_delay=latency)
+        started = time.perf_counter()
+        translated = executor.map(translate, source, on_error=lambda chapter, error: None)
+        elapsed = time.perf_counter() - started
+        failed = sum(1 for chapter in translated if chapter is None)
+        ordered = all(chapter is None or chapter.chapter_number == original.chapter_number
+                      for chapter, original in zip(translated, source))
+        baseline = baseline or elapsed
+        print(f"并发 {in_flight:>3}：{elapsed:6.2f} 秒，{chapters / elapsed:7.1f} 章/秒，"
+              f"加速 {baseline / elapsed:4.1f}x，失败 {failed}" + ('' if ordered else '，❌ 顺序错乱'))
+
+@app.cli.command('run-translation-worker')
+def run_translation_worker_command():
+    """启动翻译任务worker（与web进程分开运行），并发数由TRANSLATION_WORKERS控制"""
+    concurrency = app.config['TRANSLATION_WORKERS']
+    backend = app.config['TRANSLATION_BACKEND']
+    print(f"✅ 翻译worker已启动：{concurrency} 个并发任务，翻译后端 {backend}")
+    run_worker(app, concurrency=concurrency, backend=backend,
+               executor=TranslationExecutor.from_config(app.config))
+
 # 数据库初始化
 with app.app_context():
     db.create_all()
-    if not User.query.filter_by(username='admin').first():
+    pending = missing_columns()
+    if pending:
+        print(f"⚠️ 数据库缺少 {len(pending)} 个新增列，请先运行 flask --app app upgrade-db")
+    elif not User.query.filter_by(username='admin').first():
         admin = User(username='admin', password=generate_password_hash('admin123'))
         novel1 = Novel(title='黑暗森林', description='科幻小说', cover_image='cover_fantasy.jpg', category='科幻')
         novel2 = Novel(title='倾城之恋', description='言情小说', cover_image='cover_romance.jpg', category='言情')
         db.session.add_all([admin, novel1, novel2])
+        novel_search.index_novel(novel1)
+        novel_search.index_novel(novel2)
         db.session.commit()
 
 if __name__ == '__main__':
@@ -0,0 +1,167 @@
+"""
+章节正文压缩
+开启CHAPTER_COMPRESSION后，新写入的章节正文压缩为二进制存放在content_blob列（content列留空），
+优先使用zstd并按语言训练字典；未安装zstandard时使用zlib的预设字典。
+读取时按content_encoding透明解压，旧的明文行不受影响，可以用 flask compress-chapters 批量转换。
+"""
+
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # 未安装时使用zlib
+    zstandard = None
+
+_CJK_RE = re.compile('[一-鿿]')
+
+# zlib的预设字典最多使用32KB
+ZLIB_DICT_SIZE = 32 * 1024
+ZSTD_DICT_SIZE = 112 * 1024
+
+
+def detect_language(text: str) -> str:
+    """按开头部分的汉字比例区分中文和英文正文，用于选择压缩字典"""
+    sample = (text or '')[:500]
+    return 'zh' if sample and len(_CJK_RE.findall(sample)) > len(sample) * 0.2 else 'en'
+
+
+def _train_zlib_dictionary(samples: List[str], size: int = ZLIB_DICT_SIZE) -> bytes:
+    """用样本中最常见的片段拼成zlib预设字典；越常见的片段越靠近末尾（匹配距离更短）"""
+    counts = Counter()
+    for sample in samples:
+        data = sample.encode('utf-8')
+        counts.update(data[i:i + 12] for i in range(0, len(data) - 12, 6))
+    pieces = []
+    total = 0
+    for piece, count in counts.most_common():
+        if count < 2 or total + len(piece) > size:
+            break
+        pieces.append(piece)
+        total += len(piece)
+    return b''.join(reversed(pieces))
+
+
+class ChapterCodec:
+    """章节正文的压缩和解压"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.codec = 'zstd' if zstandard is not None else 'zlib'
+        self.level = 3 if self.codec == 'zstd' else 6
+        self._dictionaries = {}  # 字典ID -> 字典数据（字典只增不改，可以一直缓存）
+        self._current = {}  # 语言 -> (字典ID, 读取时间)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHAPTER_COMPRESSION', False)
+        self.enabled = bool(app.config['CHAPTER_COMPRESSION'])
+        app.extensions['chapter_codec'] = self
+
+    def _dictionary(self, dict_id: int):
+        dictionary = self._dictionaries.get(dict_id)
+        if dictionary is None:
+            from models import db, CompressionDictionary
+            row = db.session.get(CompressionDictionary, dict_id)
+            if row is None:
+                raise LookupError(f'压缩字典 {dict_id} 不存在')
+            dictionary = row.data
+            if row.codec == 'zstd':
+                if zstandard is None:
+                    raise RuntimeError('章节使用zstd压缩，但zstandard未安装')
+                dictionary = zstandard.ZstdCompressionDict(dictionary)
+            with self._lock:
+                self._dictionaries[dict_id] = dictionary
+        return dictionary
+
+    def _current_dictionary(self, language: str) -> Optional[int]:
+        """当前用于压缩的字典（每5分钟重新读取一次，以便使用新训练的字典）"""
+        cached = self._current.get(language)
+        if cached is not None and cached[1] > time.monotonic() - 300:
+            return cached[0]
+        from models import db, CompressionDictionary
+        with db.session.no_autoflush:
+            row = db.session.query(CompressionDictionary.id).filter_by(
+                language=language, codec=self.codec
+            ).order_by(CompressionDictionary.id.desc()).first()
+        dict_id = row[0] if row else None
+        self._current[language] = (dict_id, time.monotonic())
+        return dict_id
+
+    def encode(self, text: str) -> Tuple[bytes, str]:
+        """压缩正文，返回(压缩数据, content_encoding)"""
+        dict_id = self._current_dictionary(detect_language(text))
+        dictionary = self._dictionary(dict_id) if dict_id else None
+        data = (text or '').encode('utf-8')
+        if self.codec == 'zstd':
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary) \
+                if dictionary is not None else zstandard.ZstdCompressor(level=self.level)
+            blob = compressor.compress(data)
+        else:
+            compressor = zlib.compressobj(self.level, zdict=dictionary) \
+                if dictionary is not None else zlib.compressobj(self.level)
+            blob = compressor.compress(data) + compressor.flush()
+        return blob, f'{self.codec}:{dict_id}' if dict_id else self.codec
+
+    def decode(self, blob: bytes, encoding: str) -> str:
+        codec, _, dict_id = encoding.partition(':')
+        dictionary = self._dictionary(int(dict_id)) if dict_id else None
+        if codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError('章节使用zstd压缩，但zstandard未安装')
+            decompressor = zstandard.ZstdDecompressor(dict_data=dictionary) \
+                if dictionary is not None else zstandard.ZstdDecompressor()
+            data = decompressor.decompress(blob)
+        elif codec == 'zlib':
+            decompressor = zlib.decompressobj(zdict=dictionary) if dictionary is not None else zlib.decompressobj()
+            data = decompressor.decompress(blob) + decompressor.flush()
+        else:
+            raise ValueError(f'未知的正文编码: {encoding}')
+        return data.decode('utf-8')
+
+    def train(self, language: str, samples: Iterable[str]):
+        """用样本正文训练一个新字典并加入会话，返回CompressionDictionary（样本太少时返回None）"""
+        from models import db, CompressionDictionary
+        samples = [sample for sample in samples if sample]
+        if len(samples) < 20:
+            return None
+        if self.codec == 'zstd':
+            data = zstandard.train_dictionary(ZSTD_DICT_SIZE, [s.encode('utf-8') for s in samples]).as_bytes()
+        else:
+            data = _train_zlib_dictionary(samples)
+        row = CompressionDictionary(language=language, codec=self.codec, data=data)
+        db.session.add(row)
+        db.session.flush()
+        self._current[language] = (row.id, time.monotonic())
+        return row
+
+    def benchmark(self, samples: Iterable[str], rounds: int = 5) -> dict:
+        """用当前字典压缩样本，统计压缩率和单章解压耗时（不写数据库）"""
+        raw_bytes = stored_bytes = 0
+        timings = []
+        for text in samples:
+            blob, encoding = self.encode(text)
+            raw_bytes += len(text.encode('utf-8'))
+            stored_bytes += len(blob)
+            started = time.perf_counter()
+            for _ in range(rounds):
+                self.decode(blob, encoding)
+            timings.append((time.perf_counter() - started) / rounds)
+        timings.sort()
+        return {
+            'chapters': len(timings),
+            'raw_bytes': raw_bytes,
+            'stored_bytes': stored_bytes,
+            'ratio': round(stored_bytes / raw_bytes, 3) if raw_bytes else 0.0,
+            'decode_avg_ms': round(sum(timings) / len(timings) * 1000, 3) if timings else 0.0,
+            'decode_p95_ms': round(timings[int(len(timings) * 0.95)] * 1000, 3) if timings else 0.0,
+        }
+
+
+chapter_codec = ChapterCodec()
@@ -0,0 +1,340 @@
+"""
+封面图片处理
+上传的封面按内容哈希保存在static/img/covers（相同图片只存一份，文件名即内容，可以永久缓存），
+不再被任何小说引用时删除。另外在后台线程中裁剪为固定尺寸（3:4）的缩略图/卡片/详情三种规格，
+每种规格输出WebP、AVIF（Pillow支持时）和JPEG。模板中用cover_img()输出带srcset/sizes和宽高的<picture>，
+还没有生成规格图（或未安装Pillow）时回退到原图。
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+from flask import request, url_for
+from markupsafe import Markup, escape
+from werkzeug.utils import secure_filename
+
+from models import db, Novel
+from page_cache import page_cache
+from upload_stream import HashingUploadFile
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # 未安装Pillow时不生成规格图
+    Image = None
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，回收锁只在进程内生效
+    fcntl = None
+
+# 规格名 -> 宽度，高度按3:4计算
+VARIANTS = (('thumb', 160), ('card', 320), ('detail', 640))
+ASPECT = 4 / 3
+# 按内容哈希命名的封面目录（相对于图片目录）
+COVER_DIR = 'covers'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 刚保存或复用的封面在这段时间内不会被回收，避免和尚未提交的引用冲突
+GC_GRACE_SECONDS = 3600
+# 封面目录中的锁文件：复用已有封面和回收封面互斥（多个worker进程之间也生效）
+GC_LOCK_NAME = '.gc.lock'
+FORMAT_OPTIONS = {
+    'avif': ('AVIF', {'quality': 50}),
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_height(width: int) -> int:
+    return round(width * ASPECT)
+
+
+def _supported_formats() -> List[str]:
+    """按优先级返回可以输出的格式，JPEG作为最后的回退始终存在"""
+    if Image is None:
+        return []
+    formats = []
+    try:
+        import pillow_avif  # noqa: F401  旧版Pillow通过插件支持AVIF
+    except ImportError:
+        pass
+    Image.init()
+    if 'AVIF' in Image.SAVE:
+        formats.append('avif')
+    if features.check('webp'):
+        formats.append('webp')
+    formats.append('jpg')
+    return formats
+
+
+class CoverImages:
+    """封面的存储和回收、规格图生成以及模板输出"""
+
+    def __init__(self, app=None):
+        self.root = None
+        self.variant_root = None
+        self.formats = _supported_formats()
+        self._ready = set()  # 已确认生成完毕的封面
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._gc_lock = threading.Lock()
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COVER_VARIANTS_ENABLED', True)
+        app.config.setdefault('COVER_IMAGE_WORKERS', 1)
+
+        self.root = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+        self.variant_root = os.path.join(self.root, 'variants')
+        if not app.config['COVER_VARIANTS_ENABLED']:
+            self.formats = []
+        elif Image is None:
+            print("Pillow未安装，封面直接使用原图")
+        self._executor = ThreadPoolExecutor(max_workers=app.config['COVER_IMAGE_WORKERS'],
+                                            thread_name_prefix='cover-images')
+        app.add_template_global(self.img_tag, 'cover_img')
+        app.after_request(self._cache_headers)
+        app.extensions['cover_images'] = self
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.formats)
+
+    def _variant_dir(self, filename: str) -> str:
+        return os.path.join(self.variant_root, os.path.splitext(filename)[0])
+
+    def _variant_name(self, width: int, fmt: str) -> str:
+        return f'{width}.{fmt}'
+
+    def has_variants(self, filename: str) -> bool:
+        if filename in self._ready:
+            return True
+        # 最后写入的是最大规格的JPEG，存在即说明全部生成完毕
+        last = os.path.join(self._variant_dir(filename), self._variant_name(VARIANTS[-1][1], 'jpg'))
+        if self.enabled and os.path.exists(last):
+            self._ready.add(filename)
+            return True
+        return False
+
+    def generate(self, filename: str, force: bool = False) -> bool:
+        """为一张封面生成全部规格图，返回是否生成（已存在且未指定force时跳过）"""
+        if not self.enabled or (not force and self.has_variants(filename)):
+            return False
+        source = os.path.join(self.root, filename)
+        target_dir = self._variant_dir(filename)
+        os.makedirs(target_dir, exist_ok=True)
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            # 调色板/透明图片先铺白底，JPEG不支持透明
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            for _, width in VARIANTS:
+                resized = ImageOps.fit(image.convert('RGB'), (width, variant_height(width)),
+                                       Image.Resampling.LANCZOS)
+                # JPEG最后写入，has_variants据此判断是否完成
+                for fmt in sorted(self.formats, key=lambda f: f == 'jpg'):
+                    pil_format, options = FORMAT_OPTIONS[fmt]
+                    path = os.path.join(target_dir, self._variant_name(width, fmt))
+                    resized.save(path + '.tmp', pil_format, **options)
+                    os.replace(path + '.tmp', path)
+        self._ready.add(filename)
+        return True
+
+    def schedule(self, filename: Optional[str]):
+        """在后台线程中生成规格图，生成后让列表和详情页缓存失效"""
+        if not filename or not self.enabled:
+            return
+        with self._lock:
+            if filename in self._pending:
+                return
+            self._pending.add(filename)
+
+        def run():
+            try:
+                if self.generate(filename):
+                    page_cache.invalidate('novels')
+            except Exception as e:
+                print(f"生成封面规格图失败 {filename}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(filename)
+
+        self._executor.submit(run)
+
+    def delete(self, filename: str):
+        """删除封面的规格图"""
+        self._ready.discard(filename)
+        target_dir = self._variant_dir(filename)
+        if os.path.isdir(target_dir):
+            shutil.rmtree(target_dir, ignore_errors=True)
+
+    @staticmethod
+    def is_content_addressed(filename: Optional[str]) -> bool:
+        return bool(filename) and filename.startswith(COVER_DIR + '/')
+
+    @contextmanager
+    def _gc_locked(self):
+        """持有回收锁：检查文件是否存在并刷新时间，与检查是否可回收并删除，不会交错执行"""
+        with self._gc_lock:
+            if fcntl is None:
+                yield
+                return
+            lock_dir = os.path.join(self.root, COVER_DIR)
+            os.makedirs(lock_dir, exist_ok=True)
+            with open(os.path.join(lock_dir, GC_LOCK_NAME), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _store_file(self, source: str, digest: str, ext: str, move: bool) -> str:
+        filename = f'{COVER_DIR}/{digest[:2]}/{digest[:32]}{ext}'
+        path = os.path.join(self.root, filename)
+        with self._gc_locked():
+            reused = os.path.exists(path)
+            if reused:
+                os.utime(path)  # 复用已有文件时刷新时间，回收时留出提交引用的时间
+        if reused:
+            if move:
+                os.remove(source)
+            return filename
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        (shutil.move if move else shutil.copyfile)(source, tmp_path)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        return filename
+
+    def store(self, file_storage) -> str:
+        """按内容哈希保存上传的封面，返回相对于图片目录的文件名；相同的图片返回同一个文件"""
+        ext = os.path.splitext(secure_filename(file_storage.filename))[1].lower().replace('.jpeg', '.jpg')
+        stream = file_storage.stream
+        if isinstance(stream, HashingUploadFile):
+            # 上传时已经落盘并算好了哈希，直接移动临时文件
+            return self._store_file(stream.detach(), stream.sha256, ext, move=True)
+        tmp_path = os.path.join(self.root, COVER_DIR, f'.{uuid.uuid4().hex}.tmp')
+        os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+        digest = hashlib.sha256()
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(64 * 1024), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        return self._store_file(tmp_path, digest.hexdigest(), ext, move=True)
+
+    def import_file(self, filename: str) -> str:
+        """把旧的按上传文件名保存的封面复制到内容哈希目录，返回新文件名"""
+        path = os.path.join(self.root, filename)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        ext = os.path.splitext(filename)[1].lower().replace('.jpeg', '.jpg')
+        return self._store_file(path, digest.hexdigest(), ext, move=False)
+
+    @staticmethod
+    def reference_count(filename: str) -> int:
+        return db.session.query(db.func.count(Novel.id)).filter(Novel.cover_image == filename).scalar()
+
+    def _collectable(self, filename: str) -> bool:
+        path = os.path.join(self.root, filename)
+        try:
+            recent = os.path.getmtime(path) > time.time() - GC_GRACE_SECONDS
+        except FileNotFoundError:
+            return False
+        return not recent and self.reference_count(filename) == 0
+
+    def _remove(self, filename: str):
+        self.delete(filename)
+        os.remove(os.path.join(self.root, filename))
+
+    def release(self, filename: Optional[str]) -> bool:
+        """小说不再使用该封面（引用已提交）后调用：没有其他小说引用时删除文件和规格图
+        只回收内容哈希目录中的封面，默认封面等旧文件保持不动。
+        """
+        if not self.is_content_addressed(filename):
+            return False
+        with self._gc_locked():
+            if not self._collectable(filename):
+                return False
+            self._remove(filename)
+        return True
+
+    def collect_garbage(self) -> int:
+        """删除没有任何小说引用的封面（上传后未被使用的、中断留下的临时文件），返回删除的数量"""
+        removed = 0
+        cover_root = os.path.join(self.root, COVER_DIR)
+        for directory, _, names in os.walk(cover_root):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name == GC_LOCK_NAME:
+                    continue
+                if name.endswith('.tmp'):
+                    if os.path.getmtime(path) < time.time() - GC_GRACE_SECONDS:
+                        os.remove(path)
+                    continue
+                filename = os.path.relpath(path, self.root).replace(os.sep, '/')
+                with self._gc_locked():
+                    if not self._collectable(filename):
+                        continue
+                    self._remove(filename)
+                removed += 1
+        return removed
+
+    def _cache_headers(self, response):
+        """内容哈希命名的封面（及其规格图）永远不会改变，可以永久缓存"""
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            path = (request.view_args or {}).get('filename', '')
+            if path.startswith((f'img/{COVER_DIR}/', f'img/variants/{COVER_DIR}/')):
+                response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    def backfill(self, filenames: Iterable[str], force: bool = False) -> int:
+        """同步为已有封面生成规格图，返回生成的数量"""
+        generated = 0
+        for filename in filenames:
+            if not os.path.exists(os.path.join(self.root, filename)):
+                print(f"封面文件不存在，跳过: {filename}")
+                continue
+            try:
+                generated += self.generate(filename, force=force)
+            except Exception as e:
+                print(f"生成封面规格图失败 {filename}: {e}")
+        return generated
+
+    def img_tag(self, filename: str, alt: str = '', sizes: str = '100vw', variant: str = 'card',
+                class_: str = '', loading: str = 'lazy') -> Markup:
+        """输出封面的<picture>标签；width/height取自指定规格，避免图片加载后页面跳动"""
+        width = dict(VARIANTS)[variant]
+        attrs = (f'alt="{escape(alt)}" class="{escape(class_)}" width="{width}" height="{variant_height(width)}" '
+                 f'loading="{loading}" decoding="async"')
+        if not self.has_variants(filename):
+            src = url_for('static', filename=f'img/{filename}')
+            return Markup(f'<img src="{escape(src)}" {attrs}>')
+
+        base = f'img/variants/{os.path.splitext(filename)[0]}/'
+
+        def srcset(fmt):
+            return ', '.join(
+                f"{url_for('static', filename=base + self._variant_name(w, fmt))} {w}w" for _, w in VARIANTS)
+
+        sources = ''.join(
+            f'<source type="image/{fmt}" srcset="{escape(srcset(fmt))}" sizes="{escape(sizes)}">'
+            for fmt in self.formats if fmt != 'jpg')
+        src = url_for('static', filename=base + self._variant_name(width, 'jpg'))
+        return Markup(f'<picture>{sources}<img src="{escape(src)}" srcset="{escape(srcset("jpg"))}" '
+                      f'sizes="{escape(sizes)}" {attrs}></picture>')
+
+
+cover_images = CoverImages()
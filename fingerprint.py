@@ -0,0 +1,188 @@
+"""
+章节内容指纹
+每个章节保存规范化正文的哈希（精确重复）和simhash（近似重复，如只多了广告行或改了几个错字）。
+重新导入同一本小说（或多了若干新章节的更新版本）时据此找到已有的小说，
+跳过已存在的章节，只追加新章节。
+"""
+
+import hashlib
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+_NOISE_RE = re.compile(r'\s+')
+# 按标点切分出的短句作为simhash特征（空白已在规范化时去掉）
+_CLAUSE_RE = re.compile(r'[^，。！？；：、,.!?;:…“”‘’"\'（）()《》【】\[\]—-]+')
+
+# 判断重复小说时抽样的章节数
+SAMPLE_SIZE = 10
+# simhash汉明距离不超过该值视为近似重复
+MAX_DISTANCE = 3
+# 短于该长度的章节特征太少，只做精确匹配
+MIN_SIMHASH_CHARS = 200
+
+
+def normalize_content(text: str) -> str:
+    """去掉所有空白并统一全角/半角形式，排版差异不影响指纹"""
+    text = _NOISE_RE.sub('', text or '')
+    # 大多数正文去掉全角空格后已经是NFKC形式，快速检查可以省去大部分规范化开销
+    return text if unicodedata.is_normalized('NFKC', text) else unicodedata.normalize('NFKC', text)
+
+
+def content_hash(text: str) -> str:
+    """规范化正文的哈希（128位，十六进制）"""
+    return _content_hash(normalize_content(text))
+
+
+def simhash(text: str) -> int:
+    """以短句为特征的64位simhash，返回有符号整数以便存入BIGINT列"""
+    return _simhash(normalize_content(text))
+
+
+def _content_hash(normalized: str) -> str:
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _simhash(normalized: str) -> int:
+    features = _CLAUSE_RE.findall(normalized)
+    if not features:
+        return 0
+    bits = [format(int.from_bytes(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest(), 'big'), '064b')
+            for f in features]
+    # 逐位统计1的个数（zip按位转置），超过半数的位置为1
+    half = len(bits) / 2
+    value = int(''.join('1' if column.count('1') > half else '0' for column in zip(*bits)), 2)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count()
+
+
+def chapter_fingerprint(content: str) -> Tuple[str, Optional[int]]:
+    """返回(content_hash, simhash)；过短的章节不计算simhash"""
+    normalized = normalize_content(content)
+    return _content_hash(normalized), _simhash(normalized) if len(normalized) >= MIN_SIMHASH_CHARS else None
+
+
+class ChapterIndex:
+    """一组章节指纹的索引
+    simhash按4个16位分段建桶：汉明距离不超过3时至少有一个分段完全相同，只需比较同桶的指纹。
+    """
+
+    def __init__(self):
+        self.hashes = set()
+        self._buckets = defaultdict(list)
+        self.skipped = 0
+
+    @classmethod
+    def for_novel(cls, novel_id: int, session=None) -> 'ChapterIndex':
+        """加载一本小说已有章节的指纹（缺少指纹的旧章节先补齐）"""
+        from models import db, Chapter, backfill_chapter_fingerprints
+        session = session or db.session
+        backfill_chapter_fingerprints(novel_id=novel_id, session=session)
+        index = cls()
+        rows = session.query(Chapter.content_hash, Chapter.simhash).filter(Chapter.novel_id == novel_id)
+        for hash_value, simhash_value in rows:
+            index.add(hash_value, simhash_value)
+        return index
+
+    @staticmethod
+    def _bands(value: int):
+        return [(i, (value >> (i * 16)) & 0xFFFF) for i in range(4)]
+
+    def add(self, hash_value: str, simhash_value: Optional[int]):
+        self.hashes.add(hash_value)
+        if simhash_value is not None:
+            for band in self._bands(simhash_value):
+                self._buckets[band].append(simhash_value)
+
+    def contains(self, hash_value: str, simhash_value: Optional[int]) -> bool:
+        if hash_value in self.hashes:
+            return True
+        if simhash_value is None:
+            return False
+        return any(hamming_distance(simhash_value, other) <= MAX_DISTANCE
+                   for band in self._bands(simhash_value) for other in self._buckets.get(band, ()))
+
+    def filter_new(self, chapters: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str, Tuple]]:
+        """只产出索引中没有的章节(标题, 正文, 指纹)，新章节随即加入索引，跳过的数量记在skipped"""
+        for title, content in chapters:
+            fingerprint = chapter_fingerprint(content)
+            if self.contains(*fingerprint):
+                self.skipped += 1
+                continue
+            self.add(*fingerprint)
+            yield title, content, fingerprint
+
+
+def find_duplicate_novel(title: str, author: str, sample: List[Tuple[str, str]], session=None):
+    """根据抽样章节查找已导入过的同一本小说，返回Novel或None
+    半数以上不同的抽样章节已存在于同一本小说，并且书名或作者相同时才视为重复；
+    只按章节数计数时，一章重复多次的公告（如请假条）就会让两本无关的小说被误判为同一本。
+    """
+    from models import db, Novel, Chapter
+    session = session or db.session
+    if not sample:
+        return None
+
+    # 先用精确哈希在全部章节中查找（content_hash有索引），按命中的不同哈希数计数
+    hashes = {content_hash(content) for _, content in sample}
+    needed = (len(hashes) + 1) // 2
+    matched = db.func.count(db.distinct(Chapter.content_hash))
+    rows = session.query(Chapter.novel_id, matched).filter(
+        Chapter.content_hash.in_(hashes)
+    ).group_by(Chapter.novel_id).having(matched >= needed).order_by(matched.desc()).limit(5)
+    for novel_id, _ in rows:
+        novel = session.get(Novel, novel_id)
+        if novel is not None and (novel.title == title or novel.author == author):
+            return novel
+
+    # 同名同作者的小说再用simhash确认（来源不同的文本往往只有少量差异）
+    needed = (len(sample) + 1) // 2
+    for novel in session.query(Novel).filter(Novel.title == title, Novel.author == author).limit(5):
+        index = ChapterIndex.for_novel(novel.id, session=session)
+        matched = sum(index.contains(*chapter_fingerprint(content)) for _, content in sample)
+        if matched >= needed:
+            return novel
+    return None
+
+
+@dataclass
+class ImportOutcome:
+    """导入结果：created为False表示追加到了已有的小说"""
+    novel: object
+    created: bool
+    inserted: int
+    skipped: int
+
+
+def import_chapters(create_novel: Callable[[], object], title: str, author: str,
+                    chapters: Iterable[Tuple[str, str]], force_new: bool = False, session=None) -> ImportOutcome:
+    """导入一本小说的章节：检测到已导入过时只追加新章节，否则调用create_novel创建小说
+    chapters为(标题, 正文)序列，可以是生成器。调用方负责更新汇总字段并提交事务。
+    """
+    from models import db
+    from bulk_insert import bulk_insert_chapters
+    session = session or db.session
+    chapters = iter(chapters)
+    sample = list(islice(chapters, SAMPLE_SIZE))
+    chapters = chain(sample, chapters)
+
+    novel = None if force_new else find_duplicate_novel(title, author, sample, session=session)
+    if novel is None:
+        novel = create_novel()
+        session.add(novel)
+        session.flush()
+        inserted = bulk_insert_chapters(novel.id, chapters, session=session).rows
+        return ImportOutcome(novel=novel, created=True, inserted=inserted, skipped=0)
+
+    index = ChapterIndex.for_novel(novel.id, session=session)
+    inserted = bulk_insert_chapters(
+        novel.id, index.filter_new(chapters), start_number=novel.next_chapter_number(), session=session
+    ).rows
+    print(f"检测到重复导入《{novel.title}》（ID {novel.id}），跳过已有章节 {index.skipped} 个，追加 {inserted} 个")
+    return ImportOutcome(novel=novel, created=False, inserted=inserted, skipped=index.skipped)
@@ -0,0 +1,126 @@
+"""
+术语表
+解析小说时统计中文n-gram频率，提取人名、地名等候选专有名词；管理员确认译名后，
+翻译时只把当前分段中出现的术语附加到提示词里，保证整本书译名一致且提示词保持简短。
+"""
+
+import hashlib
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+_CJK_RUN_RE = re.compile('[一-鿿]{2,}')
+
+# 出现在候选词首尾时基本可以判定不是专有名词的常用字
+STOP_CHARS = frozenset('的了是在不我你他她它们这那有和就也都而及与着或一个上下来去说道把被对得地很没要会能到')
+
+# 计数表超过该大小时丢弃低频项，避免超长小说占用过多内存
+MAX_COUNTER_ENTRIES = 1_000_000
+# 统计满该字数后改为每隔几章抽样一章，控制超长小说的解析时间
+FULL_SCAN_CHARS = 2_000_000
+SAMPLE_STRIDE = 5
+
+
+def glossary_key(title: str, author: str) -> str:
+    """术语表按书名和作者区分：翻译时小说可能尚未入库"""
+    return hashlib.sha1(f"{title}\0{author}".encode('utf-8')).hexdigest()[:16]
+
+
+class TermExtractor:
+    """逐章统计2~4字中文词组频率，用于提取候选术语"""
+
+    def __init__(self, min_length: int = 2, max_length: int = 4):
+        self.lengths = range(min_length, max_length + 1)
+        self.counts = Counter()
+        self._prune_below = 2
+        self._scanned_chars = 0
+        self._fed = 0
+
+    def feed(self, text: str):
+        self._fed += 1
+        if self._scanned_chars >= FULL_SCAN_CHARS and self._fed % SAMPLE_STRIDE:
+            return
+        self._scanned_chars += len(text)
+        counts = self.counts
+        for run in _CJK_RUN_RE.findall(text):
+            for n in self.lengths:
+                if len(run) >= n:
+                    counts.update(run[i:i + n] for i in range(len(run) - n + 1))
+        if len(counts) > MAX_COUNTER_ENTRIES:
+            # 有损计数：丢弃低频项，阈值逐步提高
+            self.counts = counts = Counter({gram: c for gram, c in counts.items() if c >= self._prune_below})
+            self._prune_below += 1
+
+    def candidates(self, limit: int = 50, min_count: int = 5) -> List[Dict]:
+        """返回候选术语（按频率×长度排序）；被更长词组覆盖的片段会被去掉"""
+        counts = self.counts
+        frequent = {gram: c for gram, c in counts.items()
+                    if c >= min_count and gram[0] not in STOP_CHARS and gram[-1] not in STOP_CHARS}
+        # 子串的出现次数几乎都来自某个更长的词组时（如“凌晨”之于“杨凌晨”），只保留长的
+        covered = set()
+        for gram, count in frequent.items():
+            if len(gram) < 3:
+                continue
+            for sub in (gram[:-1], gram[1:]):
+                if sub in frequent and count >= frequent[sub] * 0.8:
+                    covered.add(sub)
+        ranked = sorted(
+            (gram for gram in frequent if gram not in covered),
+            key=lambda gram: (frequent[gram] * len(gram), gram), reverse=True
+        )
+        return [{'source': gram, 'frequency': frequent[gram]} for gram in ranked[:limit]]
+
+
+class GlossaryMatcher:
+    """找出文本中出现的已确认术语"""
+
+    def __init__(self, mapping: Dict[str, str]):
+        self.mapping = {source: target for source, target in mapping.items() if source and target}
+        # 长词优先，避免“杨凌”抢先匹配“杨凌晨”
+        sources = sorted(self.mapping, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(map(re.escape, sources))) if sources else None
+
+    def terms_in(self, text: str) -> Dict[str, str]:
+        if self._pattern is None or not text:
+            return {}
+        return {source: self.mapping[source] for source in dict.fromkeys(self._pattern.findall(text))}
+
+    def build_prompt(self, base_prompt: Optional[str], text: str) -> Optional[str]:
+        """在提示词后附加本段出现的术语；没有术语时原样返回"""
+        terms = self.terms_in(text)
+        if not terms:
+            return base_prompt
+        lines = '\n'.join(f"{source} = {target}" for source, target in terms.items())
+        glossary = f"请使用以下固定译名：\n{lines}"
+        return f"{base_prompt}\n\n{glossary}" if base_prompt else glossary
+
+
+def save_candidates(key: str, candidates: Iterable[Dict]):
+    """保存候选术语，已有的术语只更新频率，不覆盖已确认的译名"""
+    from models import db, GlossaryTerm
+    existing = {term.source: term for term in GlossaryTerm.query.filter_by(novel_key=key)}
+    for candidate in candidates:
+        term = existing.get(candidate['source'])
+        if term is None:
+            db.session.add(GlossaryTerm(novel_key=key, source=candidate['source'],
+                                        frequency=candidate.get('frequency', 0)))
+        else:
+            term.frequency = candidate.get('frequency', term.frequency)
+    db.session.commit()
+
+
+def load_glossary(key: str) -> Dict[str, str]:
+    """返回已确认的术语映射"""
+    from models import db, GlossaryTerm
+    rows = db.session.query(GlossaryTerm.source, GlossaryTerm.target).filter(
+        GlossaryTerm.novel_key == key, GlossaryTerm.approved.is_(True))
+    return {source: target for source, target in rows if target}
+
+
+def list_terms(key: str) -> List[Dict]:
+    """返回术语表中的全部术语（按频率排序），用于后台展示"""
+    from models import GlossaryTerm
+    return [
+        {'source': term.source, 'target': term.target, 'frequency': term.frequency, 'approved': term.approved}
+        for term in GlossaryTerm.query.filter_by(novel_key=key).order_by(GlossaryTerm.frequency.desc())
+    ]
@@ -1,6 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy.ext.hybrid import hybrid_property
+from fingerprint import chapter_fingerprint
+from content_codec import chapter_codec
 
 db = SQLAlchemy()
 
@@ -14,7 +17,7 @@ class Novel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
-    cover_image = db.Column(db.String(200))  # 封面图片路径
+    cover_image = db.Column(db.String(200), index=True)  # 封面图片路径（相对于static/img，新封面为covers/下的内容哈希文件名）
     chapters = db.relationship('Chapter', backref='novel', lazy=True)
     category = db.Column(db.String(50))
     author = db.Column(db.String(100), default='Unknown Author')
@@ -23,16 +26,127 @@ class Novel(db.Model):
     total_bookmarks = db.Column(db.Integer, default=0)
     total_reviews = db.Column(db.Integer, default=0)
     status = db.Column(db.String(20), default='ongoing')  # 'ongoing', 'completed', 'hiatus'
+    # 章节汇总字段（冗余存储，列表页无需访问chapter表）
+    chapter_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    first_chapter_id = db.Column(db.Integer)
+    last_chapter_id = db.Column(db.Integer)
+    total_words = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     created_at = db.Column(db.DateTime, default=lambda: datetime.utcnow())
     updated_at = db.Column(db.DateTime, default=lambda: datetime.utcnow(), onupdate=lambda: datetime.utcnow())
 
+    def refresh_chapter_stats(self):
+        """用一次聚合查询重新计算章节汇总字段（不加载章节正文）"""
+        db.session.flush()
+        count, words = db.session.query(
+            db.func.count(Chapter.id),
+            db.func.coalesce(db.func.sum(db.func.coalesce(Chapter.word_count, db.func.length(Chapter.content))), 0)
+        ).filter(Chapter.novel_id == self.id).one()
+        ordered = db.session.query(Chapter.id).filter(Chapter.novel_id == self.id)
+        first = ordered.order_by(Chapter.chapter_number, Chapter.id).first()
+        last = ordered.order_by(Chapter.chapter_number.desc(), Chapter.id.desc()).first()
+        self.chapter_count = count
+        self.first_chapter_id = first[0] if first else None
+        self.last_chapter_id = last[0] if last else None
+        self.total_words = words
+        # 目录发生变化，更新时间同时作为小说页面的缓存校验值
+        self.updated_at = datetime.utcnow()
+
+    def next_chapter_number(self):
+        """返回追加新章节时应使用的章节序号
+        尚未回填序号的旧章节按数量计入，与 backfill_chapter_numbers 按ID顺序编号的结果一致。
+        """
+        db.session.flush()
+        current_max, count = db.session.query(
+            db.func.max(Chapter.chapter_number), db.func.count(Chapter.id)
+        ).filter(Chapter.novel_id == self.id).one()
+        return max(current_max or 0, count) + 1
+
 class Chapter(db.Model):
+    __table_args__ = (
+        db.Index('ix_chapter_novel_number', 'novel_id', 'chapter_number'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     novel_id = db.Column(db.Integer, db.ForeignKey('novel.id'), nullable=False)
+    chapter_number = db.Column(db.Integer)  # 章节在小说中的顺序（从1开始）
     title = db.Column(db.String(100), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    # 正文默认延迟加载，只有阅读/编辑页面才会读取；开启压缩后正文存放在content_blob（见content_codec.py）
+    _content = db.deferred(db.Column('content', db.Text, nullable=False), group='content')
+    content_blob = db.deferred(db.Column(db.LargeBinary), group='content')
+    content_encoding = db.Column(db.String(32))  # 为空表示正文以明文存放在content列
+    word_count = db.Column(db.Integer)  # 正文字数，随content自动维护
+    # 正文指纹，随content自动维护，用于识别重复导入（见fingerprint.py）
+    content_hash = db.Column(db.String(32), index=True)
+    simhash = db.Column(db.BigInteger)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.utcnow(), onupdate=lambda: datetime.utcnow())
     comments = db.relationship('Comment', backref='chapter', lazy=True)
 
+    @hybrid_property
+    def content(self):
+        return self.decode_content(self._content, self.content_blob, self.content_encoding)
+
+    @content.setter
+    def content(self, value):
+        self.word_count = len(value) if value else 0
+        self.content_hash, self.simhash = chapter_fingerprint(value)
+        if chapter_codec.enabled and value:
+            self.content_blob, self.content_encoding = chapter_codec.encode(value)
+            self._content = ''
+        else:
+            self._content = value
+            self.content_blob = self.content_encoding = None
+
+    @content.expression
+    def content(cls):
+        # SQL中只能访问明文列；需要正文的查询使用content_columns()并用decode_content解码
+        return cls._content
+
+    @classmethod
+    def content_columns(cls):
+        return cls._content, cls.content_blob, cls.content_encoding
+
+    @staticmethod
+    def decode_content(raw, blob, encoding):
+        return chapter_codec.decode(blob, encoding) if encoding else raw
+
+    @classmethod
+    def list_query(cls, novel_id):
+        """章节目录查询：只加载id、标题、序号和字数，不读取正文"""
+        return cls.query.filter_by(novel_id=novel_id).options(
+            db.load_only(cls.id, cls.novel_id, cls.title, cls.chapter_number, cls.word_count)
+        ).order_by(cls.chapter_number, cls.id)
+
+    @classmethod
+    def summaries_by_novel(cls, novel_ids):
+        """按小说分组返回章节摘要（id、标题、序号、字数），用于后台列表"""
+        grouped = {}
+        if not novel_ids:
+            return grouped
+        rows = db.session.query(
+            cls.id, cls.novel_id, cls.title, cls.chapter_number, cls.word_count
+        ).filter(cls.novel_id.in_(novel_ids)).order_by(cls.novel_id, cls.chapter_number, cls.id)
+        for row in rows:
+            grouped.setdefault(row.novel_id, []).append(row)
+        return grouped
+
+    def neighbour_ids(self):
+        """通过两次索引查询获取上一章和下一章的ID"""
+        query = db.session.query(Chapter.id).filter(Chapter.novel_id == self.novel_id)
+        if self.chapter_number is None:
+            # 尚未回填序号的旧数据按ID排序
+            prev_row = query.filter(Chapter.id < self.id).order_by(Chapter.id.desc()).first()
+            next_row = query.filter(Chapter.id > self.id).order_by(Chapter.id).first()
+        else:
+            prev_row = query.filter(db.or_(
+                Chapter.chapter_number < self.chapter_number,
+                db.and_(Chapter.chapter_number == self.chapter_number, Chapter.id < self.id)
+            )).order_by(Chapter.chapter_number.desc(), Chapter.id.desc()).first()
+            next_row = query.filter(db.or_(
+                Chapter.chapter_number > self.chapter_number,
+                db.and_(Chapter.chapter_number == self.chapter_number, Chapter.id > self.id)
+            )).order_by(Chapter.chapter_number, Chapter.id).first()
+        return (prev_row[0] if prev_row else None), (next_row[0] if next_row else None)
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -43,4 +157,174 @@ class Comment(db.Model):
 class UserNovel(db.Model):  # 用户书架
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    novel_id = db.Column(db.Integer, db.ForeignKey('novel.id'), nullable=False)
\ No newline at end of file
+    novel_id = db.Column(db.Integer, db.ForeignKey('novel.id'), nullable=False)
+
+class CompressionDictionary(db.Model):  # 章节正文压缩字典（按语言训练，只增不改，旧字典仍用于解压）
+    id = db.Column(db.Integer, primary_key=True)
+    language = db.Column(db.String(8), nullable=False, index=True)
+    codec = db.Column(db.String(16), nullable=False)  # 'zstd' 或 'zlib'
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.utcnow())
+
+class TranslationJob(db.Model):  # 后台翻译任务（由独立的worker进程执行）
+    id = db.Column(db.String(36), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'novel' 整本翻译, 'chapters' 追加章节翻译
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # 'queued', 'translating', 'completed', 'error'
+    payload = db.Column(db.Text, nullable=False)  # 任务参数和原文（JSON）
+    progress = db.Column(db.Text)  # 进度信息（JSON），任意web进程都可以读取
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    worker_id = db.Column(db.String(64))
+    heartbeat_at = db.Column(db.DateTime)  # worker定期刷新，超时的任务会被其他worker接管
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.utcnow())
+    chapters = db.relationship('TranslationJobChapter', backref='job', lazy='dynamic',
+                               cascade='all, delete-orphan')
+
+class TranslationJobChapter(db.Model):  # 翻译任务的逐章检查点，崩溃后从最后完成的章节继续
+    __table_args__ = (
+        db.UniqueConstraint('job_id', 'chapter_index', name='uq_translation_job_chapter'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(36), db.ForeignKey('translation_job.id'), nullable=False)
+    chapter_index = db.Column(db.Integer, nullable=False)  # 在原文章节列表中的位置（从0开始）
+    chapter_number = db.Column(db.Integer)
+    title = db.Column(db.String(200), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    failed = db.Column(db.Boolean, default=False, nullable=False, server_default='0')  # 翻译失败时保存原文
+
+class GlossaryTerm(db.Model):  # 小说术语表（人名、地名等的固定译名）
+    __table_args__ = (
+        db.UniqueConstraint('novel_key', 'source', name='uq_glossary_term'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    novel_key = db.Column(db.String(16), nullable=False, index=True)  # 由书名和作者计算，见glossary.glossary_key
+    source = db.Column(db.String(50), nullable=False)
+    target = db.Column(db.String(100))
+    frequency = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    approved = db.Column(db.Boolean, default=False, nullable=False, server_default='0')  # 管理员确认后才会用于翻译
+
+def missing_columns():
+    """返回已有表中缺少的列[(表, 列)]，只读取表结构"""
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {col['name'] for col in inspector.get_columns(table.name)}
+        missing.extend((table, column) for column in table.columns if column.name not in existing_columns)
+    return missing
+
+def upgrade_schema():
+    """为已有数据库补齐新增的列和索引（create_all不会修改已存在的表）
+    会执行DDL，只应通过 flask upgrade-db 在部署时运行一次，不要在每个web进程启动时调用。
+    """
+    missing = missing_columns()
+    existing_tables = set(db.inspect(db.engine).get_table_names())
+    with db.engine.begin() as conn:
+        for table, column in missing:
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+            conn.execute(db.text(ddl))
+        for table in db.metadata.sorted_tables:
+            if table.name in existing_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+
+def backfill_chapter_numbers():
+    """为缺少章节序号的小说按ID顺序重新编号（只读取ID列），返回处理的小说数量"""
+    novel_ids = [row[0] for row in db.session.query(Chapter.novel_id).filter(
+        Chapter.chapter_number.is_(None)).distinct()]
+    for novel_id in novel_ids:
+        chapter_ids = [row[0] for row in db.session.query(Chapter.id).filter(
+            Chapter.novel_id == novel_id).order_by(Chapter.id)]
+        db.session.execute(db.update(Chapter), [
+            {'id': chapter_id, 'chapter_number': number}
+            for number, chapter_id in enumerate(chapter_ids, start=1)
+        ])
+        db.session.commit()
+    return len(novel_ids)
+
+def backfill_word_counts():
+    """在数据库内为旧章节计算字数（不把正文读入Python），返回更新的行数
+    压缩存储的章节写入时已经记录了字数，不会出现在这里。
+    """
+    result = db.session.execute(
+        db.update(Chapter).where(Chapter.word_count.is_(None)).values(
+            word_count=db.func.length(Chapter.content)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return result.rowcount
+
+def backfill_chapter_stats(batch_size=200):
+    """为所有小说回填章节汇总字段，返回处理的小说数量"""
+    novel_ids = [row[0] for row in db.session.query(Novel.id).order_by(Novel.id)]
+    for start in range(0, len(novel_ids), batch_size):
+        for novel in Novel.query.filter(Novel.id.in_(novel_ids[start:start + batch_size])):
+            novel.refresh_chapter_stats()
+        db.session.commit()
+    return len(novel_ids)
+
+def backfill_chapter_fingerprints(novel_id=None, batch_size=500, session=None):
+    """为缺少指纹的章节计算content_hash和simhash（只读取ID和正文），返回更新的行数"""
+    session = session or db.session
+    query = session.query(Chapter.id, *Chapter.content_columns()).filter(Chapter.content_hash.is_(None))
+    if novel_id is not None:
+        query = query.filter(Chapter.novel_id == novel_id)
+    updated = 0
+    while True:
+        rows = query.order_by(Chapter.id).limit(batch_size).all()
+        if not rows:
+            return updated
+        session.execute(db.update(Chapter), [
+            dict(zip(('id', 'content_hash', 'simhash'), (chapter_id, *chapter_fingerprint(Chapter.decode_content(*stored)))))
+            for chapter_id, *stored in rows
+        ])
+        session.flush()
+        updated += len(rows)
+
+def sample_chapter_texts(sample_size=500):
+    """随机抽取章节正文，按语言分组，用于训练压缩字典和基准测试"""
+    from content_codec import detect_language
+    rows = db.session.query(*Chapter.content_columns()).order_by(db.func.random()).limit(sample_size)
+    grouped = {}
+    for stored in rows:
+        text = Chapter.decode_content(*stored)
+        grouped.setdefault(detect_language(text), []).append(text)
+    return grouped
+
+def compress_chapters(batch_size=200, decompress=False):
+    """把明文章节转换为压缩存储（decompress为True时反向转换），每批提交一次，逐批产出(已处理行数, 原大小, 压缩后大小)"""
+    if decompress:
+        query = db.session.query(Chapter.id, *Chapter.content_columns()).filter(Chapter.content_encoding.isnot(None))
+    else:
+        query = db.session.query(Chapter.id, Chapter._content).filter(Chapter.content_encoding.is_(None))
+    done = 0
+    while True:
+        rows = query.order_by(Chapter.id).limit(batch_size).all()
+        if not rows:
+            return
+        updates = []
+        raw_bytes = stored_bytes = 0
+        for chapter_id, *stored in rows:
+            if decompress:
+                text = Chapter.decode_content(*stored)
+                updates.append({'chapter_id': chapter_id, 'content': text, 'content_blob': None, 'content_encoding': None})
+            else:
+                text = stored[0] or ''
+                blob, encoding = chapter_codec.encode(text)
+                updates.append({'chapter_id': chapter_id, 'content': '', 'content_blob': blob, 'content_encoding': encoding})
+                stored_bytes += len(blob)
+            raw_bytes += len(text.encode('utf-8'))
+        db.session.execute(
+            Chapter.__table__.update().where(Chapter.__table__.c.id == db.bindparam('chapter_id')), updates)
+        db.session.commit()
+        done += len(rows)
+        yield done, raw_bytes, stored_bytes
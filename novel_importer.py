@@ -8,11 +8,18 @@
 
 import re
 import os
+import mmap
+import threading
+import codecs
 import hashlib
-from typing import List, Dict, Optional, Tuple
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator
 from dataclasses import dataclass
 from enum import Enum
 
+from text_chunker import chunk_text, join_chunks, estimate_tokens, DEFAULT_MAX_TOKENS
+from glossary import TermExtractor, GlossaryMatcher
+
 
 class Language(Enum):
     CHINESE = "zh"
@@ -37,26 +44,153 @@ class NovelInfo:
     language: Language
     category: str
     chapters: List[ChapterInfo]
+    encoding: Optional[str] = None
+    encoding_confidence: Optional[float] = None
+    decode_errors: int = 0  # 流式读取时无法解码、已替换为U+FFFD的字符数
+
+
+@dataclass
+class EncodingGuess:
+    """编码检测结果"""
+    encoding: str
+    confidence: float
+
+
+# 字节顺序标记，命中即可确定编码
+ENCODING_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# 无BOM时按顺序尝试的候选编码（gb18030兼容gbk/gb2312）
+CANDIDATE_ENCODINGS = ['utf-8', 'gbk', 'gb18030']
+
+# 编码检测的采样窗口大小（字节），分别取文件开头、中间和结尾
+SNIFF_WINDOW_BYTES = 64 * 1024
+
+
+def _sample_windows(data) -> List[bytes]:
+    """从开头、中间、结尾各取一段样本；中间和结尾的样本从换行后开始，避免截断多字节字符"""
+    size = len(data)
+    if size <= SNIFF_WINDOW_BYTES * 3:
+        return [bytes(data)]
+    windows = [bytes(data[:SNIFF_WINDOW_BYTES])]
+    for start in (size // 2, size - SNIFF_WINDOW_BYTES):
+        window = bytes(data[start:start + SNIFF_WINDOW_BYTES])
+        newline = window.find(b'\n')
+        windows.append(window[newline + 1:] if newline >= 0 else b'')
+    return windows
+
+
+def _cjk_ratio(text: str) -> float:
+    """非ASCII字符中常用汉字和中文标点所占比例"""
+    non_ascii = 0
+    cjk = 0
+    for char in text:
+        if char < '\x80':
+            continue
+        non_ascii += 1
+        if '\u4e00' <= char <= '\u9fff' or '\u3000' <= char <= '\u303f' or '\uff00' <= char <= '\uffef':
+            cjk += 1
+    return cjk / non_ascii if non_ascii else 1.0
+
+
+def sniff_encoding(data, default: str = 'utf-8') -> EncodingGuess:
+    """根据BOM和采样窗口判断编码，只检查样本，不解码整个文件"""
+    for bom, encoding in ENCODING_BOMS:
+        if data[:len(bom)] == bom:
+            return EncodingGuess(encoding, 1.0)
+    
+    windows = _sample_windows(data)
+    if not any(byte >= 0x80 for window in windows for byte in window):
+        # 纯ASCII样本，任何候选编码解码结果都相同
+        return EncodingGuess(default, 0.9)
+    
+    candidates = [default] + [enc for enc in CANDIDATE_ENCODINGS if enc != default]
+    best = None
+    for encoding in candidates:
+        try:
+            # 样本末尾可能截断多字节字符，使用增量解码器且不结束输入
+            text = ''.join(codecs.getincrementaldecoder(encoding)().decode(window, final=False)
+                           for window in windows)
+        except (UnicodeDecodeError, LookupError):
+            continue
+        if codecs.lookup(encoding).name == 'utf-8':
+            # 含多字节字符的合法UTF-8几乎不会是其他编码的巧合
+            return EncodingGuess(encoding, 0.99)
+        confidence = round(0.9 * _cjk_ratio(text), 2)
+        if best is None or confidence > best.confidence:
+            best = EncodingGuess(encoding, confidence)
+    
+    if best is None:
+        raise ValueError("无法识别文件编码")
+    return best
+
+
+def sniff_file_encoding(file_path: str, default: str = 'utf-8') -> EncodingGuess:
+    """用mmap读取文件样本并判断编码"""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return EncodingGuess(default, 1.0)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return sniff_encoding(data, default)
+
+
+def _combine_patterns(rules: List[Tuple[str, str]]) -> 're.Pattern':
+    """把多条规则合并为一个带命名分组的正则，命名分组标识命中的规则"""
+    return re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in rules), re.IGNORECASE)
 
 
 class NovelImporter:
     """小说导入器主类"""
     
+    # 流式处理时用于检测语言、编码和提取元数据的文件开头长度
+    HEAD_SAMPLE_CHARS = 64 * 1024
+    
+    CHINESE_CHAPTER_RULES = [
+        ('zh_chapter', r'第([0-9一二三四五六七八九十百千万]+)章[\s\u3000]*(.+?)(?=\n|$)'),  # 第X章 标题
+        ('zh_hui', r'第([0-9]+)回[\s\u3000]*(.+?)(?=\n|$)'),  # 第X回 标题
+        ('zh_special', r'(序章|楔子|后记|结局|大结局|终章|尾声)[\s\u3000]*(.*)(?=\n|$)'),  # 特殊章节
+        ('zh_numbered', r'([0-9]+)[\s\u3000]*\.[\s\u3000]*(.+?)(?=\n|$)'),  # 1. 标题
+    ]
+    
+    ENGLISH_CHAPTER_RULES = [
+        ('en_chapter', r'Chapter\s+(\d+)[\s:]*(.+?)(?=\n|$)'),  # Chapter X: Title
+        ('en_chapter_upper', r'CHAPTER\s+(\d+)[\s:]*(.+?)(?=\n|$)'),  # CHAPTER X: Title
+        ('en_ch', r'Ch\.?\s*(\d+)[\s:]*(.+?)(?=\n|$)'),  # Ch. X: Title
+        ('en_numbered', r'(\d+)\.?\s+(.+?)(?=\n|$)'),  # 1. Title
+        ('en_special', r'(Prologue|Epilogue|Preface|Afterword)[\s:]*(.*)(?=\n|$)'),  # 特殊章节
+    ]
+    
+    # 常见的无用内容（均为单行匹配，可以逐行清理）
+    UNWANTED_PATTERNS = [
+        r'</p>',
+        r'更多电子书请访问.*',
+        r'爱下电子书.*',
+        r'简体:https?://.*',
+        r'繁体:https?://.*',
+        r'E-mail:.*',
+        r'------.*?-------',
+        r'『.*?连载中.*?』',
+        r'www\..*\.com',
+        r'http[s]?://.*',
+    ]
+    
+    # 类加载时编译一次：每行只需一次扫描
+    _CHINESE_HEADING_RE = _combine_patterns(CHINESE_CHAPTER_RULES)
+    _ENGLISH_HEADING_RE = _combine_patterns(ENGLISH_CHAPTER_RULES)
+    _UNWANTED_RE = re.compile('|'.join(f'(?:{pattern})' for pattern in UNWANTED_PATTERNS), re.IGNORECASE)
+    _HTML_TAG_RE = re.compile(r'<[^>]+>')
+    
+    # 标题首字符预筛选：绝大多数正文行在这里就被排除，无需进入正则
+    _CHINESE_HEADING_PREFIXES = frozenset('第序楔后结大终尾0123456789')
+    _ENGLISH_HEADING_PREFIXES = frozenset('CcPpEeAa')  # Chapter/CH/Prologue/Epilogue/Preface/Afterword，数字单独判断
+    
     def __init__(self):
-        self.chinese_chapter_patterns = [
-            r'第([0-9一二三四五六七八九十百千万]+)章[\s\u3000]*(.+?)(?=\n|$)',  # 第X章 标题
-            r'第([0-9]+)回[\s\u3000]*(.+?)(?=\n|$)',  # 第X回 标题
-            r'(序章|楔子|后记|结局|大结局|终章|尾声)[\s\u3000]*(.*)(?=\n|$)',  # 特殊章节
-            r'([0-9]+)[\s\u3000]*\.[\s\u3000]*(.+?)(?=\n|$)',  # 1. 标题
-        ]
-        
-        self.english_chapter_patterns = [
-            r'Chapter\s+(\d+)[\s:]*(.+?)(?=\n|$)',  # Chapter X: Title
-            r'CHAPTER\s+(\d+)[\s:]*(.+?)(?=\n|$)',  # CHAPTER X: Title
-            r'Ch\.?\s*(\d+)[\s:]*(.+?)(?=\n|$)',  # Ch. X: Title
-            r'(\d+)\.?\s+(.+?)(?=\n|$)',  # 1. Title
-            r'(Prologue|Epilogue|Preface|Afterword)[\s:]*(.*)(?=\n|$)',  # 特殊章节
-        ]
+        self.chinese_chapter_patterns = [pattern for _, pattern in self.CHINESE_CHAPTER_RULES]
+        self.english_chapter_patterns = [pattern for _, pattern in self.ENGLISH_CHAPTER_RULES]
+        self.unwanted_patterns = list(self.UNWANTED_PATTERNS)
     
     def detect_language(self, text: str) -> Language:
         """检测文本语言"""
@@ -158,24 +292,10 @@ class NovelImporter:
     def clean_content(self, text: str, language: Language) -> str:
         """清理文本内容"""
         # 移除HTML标签
-        text = re.sub(r'<[^>]+>', '', text)
+        text = self._HTML_TAG_RE.sub('', text)
         
-        # 移除常见的无用内容
-        unwanted_patterns = [
-            r'</p>',
-            r'更多电子书请访问.*',
-            r'爱下电子书.*',
-            r'简体:https?://.*',
-            r'繁体:https?://.*',
-            r'E-mail:.*',
-            r'------.*?-------',
-            r'『.*?连载中.*?』',
-            r'www\..*\.com',
-            r'http[s]?://.*',
-        ]
-        
-        for pattern in unwanted_patterns:
-            text = re.sub(pattern, '', text, flags=re.IGNORECASE)
+        # 移除常见的无用内容（所有规则合并为一次扫描）
+        text = self._UNWANTED_RE.sub('', text)
         
         # 移除多余的空行
         text = re.sub(r'\n{3,}', '\n\n', text)
@@ -186,17 +306,33 @@ class NovelImporter:
         
         return text.strip()
     
+    def clean_line(self, line: str) -> str:
+        """清理单行文本（流式处理使用，效果与clean_content逐行一致）"""
+        line = self._HTML_TAG_RE.sub('', line)
+        return self._UNWANTED_RE.sub('', line).strip()
+    
     def split_chapters(self, content: str, language: Language) -> List[ChapterInfo]:
         """分割章节"""
-        chapters = []
-        
-        # 根据语言选择对应的模式
+        return list(self.iter_chapters(content.split('\n'), language))
+    
+    def match_chapter_heading(self, line: str, language: Language) -> Optional[str]:
+        """判断一行（已去除首尾空白）是否为章节标题，返回命中的规则名称"""
+        if not line:
+            return None
+        first = line[0]
         if language == Language.CHINESE:
-            patterns = self.chinese_chapter_patterns
+            if first not in self._CHINESE_HEADING_PREFIXES:
+                return None
+            match = self._CHINESE_HEADING_RE.match(line)
         else:
-            patterns = self.english_chapter_patterns
-        
-        lines = content.split('\n')
+            if first not in self._ENGLISH_HEADING_PREFIXES and not first.isdecimal():
+                return None
+            match = self._ENGLISH_HEADING_RE.match(line)
+        return match.lastgroup if match else None
+    
+    def iter_chapters(self, lines: Iterable[str], language: Language) -> Iterator[ChapterInfo]:
+        """逐行识别章节边界，每完成一章就产出一个ChapterInfo"""
+        chapter_count = 0
         current_chapter = None
         current_content = []
         
@@ -206,25 +342,22 @@ class NovelImporter:
                 continue
             
             # 检查是否是章节标题
-            is_chapter_title = False
-            for pattern in patterns:
-                match = re.match(pattern, line, re.IGNORECASE)
-                if match:
-                    # 保存上一章节
-                    if current_chapter:
-                        content_text = '\n'.join(current_content).strip()
-                        if content_text:  # 只有内容不为空才添加
-                            chapters.append(ChapterInfo(
-                                title=current_chapter,
-                                content=content_text,
-                                chapter_number=len(chapters) + 1
-                            ))
-                    
-                    # 开始新章节
-                    current_chapter = line
-                    current_content = []
-                    is_chapter_title = True
-                    break
+            is_chapter_title = self.match_chapter_heading(line, language) is not None
+            if is_chapter_title:
+                # 保存上一章节
+                if current_chapter:
+                    content_text = '\n'.join(current_content).strip()
+                    if content_text:  # 只有内容不为空才添加
+                        chapter_count += 1
+                        yield ChapterInfo(
+                            title=current_chapter,
+                            content=content_text,
+                            chapter_number=chapter_count
+                        )
+                
+                # 开始新章节
+                current_chapter = line
+                current_content = []
             
             # 如果不是章节标题且有当前章节，则添加到内容中
             if not is_chapter_title and current_chapter:
@@ -240,13 +373,12 @@ class NovelImporter:
         if current_chapter and current_content:
             content_text = '\n'.join(current_content).strip()
             if content_text:
-                chapters.append(ChapterInfo(
+                chapter_count += 1
+                yield ChapterInfo(
                     title=current_chapter,
                     content=content_text,
-                    chapter_number=len(chapters) + 1
-                ))
-        
-        return chapters
+                    chapter_number=chapter_count
+                )
     
     def validate_chapters(self, chapters: List[ChapterInfo]) -> List[str]:
         """验证章节数据"""
@@ -257,38 +389,51 @@ class NovelImporter:
             return issues
         
         for i, chapter in enumerate(chapters):
-            # 检查章节标题
-            if not chapter.title or len(chapter.title.strip()) == 0:
-                issues.append(f"第{i+1}章缺少标题")
-            
-            # 检查章节内容长度
-            if not chapter.content or len(chapter.content.strip()) < 50:
-                issues.append(f"第{i+1}章({chapter.title})内容过短")
-            
-            # 检查内容是否过长（可能是分章失败）
-            if len(chapter.content) > 50000:  # 5万字符
-                issues.append(f"第{i+1}章({chapter.title})内容过长，可能需要进一步分割")
+            issues.extend(self.validate_chapter(i, chapter))
+        
+        return issues
+    
+    def validate_chapter(self, index: int, chapter: ChapterInfo) -> List[str]:
+        """验证单个章节（index从0开始）"""
+        issues = []
+        
+        # 检查章节标题
+        if not chapter.title or len(chapter.title.strip()) == 0:
+            issues.append(f"第{index+1}章缺少标题")
+        
+        # 检查章节内容长度
+        if not chapter.content or len(chapter.content.strip()) < 50:
+            issues.append(f"第{index+1}章({chapter.title})内容过短")
+        
+        # 检查内容是否过长（可能是分章失败）
+        if len(chapter.content) > 50000:  # 5万字符
+            issues.append(f"第{index+1}章({chapter.title})内容过长，可能需要进一步分割")
         
         return issues
     
     def process_novel_file(self, file_path: str, encoding: str = 'utf-8') -> Tuple[NovelInfo, List[str]]:
         """处理小说文件"""
+        # 只读取一次原始字节，先用样本判断编码再整体解码
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        try:
+            guess = sniff_encoding(data, encoding)
+        except ValueError:
+            raise ValueError(f"无法读取文件 {file_path}，请检查文件编码")
         try:
-            # 读取文件
-            with open(file_path, 'r', encoding=encoding) as f:
-                content = f.read()
+            content = data.decode(guess.encoding)
         except UnicodeDecodeError:
-            # 尝试其他编码
-            for enc in ['gbk', 'gb2312', 'utf-8-sig']:
+            # 样本之外出现非法字节，在内存中改用其他候选编码，无需重新读取文件
+            for enc in CANDIDATE_ENCODINGS:
                 try:
-                    with open(file_path, 'r', encoding=enc) as f:
-                        content = f.read()
-                        encoding = enc
-                        break
+                    content = data.decode(enc)
+                    guess = EncodingGuess(enc, 0.5)
+                    break
                 except UnicodeDecodeError:
                     continue
             else:
                 raise ValueError(f"无法读取文件 {file_path}，请检查文件编码")
+        del data
         
         # 检测语言
         language = self.detect_language(content)
@@ -312,13 +457,135 @@ class NovelImporter:
             description=metadata.get('description', '暂无描述'),
             language=language,
             category=metadata.get('category', '其他'),
-            chapters=chapters
+            chapters=chapters,
+            encoding=guess.encoding,
+            encoding_confidence=guess.confidence
         )
         
         return novel_info, issues
     
-    def translate_novel_simple(self, novel_info: NovelInfo, custom_prompt: str = None, prompt_type: str = "novel_general") -> NovelInfo:
-        """简单免费翻译小说（使用Google翻译免费版）"""
+    def stream_novel_file(self, file_path: str, encoding: str = 'utf-8') -> Tuple[NovelInfo, Iterator[ChapterInfo]]:
+        """流式处理小说文件
+        返回不含章节的NovelInfo和章节生成器；生成器逐行读取、清理并切分章节，
+        内存占用只与单个章节大小有关，与文件大小无关。
+        """
+        try:
+            guess = sniff_file_encoding(file_path, encoding)
+        except ValueError:
+            raise ValueError(f"无法读取文件 {file_path}，请检查文件编码")
+        encoding = guess.encoding
+        if codecs.lookup(encoding).name == 'gbk':
+            # 只检查了样本，样本之外可能出现GB18030才有的字符；gb18030兼容gbk
+            encoding = 'gb18030'
+        
+        # 语言和元数据只需要文件开头部分
+        with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+            head = f.read(self.HEAD_SAMPLE_CHARS)
+        language = self.detect_language(head)
+        metadata = self.extract_novel_metadata(head)
+        
+        novel_info = NovelInfo(
+            title=metadata.get('title', '未知标题'),
+            author=metadata.get('author', '未知作者'),
+            description=metadata.get('description', '暂无描述'),
+            language=language,
+            category=metadata.get('category', '其他'),
+            chapters=[],
+            encoding=encoding,
+            encoding_confidence=guess.confidence
+        )
+        
+        def decoded_lines(f):
+            # 样本之外的非法字节替换为U+FFFD并计数，不中断已经开始的导入
+            for line in f:
+                if '\ufffd' in line:
+                    novel_info.decode_errors += line.count('\ufffd')
+                yield line
+        
+        def chapters() -> Iterator[ChapterInfo]:
+            with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+                cleaned_lines = (self.clean_line(line) for line in decoded_lines(f))
+                yield from self.iter_chapters((line for line in cleaned_lines if line), language)
+            if novel_info.decode_errors:
+                print(f"{file_path} 中有 {novel_info.decode_errors} 个字符无法按 {encoding} 解码，已替换")
+        
+        return novel_info, chapters()
+    
+    def analyze_to_staging(self, file_path: str, writer, extra: Optional[Dict] = None) -> Dict:
+        """流式解析小说，章节逐个写入暂存区（StagingWriter）并提交，返回预览数据（包含issues）"""
+        novel_info, chapters = self.stream_novel_file(file_path)
+        
+        chapter_count = 0
+        total_words = 0
+        estimated_tokens = 0
+        first_chapters = []
+        issues = []
+        term_extractor = TermExtractor() if novel_info.language == Language.CHINESE else None
+        for chapter in chapters:
+            writer.add_chapter({
+                'title': chapter.title,
+                'content': chapter.content,
+                'chapter_number': chapter.chapter_number
+            })
+            issues.extend(self.validate_chapter(chapter_count, chapter))
+            if len(first_chapters) < 5:  # 预览前5章
+                first_chapters.append({
+                    'title': chapter.title,
+                    'content_preview': chapter.content[:200] + '...' if len(chapter.content) > 200 else chapter.content,
+                    'word_count': len(chapter.content)
+                })
+            chapter_count += 1
+            total_words += len(chapter.content)
+            # 按翻译时的分段方式估算token，用于估算翻译费用
+            estimated_tokens += estimate_tokens(chapter.title) + sum(
+                chunk.tokens for chunk in chunk_text(chapter.content))
+            # 同一次遍历中统计候选术语
+            if term_extractor is not None:
+                term_extractor.feed(chapter.content)
+        
+        if chapter_count == 0:
+            issues.append("未检测到任何章节")
+        if novel_info.decode_errors:
+            issues.append(f"有 {novel_info.decode_errors} 个字符无法按 {novel_info.encoding} 解码，已替换为�")
+        
+        header = {
+            'novel_info': {
+                'title': novel_info.title,
+                'author': novel_info.author,
+                'description': novel_info.description,
+                'language': novel_info.language.value,
+                'category': novel_info.category,
+            },
+            'encoding': novel_info.encoding,
+            'chapter_count': chapter_count,
+            'estimated_tokens': estimated_tokens,
+            'term_candidates': term_extractor.candidates() if term_extractor is not None else [],
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        preview = {
+            'title': novel_info.title,
+            'author': novel_info.author,
+            'description': novel_info.description,
+            'language': novel_info.language.value,
+            'encoding': novel_info.encoding,
+            'encoding_confidence': novel_info.encoding_confidence,
+            'chapter_count': chapter_count,
+            'total_words': total_words,
+            'estimated_tokens': estimated_tokens,
+            'first_chapters': first_chapters,
+            'issues': issues
+        }
+        # 预览数据也保存在头部，后台解析完成后通过条目ID读取
+        header['preview'] = preview
+        header.update(extra or {})
+        writer.commit(header)
+        return preview
+    
+    def translate_novel_simple(self, novel_info: NovelInfo, custom_prompt: str = None, prompt_type: str = "novel_general",
+                               glossary: Optional[Dict[str, str]] = None) -> NovelInfo:
+        """简单免费翻译小说（使用Google翻译免费版）
+        glossary为已确认的术语译名，使用自定义提示词时只附加当前分段中出现的术语。
+        """
         if novel_info.language != Language.CHINESE:
             return novel_info
             
@@ -361,65 +628,94 @@ class NovelImporter:
             except:
                 translated_description = novel_info.description
             
-            # 翻译章节
+            # 翻译章节：标题和每个内容分段都是独立请求，并发执行（受速率限制），结果按原顺序拼回
+            from translation_executor import TranslationExecutor
+            from translation_memory import get_translation_memory, make_key, MemoryUsage
+            executor = TranslationExecutor.from_config(os.environ)
+            memory = get_translation_memory()
+            usage = MemoryUsage()
+            local = threading.local()
+            matcher = GlossaryMatcher(glossary or {})
+            
+            def request_prompt(request):
+                return matcher.build_prompt(custom_prompt, request[2]) if custom_prompt else None
+            
+            def memory_key(request):
+                _, label, text = request
+                # 使用自定义提示词时标签也是请求内容的一部分
+                prompt = request_prompt(request)
+                return make_key(text, f"{prompt}\n{label}" if prompt else None, 'googletrans:zh-cn>en')
+            
+            def translate_request(request):
+                translated = call_translator(request)
+                if memory is not None:
+                    memory.store(memory_key(request), translated)
+                return translated
+            
+            def call_translator(request):
+                _, label, text = request
+                # googletrans的Translator不是线程安全的，每个线程使用独立实例
+                if not hasattr(local, 'translator'):
+                    local.translator = Translator()
+                prompt = request_prompt(request)
+                if prompt:
+                    result = local.translator.translate(f"{prompt}\n\n{label}: {text}", src='zh-cn', dest='en')
+                    return result.text.replace(prompt, "").strip()
+                return local.translator.translate(text, src='zh-cn', dest='en').text
+            
+            def keep_original(request, error):
+                print(f"翻译第{request[0]+1}章失败: {error}")
+                return request[2]  # 失败时保持原文
+            
+            # 按段落和句子打包分段，避免在句子中间截断；googletrans没有system角色，
+            # 提示词只能随每个请求发送，因此从分段预算中扣除提示词的token
+            budget = DEFAULT_MAX_TOKENS - (estimate_tokens(custom_prompt) if custom_prompt else 0)
+            requests = []
+            chapter_chunks = []
+            for i, chapter in enumerate(novel_info.chapters):
+                requests.append((i, "请翻译章节标题", chapter.title))
+                chunks = chunk_text(chapter.content, max(200, budget))
+                chapter_chunks.append(chunks)
+                for chunk in chunks:
+                    if chunk.text.strip():  # 空行不需要翻译
+                        requests.append((i, "请翻译", chunk.text))
+            
+            # 先查翻译记忆，只把未命中的请求交给翻译服务
+            results = [None] * len(requests)
+            misses = []
+            for position, request in enumerate(requests):
+                cached = memory.lookup(memory_key(request)) if memory is not None else None
+                if cached is None:
+                    usage.record_miss()
+                    misses.append(position)
+                else:
+                    usage.record_hit(cached[1])
+                    results[position] = cached[0]
+            
+            print(f"共{len(novel_info.chapters)}章，{len(requests)}个翻译请求，翻译记忆命中{usage.hits}个，最多{executor.max_in_flight}个并发")
+            translated = executor.map(translate_request, [requests[p] for p in misses], on_error=keep_original)
+            for position, text in zip(misses, translated):
+                results[position] = text
+            
+            titles = {}
+            contents = {}
+            for (i, label, _), text in zip(requests, results):
+                if label == "请翻译章节标题":
+                    titles[i] = text
+                else:
+                    contents.setdefault(i, []).append(text)
+            
             translated_chapters = []
             for i, chapter in enumerate(novel_info.chapters):
-                print(f"翻译第{i+1}/{len(novel_info.chapters)}章...")
-                try:
-                    # 翻译标题
-                    if custom_prompt:
-                        title_with_prompt = f"{custom_prompt}\n\n请翻译章节标题: {chapter.title}"
-                        title_trans = translator.translate(title_with_prompt, src='zh-cn', dest='en')
-                        translated_title = title_trans.text.replace(custom_prompt, "").strip()
-                    else:
-                        title_trans = translator.translate(chapter.title, src='zh-cn', dest='en')
-                        translated_title = title_trans.text
-                    
-                    # 分段翻译内容（避免内容过长）
-                    content = chapter.content
-                    if len(content) > 800:  # 为提示词预留空间，减少单次翻译长度
-                        # 分成多段
-                        chunk_size = 800 if custom_prompt else 1000
-                        chunks = [content[j:j+chunk_size] for j in range(0, len(content), chunk_size)]
-                        translated_chunks = []
-                        
-                        for chunk in chunks:
-                            try:
-                                if custom_prompt:
-                                    chunk_with_prompt = f"{custom_prompt}\n\n请翻译: {chunk}"
-                                    chunk_trans = translator.translate(chunk_with_prompt, src='zh-cn', dest='en')
-                                    translated_chunk = chunk_trans.text.replace(custom_prompt, "").strip()
-                                else:
-                                    chunk_trans = translator.translate(chunk, src='zh-cn', dest='en')
-                                    translated_chunk = chunk_trans.text
-                                translated_chunks.append(translated_chunk)
-                            except:
-                                translated_chunks.append(chunk)  # 失败时保持原文
-                                
-                        translated_content = ' '.join(translated_chunks)
-                    else:
-                        if custom_prompt:
-                            content_with_prompt = f"{custom_prompt}\n\n请翻译: {content}"
-                            content_trans = translator.translate(content_with_prompt, src='zh-cn', dest='en')
-                            translated_content = content_trans.text.replace(custom_prompt, "").strip()
-                        else:
-                            content_trans = translator.translate(content, src='zh-cn', dest='en')
-                            translated_content = content_trans.text
-                    
-                    translated_chapters.append(ChapterInfo(
-                        title=translated_title,
-                        content=translated_content,
-                        chapter_number=chapter.chapter_number
-                    ))
-                    
-                    # 避免请求过快
-                    import time
-                    time.sleep(0.5)  # 每次翻译间隔0.5秒
-                    
-                except Exception as e:
-                    print(f"翻译第{i+1}章失败: {e}")
-                    # 翻译失败时保持原文
-                    translated_chapters.append(chapter)
+                chunks = chapter_chunks[i]
+                texts = iter(contents.get(i, []))
+                chunk_texts = [next(texts) if chunk.text.strip() else chunk.text for chunk in chunks]
+                translated_chapters.append(ChapterInfo(
+                    title=titles[i],
+                    # 按原段落结构拼回，同一段落内的分段之间用空格连接
+                    content=join_chunks(chunk_texts, chunks, sentence_separator=' '),
+                    chapter_number=chapter.chapter_number
+                ))
             
             print("翻译完成!")
             return NovelInfo(
@@ -460,6 +756,8 @@ class NovelImporter:
             'author': novel_info.author,
             'description': novel_info.description,
             'language': novel_info.language.value,
+            'encoding': novel_info.encoding,
+            'encoding_confidence': novel_info.encoding_confidence,
             'chapter_count': len(novel_info.chapters),
             'total_words': sum(len(ch.content) for ch in novel_info.chapters),
             'first_chapters': [
@@ -473,41 +771,59 @@ class NovelImporter:
         }
 
 
+class ReferenceNovelImporter(NovelImporter):
+    """逐条规则调用re.match/re.sub的旧实现，只用于验证预编译匹配器的结果一致性和基准测试"""
+    
+    def match_chapter_heading(self, line: str, language: Language) -> Optional[str]:
+        if language == Language.CHINESE:
+            patterns = self.chinese_chapter_patterns
+        else:
+            patterns = self.english_chapter_patterns
+        for pattern in patterns:
+            if re.match(pattern, line, re.IGNORECASE):
+                return pattern
+        return None
+    
+    def clean_content(self, text: str, language: Language) -> str:
+        text = re.sub(r'<[^>]+>', '', text)
+        for pattern in self.unwanted_patterns:
+            text = re.sub(pattern, '', text, flags=re.IGNORECASE)
+        text = re.sub(r'\n{3,}', '\n\n', text)
+        lines = [line.strip() for line in text.split('\n')]
+        text = '\n'.join(line for line in lines if line)
+        return text.strip()
+
+
 class DatabaseImporter:
     """数据库导入器"""
     
     def __init__(self, db_session):
         self.db = db_session
     
-    def import_novel_to_database(self, novel_info: NovelInfo, cover_image: str = None) -> int:
-        """将小说数据导入到数据库"""
-        from models import Novel, Chapter
-        
-        # 创建小说记录
-        novel = Novel(
-            title=novel_info.title,
-            author=novel_info.author,
-            description=novel_info.description,
-            cover_image=cover_image or 'cover_fantasy.jpg',
-            category=self._map_category(novel_info.category, novel_info.language)
-        )
-        
-        self.db.session.add(novel)
-        self.db.session.flush()  # 获取novel.id
-        
-        # 批量创建章节记录
-        chapters_to_add = []
-        for chapter_info in novel_info.chapters:
-            chapter = Chapter(
-                novel_id=novel.id,
-                title=chapter_info.title,
-                content=chapter_info.content
-            )
-            chapters_to_add.append(chapter)
-        
-        # 批量插入章节
-        self.db.session.add_all(chapters_to_add)
+    def import_novel_to_database(self, novel_info: NovelInfo, cover_image: str = None, force_new: bool = False) -> int:
+        """将小说数据导入到数据库；同一本小说已导入过时只追加新章节（force_new为True时总是新建）"""
+        from models import Novel
+        from fingerprint import import_chapters
+        from search_index import novel_search
+        from page_cache import page_cache
+        
+        # 已导入过的小说只追加新章节，否则创建小说记录
+        novel = import_chapters(
+            lambda: Novel(
+                title=novel_info.title,
+                author=novel_info.author,
+                description=novel_info.description,
+                cover_image=cover_image or 'cover_fantasy.jpg',
+                category=self._map_category(novel_info.category, novel_info.language)
+            ),
+            novel_info.title, novel_info.author,
+            ((ch.title, ch.content) for ch in novel_info.chapters),
+            force_new=force_new, session=self.db.session
+        ).novel
+        novel.refresh_chapter_stats()
+        novel_search.reindex_novel(novel)
         self.db.session.commit()
+        page_cache.invalidate_novel(novel.id)
         
         return novel.id
     
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+页面缓存模块
+缓存公开页面的渲染结果，后台修改数据时按标签精确失效。
+一级缓存为进程内LRU（按字节数限制容量），失效用的标签版本号默认保存在instance目录下的文件中，
+所有gunicorn worker和CLI命令共享；可选的二级缓存为共享的文件系统或Redis，多个worker之间同时共享页面数据。
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from flask import request, session, make_response
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+
+@dataclass
+class CachedPage:
+    """缓存的页面"""
+    body: bytes
+    mimetype: str
+    tag_versions: Tuple[Tuple[str, int], ...]
+    expires_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + 256  # 额外计入对象本身的开销
+
+
+class LRUByteCache:
+    """按字节预算淘汰的进程内LRU缓存"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[str, CachedPage]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedPage):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.size
+            self._entries[key] = entry
+            self.current_bytes += entry.size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileTagStore:
+    """保存在文件中的标签版本号，同一台机器上的所有进程（gunicorn worker、CLI命令、后台线程）共享"""
+
+    def __init__(self, tag_dir: str):
+        self.tag_dir = tag_dir
+        os.makedirs(tag_dir, exist_ok=True)
+
+    def _path(self, tag: str) -> str:
+        return os.path.join(self.tag_dir, hashlib.sha1(tag.encode('utf-8')).hexdigest())
+
+    def get_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        versions = {}
+        for tag in tags:
+            try:
+                with open(self._path(tag), 'r') as f:
+                    versions[tag] = int(f.read() or 0)
+            except (OSError, ValueError):
+                versions[tag] = 0
+        return versions
+
+    def bump(self, tags: Iterable[str]):
+        # 写入纳秒时间戳而不是读出再加一：多个进程同时失效时也保证版本号与之前读到的不同
+        version = str(time.time_ns()).encode('ascii')
+        for tag in tags:
+            path = self._path(tag)
+            fd, temp_path = tempfile.mkstemp(dir=self.tag_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(version)
+            os.replace(temp_path, path)
+
+
+class FileSystemBackend:
+    """共享的文件系统缓存，同时保存标签版本号"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(os.path.join(cache_dir, 'pages'), exist_ok=True)
+        self.tags = FileTagStore(os.path.join(cache_dir, 'tags'))
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.cache_dir, kind, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _write(self, path: str, data: bytes):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        try:
+            with open(self._path('pages', key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def set(self, key: str, entry: CachedPage):
+        try:
+            self._write(self._path('pages', key), pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError as e:
+            print(f"页面缓存写入失败: {e}")
+
+    def get_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        return self.tags.get_versions(tags)
+
+    def bump(self, tags: Iterable[str]):
+        self.tags.bump(tags)
+
+    def clear(self):
+        for name in os.listdir(os.path.join(self.cache_dir, 'pages')):
+            try:
+                os.remove(os.path.join(self.cache_dir, 'pages', name))
+            except OSError:
+                pass
+
+
+class RedisBackend:
+    """共享的Redis缓存（需要安装redis包）"""
+
+    def __init__(self, url: str, prefix: str = 'page_cache:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        data = self.client.get(self.prefix + 'page:' + key)
+        return pickle.loads(data) if data else None
+
+    def set(self, key: str, entry: CachedPage):
+        ttl = max(int(entry.expires_at - time.time()), 1)
+        self.client.set(self.prefix + 'page:' + key, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), ex=ttl)
+
+    def get_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        tags = list(tags)
+        if not tags:
+            return {}
+        values = self.client.mget([self.prefix + 'tag:' + tag for tag in tags])
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+
+    def bump(self, tags: Iterable[str]):
+        pipe = self.client.pipeline()
+        for tag in tags:
+            pipe.incr(self.prefix + 'tag:' + tag)
+        pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + 'page:*'):
+            self.client.delete(key)
+
+
+class PageCache:
+    """公开页面的响应缓存"""
+
+    def __init__(self, app=None):
+        self.memory: Optional[LRUByteCache] = None
+        self.shared = None
+        self.tags = None
+        self.enabled = False
+        self.ttl = 3600
+        self.stats_counters = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'stale': 0, 'bypass': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        app.config.setdefault('PAGE_CACHE_TTL', 3600)
+        app.config.setdefault('PAGE_CACHE_BACKEND', 'memory')  # memory / filesystem / redis
+        app.config.setdefault('PAGE_CACHE_DIR', os.path.join(app.instance_path, 'page_cache'))
+        app.config.setdefault('PAGE_CACHE_REDIS_URL', None)
+
+        self.enabled = bool(app.config['PAGE_CACHE_ENABLED'])
+        self.ttl = app.config['PAGE_CACHE_TTL']
+        self.memory = LRUByteCache(app.config['PAGE_CACHE_MAX_BYTES'])
+
+        backend = app.config['PAGE_CACHE_BACKEND']
+        if backend == 'filesystem':
+            self.shared = FileSystemBackend(app.config['PAGE_CACHE_DIR'])
+        elif backend == 'redis':
+            try:
+                self.shared = RedisBackend(app.config['PAGE_CACHE_REDIS_URL'])
+            except ImportError:
+                print("redis未安装，页面缓存仅使用进程内缓存")
+        # 标签版本号始终放在进程间共享的位置（共享后端或instance目录下的文件），
+        # 保证任一worker或CLI命令的修改能让所有worker的缓存同时失效
+        self.tags = self.shared or FileTagStore(os.path.join(app.config['PAGE_CACHE_DIR'], 'tags'))
+        app.extensions['page_cache'] = self
+
+    def _cache_key(self, view_args) -> str:
+        args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        view = '&'.join(f'{k}={v}' for k, v in sorted(view_args.items()))
+        login_state = 'auth' if current_user.is_authenticated else 'anon'
+        return f'{request.endpoint}|{view}|{args}|{login_state}'
+
+    def _is_fresh(self, entry: CachedPage) -> bool:
+        if entry.expires_at < time.time():
+            return False
+        tag_names = [tag for tag, _ in entry.tag_versions]
+        return self.tags.get_versions(tag_names) == dict(entry.tag_versions)
+
+    def _lookup(self, key: str) -> Optional[CachedPage]:
+        entry = self.memory.get(key)
+        if entry is not None:
+            if self._is_fresh(entry):
+                self.stats_counters['hits'] += 1
+                return entry
+            self.memory.delete(key)
+            self.stats_counters['stale'] += 1
+        if self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None and self._is_fresh(entry):
+                self.stats_counters['shared_hits'] += 1
+                self.memory.set(key, entry)
+                return entry
+        self.stats_counters['misses'] += 1
+        return None
+
+    def cached(self, tags: Callable[..., Iterable[str]]):
+        """缓存视图的渲染结果
+        tags接收视图参数并返回该页面依赖的标签，调用invalidate时对应页面失效。
+        只缓存未登录访客的GET请求（登录用户的页面含有CSRF令牌等个人数据）。
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if (not self.enabled or request.method != 'GET'
+                        or current_user.is_authenticated or '_flashes' in session):
+                    self.stats_counters['bypass'] += 1
+                    return view(*args, **kwargs)
+
+                key = self._cache_key(kwargs)
+                entry = self._lookup(key)
+                if entry is not None:
+                    response = make_response(entry.body)
+                    response.mimetype = entry.mimetype
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                # 先读取版本号再渲染，渲染期间发生的修改会让这份缓存直接过期
+                tag_versions = tuple(sorted(self.tags.get_versions(tags(**kwargs)).items()))
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    entry = CachedPage(
+                        body=response.get_data(),
+                        mimetype=response.mimetype,
+                        tag_versions=tag_versions,
+                        expires_at=time.time() + self.ttl
+                    )
+                    self.memory.set(key, entry)
+                    if self.shared is not None:
+                        self.shared.set(key, entry)
+                    response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def tag_version(self, tags: Iterable[str]) -> str:
+        """标签版本号的摘要，供条件请求的ETag使用：任一标签失效后摘要都会变化"""
+        versions = self.tags.get_versions(tags)
+        joined = '|'.join(f'{tag}={versions[tag]}' for tag in sorted(versions))
+        return hashlib.sha1(joined.encode('utf-8')).hexdigest()[:12]
+
+    def invalidate(self, *tags: str):
+        """使依赖这些标签的页面失效"""
+        self.tags.bump(tags)
+
+    def invalidate_novel(self, novel_id: Optional[int] = None):
+        """小说或章节发生变化：列表页以及该小说的详情/章节页失效"""
+        tags = ['novels']
+        if novel_id is not None:
+            tags.append(f'novel:{novel_id}')
+        self.invalidate(*tags)
+
+    def clear(self):
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> Dict:
+        """命中/未命中/淘汰计数以及当前占用，用于调整容量"""
+        lookups = self.stats_counters['hits'] + self.stats_counters['shared_hits'] + self.stats_counters['misses']
+        return {
+            **self.stats_counters,
+            'evictions': self.memory.evictions,
+            'entries': len(self.memory),
+            'bytes': self.memory.current_bytes,
+            'max_bytes': self.memory.max_bytes,
+            'hit_rate': round((lookups - self.stats_counters['misses']) / lookups, 4) if lookups else 0.0,
+            'backend': type(self.shared).__name__ if self.shared is not None else 'memory',
+        }
+
+
+def conditional_get(validator: Callable[..., Optional[Tuple[str, object]]]):
+    """为视图添加ETag/Last-Modified条件请求支持
+    validator接收视图参数，用轻量查询返回 (etag, last_modified)；
+    页面内容的变化没有对应时间戳时last_modified返回None，只用ETag校验。
+    客户端缓存仍然有效时直接返回304，不会渲染模板或读取正文。
+    只对未登录访客生效，登录用户的页面包含个人数据。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or current_user.is_authenticated or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            validators = validator(**kwargs)
+            if validators is None:
+                return view(*args, **kwargs)
+            etag, last_modified = validators
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.public = True
+            response.cache_control.no_cache = True  # 允许缓存，但每次都需要重新验证
+            return response
+        return wrapper
+    return decorator
+
+
+page_cache = PageCache()
@@ -0,0 +1,100 @@
+"""
+响应压缩
+在Flask-Compress的基础上，把带ETag响应的压缩结果缓存在进程内LRU中：热门章节页只在第一次访问时压缩，
+之后的访问（包括页面缓存命中和带ETag的静态文件）直接返回缓存的压缩数据。没有ETag的响应照常逐次压缩。
+缓存键是原文的哈希而不是ETag：应用的ETag是弱校验值，可能只覆盖部分内容，不能保证原文相同。
+SSE（如翻译进度推送）不会被缓冲或压缩。
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Dict
+
+from flask import g, request
+from flask_compress import Compress
+
+from page_cache import LRUByteCache
+
+
+# Flask-Compress在压缩后的ETag末尾加上":算法"
+_ETAG_SUFFIX_RE = re.compile(r':(br|gzip|deflate|zstd)"')
+
+
+@dataclass
+class CompressedBody:
+    """缓存的压缩结果"""
+    body: bytes
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + 128
+
+
+class CachedCompress(Compress):
+    """按原文哈希缓存压缩结果的Flask-Compress"""
+
+    def __init__(self, app=None):
+        self.bodies = LRUByteCache(0)
+        self.stats_counters = {'hits': 0, 'misses': 0, 'uncached': 0}
+        super().__init__(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ALGORITHM', ['br', 'gzip'])
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_BODY_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+        super().init_app(app)
+        self.bodies = LRUByteCache(app.config['COMPRESS_BODY_CACHE_MAX_BYTES'])
+        app.before_request(self._strip_etag_suffix)
+        app.extensions['compress'] = self
+
+    @staticmethod
+    def _strip_etag_suffix():
+        """条件请求带回的是加了压缩后缀的ETag，去掉后缀再交给视图比较，否则压缩过的页面永远不会返回304"""
+        header = request.environ.get('HTTP_IF_NONE_MATCH')
+        if header:
+            match = _ETAG_SUFFIX_RE.search(header)
+            if match:
+                g.compressed_etag_suffix = match.group(1)
+                request.environ['HTTP_IF_NONE_MATCH'] = _ETAG_SUFFIX_RE.sub('"', header)
+
+    def after_request(self, response):
+        # SSE需要逐条发送，不能缓冲后整体压缩
+        if response.mimetype == 'text/event-stream':
+            return response
+        suffix = g.get('compressed_etag_suffix')
+        etag = response.headers.get('ETag')
+        if response.status_code == 304 and suffix and etag:
+            # 304没有正文不会经过压缩，ETag与客户端缓存的压缩版本保持一致
+            response.headers['ETag'] = f'{etag[:-1]}:{suffix}"'
+            response.vary.add('Accept-Encoding')
+            return response
+        return super().after_request(response)
+
+    def compress(self, app, response, algorithm):
+        etag = response.headers.get('ETag')
+        if not etag:
+            self.stats_counters['uncached'] += 1
+            return super().compress(app, response, algorithm)
+        # 哈希比压缩快得多；ETag只用来判断响应是否值得缓存
+        digest = hashlib.blake2b(response.get_data(), digest_size=16).hexdigest()
+        key = f'{algorithm};{digest}'
+        cached = self.bodies.get(key)
+        if cached is not None:
+            self.stats_counters['hits'] += 1
+            return cached.body
+        self.stats_counters['misses'] += 1
+        body = super().compress(app, response, algorithm)
+        self.bodies.set(key, CompressedBody(body))
+        return body
+
+    def stats(self) -> Dict:
+        return {
+            **self.stats_counters,
+            'entries': len(self.bodies),
+            'bytes': self.bodies.current_bytes,
+            'max_bytes': self.bodies.max_bytes,
+        }
+
+
+compress = CachedCompress()
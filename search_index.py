@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+小说全文检索模块
+SQLite使用FTS5虚拟表，PostgreSQL使用tsvector + GIN索引，
+其他数据库回退到LIKE模糊匹配。
+中文按二元分词（bigram）建立索引，保证中文标题可以被检索到。
+"""
+
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import text
+
+from models import db, Novel, Chapter
+
+
+CJK_RUN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+# 各字段的权重：标题 > 作者 > 分类 > 简介
+NOVEL_FIELD_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+# 章节命中的相关度折扣（章节正文命中排在小说本身命中之后）
+CHAPTER_HIT_FACTOR = 0.3
+
+
+def _split_runs(value: str) -> List[Tuple[str, bool]]:
+    """把文本拆成 (片段, 是否为中文) 列表"""
+    value = CJK_RUN_RE.sub(lambda m: f' {m.group(0)} ', (value or '').lower())
+    return [(token, bool(CJK_RUN_RE.fullmatch(token))) for token in TOKEN_RE.findall(value)]
+
+
+def tokenize_for_index(value: str) -> str:
+    """生成写入索引的分词文本
+    中文连续片段拆成重叠的二元组，并追加最后一个字，
+    这样单字查询可以通过前缀匹配命中任意位置的汉字。
+    """
+    tokens = []
+    for run, is_cjk in _split_runs(value):
+        if is_cjk and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return ' '.join(tokens)
+
+
+def tokenize_query(query: str) -> List[Tuple[List[str], bool]]:
+    """把搜索词拆成检索单元：(词元列表, 是否前缀匹配)
+    多字中文片段作为二元组短语，单字或英文单词做前缀匹配。
+    """
+    terms = []
+    for run, is_cjk in _split_runs(query):
+        if is_cjk and len(run) > 1:
+            terms.append(([run[i:i + 2] for i in range(len(run) - 1)], False))
+        else:
+            terms.append(([run], True))
+    return terms
+
+
+class LikeSearchBackend:
+    """回退方案：LIKE模糊匹配（无索引，仅用于不支持全文检索的数据库）"""
+
+    name = 'like'
+
+    def __init__(self, index_chapters: bool = False):
+        self.index_chapters = index_chapters
+
+    def create_schema(self):
+        pass
+
+    def index_novel(self, novel):
+        pass
+
+    def remove_novel(self, novel_id: int):
+        pass
+
+    def index_chapter(self, chapter):
+        pass
+
+    def remove_chapter(self, chapter_id: int):
+        pass
+
+    def reindex_novel_chapters(self, novel_id: int):
+        pass
+
+    def rebuild(self) -> int:
+        return Novel.query.count()
+
+    def search(self, query: str, page: int, per_page: int) -> Tuple[List[int], int]:
+        search_filter = db.or_(
+            Novel.title.contains(query),
+            Novel.author.contains(query),
+            Novel.description.contains(query),
+            Novel.category.contains(query)
+        )
+        pagination = db.session.query(Novel.id).filter(search_filter).order_by(Novel.id.desc()).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        return [row.id for row in pagination.items], pagination.total
+
+
+class SqliteFtsBackend(LikeSearchBackend):
+    """SQLite FTS5 全文检索"""
+
+    name = 'sqlite-fts5'
+
+    @staticmethod
+    def _table_exists(name: str) -> bool:
+        return db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': name}).first() is not None
+
+    def _populate_new_tables(self, tables: Iterable[str]):
+        """索引表第一次创建时立即建立索引，否则升级后已有的小说在重建索引前都搜索不到"""
+        missing = [name for name in tables if not self._table_exists(name)]
+        self._create_tables()
+        if missing:
+            count = self.rebuild()
+            print(f"已为新建的检索表 {', '.join(missing)} 建立索引（{count} 本小说）")
+
+    def create_schema(self):
+        tables = ['novel_fts', 'chapter_fts'] if self.index_chapters else ['novel_fts']
+        self._populate_new_tables(tables)
+
+    def _create_tables(self):
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS novel_fts "
+            "USING fts5(title, author, category, description, tokenize='unicode61')"
+        ))
+        if self.index_chapters:
+            db.session.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chapter_fts "
+                "USING fts5(title, content, novel_id UNINDEXED, tokenize='unicode61')"
+            ))
+        db.session.commit()
+
+    def index_novel(self, novel):
+        db.session.flush()
+        self.remove_novel(novel.id, include_chapters=False)
+        db.session.execute(text(
+            "INSERT INTO novel_fts(rowid, title, author, category, description) "
+            "VALUES (:id, :title, :author, :category, :description)"
+        ), {
+            'id': novel.id,
+            'title': tokenize_for_index(novel.title),
+            'author': tokenize_for_index(novel.author),
+            'category': tokenize_for_index(novel.category),
+            'description': tokenize_for_index(novel.description),
+        })
+
+    def remove_novel(self, novel_id: int, include_chapters: bool = True):
+        db.session.execute(text("DELETE FROM novel_fts WHERE rowid = :id"), {'id': novel_id})
+        if include_chapters and self.index_chapters:
+            db.session.execute(text("DELETE FROM chapter_fts WHERE novel_id = :id"), {'id': novel_id})
+
+    def index_chapter(self, chapter):
+        if not self.index_chapters:
+            return
+        db.session.flush()
+        self.remove_chapter(chapter.id)
+        self._insert_chapters([(chapter.id, chapter.novel_id, chapter.title, chapter.content, None, None)])
+
+    def remove_chapter(self, chapter_id: int):
+        if self.index_chapters:
+            db.session.execute(text("DELETE FROM chapter_fts WHERE rowid = :id"), {'id': chapter_id})
+
+    def reindex_novel_chapters(self, novel_id: int):
+        if not self.index_chapters:
+            return
+        db.session.flush()
+        db.session.execute(text("DELETE FROM chapter_fts WHERE novel_id = :id"), {'id': novel_id})
+        rows = db.session.query(Chapter.id, Chapter.novel_id, Chapter.title, *Chapter.content_columns()).filter(
+            Chapter.novel_id == novel_id
+        ).yield_per(200)
+        self._insert_chapters(rows)
+
+    def _insert_chapters(self, rows: Iterable, batch_size: int = 200):
+        statement = text(
+            "INSERT INTO chapter_fts(rowid, title, content, novel_id) "
+            "VALUES (:id, :title, :content, :novel_id)"
+        )
+        batch = []
+        for chapter_id, novel_id, title, *stored in rows:
+            batch.append({
+                'id': chapter_id,
+                'novel_id': novel_id,
+                'title': tokenize_for_index(title),
+                'content': tokenize_for_index(Chapter.decode_content(*stored)),
+            })
+            if len(batch) >= batch_size:
+                db.session.execute(statement, batch)
+                batch = []
+        if batch:
+            db.session.execute(statement, batch)
+
+    def rebuild(self) -> int:
+        db.session.execute(text("DELETE FROM novel_fts"))
+        count = 0
+        for novel in Novel.query.order_by(Novel.id).yield_per(500):
+            self.index_novel(novel)
+            count += 1
+        if self.index_chapters:
+            db.session.execute(text("DELETE FROM chapter_fts"))
+            rows = db.session.query(Chapter.id, Chapter.novel_id, Chapter.title, *Chapter.content_columns()).yield_per(200)
+            self._insert_chapters(rows)
+        db.session.commit()
+        return count
+
+    @staticmethod
+    def _build_match(query: str) -> Optional[str]:
+        parts = []
+        for tokens, prefix in tokenize_query(query):
+            phrase = '"' + ' '.join(tokens) + '"'
+            parts.append(phrase + '*' if prefix else phrase)
+        return ' AND '.join(parts) if parts else None
+
+    def search(self, query: str, page: int, per_page: int) -> Tuple[List[int], int]:
+        match = self._build_match(query)
+        if not match:
+            return [], 0
+        weights = ', '.join(str(w) for w in NOVEL_FIELD_WEIGHTS)
+        hits = f"SELECT rowid AS novel_id, bm25(novel_fts, {weights}) AS score FROM novel_fts WHERE novel_fts MATCH :match"
+        if self.index_chapters:
+            hits += (
+                f" UNION ALL SELECT novel_id, bm25(chapter_fts, 2.0, 1.0) * {CHAPTER_HIT_FACTOR} AS score"
+                " FROM chapter_fts WHERE chapter_fts MATCH :match"
+            )
+        params = {'match': match, 'limit': per_page, 'offset': (max(page, 1) - 1) * per_page}
+        total = db.session.execute(text(
+            f"SELECT count(DISTINCT novel_id) FROM ({hits})"
+        ), params).scalar()
+        if self.index_chapters:
+            ranked = f"SELECT novel_id FROM ({hits}) GROUP BY novel_id ORDER BY min(score), novel_id DESC"
+        else:
+            # FTS5的辅助函数不能出现在被展开的聚合子查询中，单表时直接排序
+            ranked = f"{hits} ORDER BY score, novel_id DESC"
+        rows = db.session.execute(text(f"{ranked} LIMIT :limit OFFSET :offset"), params)
+        return [row.novel_id for row in rows], total
+
+
+class PostgresFtsBackend(SqliteFtsBackend):
+    """PostgreSQL tsvector + GIN 全文检索"""
+
+    name = 'postgres-tsvector'
+
+    @staticmethod
+    def _table_exists(name: str) -> bool:
+        return db.session.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}).scalar()
+
+    def create_schema(self):
+        tables = ['novel_search', 'chapter_search'] if self.index_chapters else ['novel_search']
+        self._populate_new_tables(tables)
+
+    def _create_tables(self):
+        db.session.execute(text(
+            "CREATE TABLE IF NOT EXISTS novel_search ("
+            "novel_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)"
+        ))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_novel_search_document ON novel_search USING GIN (document)"
+        ))
+        if self.index_chapters:
+            db.session.execute(text(
+                "CREATE TABLE IF NOT EXISTS chapter_search ("
+                "chapter_id INTEGER PRIMARY KEY, novel_id INTEGER NOT NULL, document TSVECTOR NOT NULL)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_chapter_search_document ON chapter_search USING GIN (document)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_chapter_search_novel ON chapter_search (novel_id)"
+            ))
+        db.session.commit()
+
+    def index_novel(self, novel):
+        db.session.flush()
+        db.session.execute(text(
+            "INSERT INTO novel_search(novel_id, document) VALUES (:id, "
+            "setweight(to_tsvector('simple', :title), 'A') || "
+            "setweight(to_tsvector('simple', :author), 'B') || "
+            "setweight(to_tsvector('simple', :category), 'C') || "
+            "setweight(to_tsvector('simple', :description), 'D')) "
+            "ON CONFLICT (novel_id) DO UPDATE SET document = EXCLUDED.document"
+        ), {
+            'id': novel.id,
+            'title': tokenize_for_index(novel.title),
+            'author': tokenize_for_index(novel.author),
+            'category': tokenize_for_index(novel.category),
+            'description': tokenize_for_index(novel.description),
+        })
+
+    def remove_novel(self, novel_id: int, include_chapters: bool = True):
+        db.session.execute(text("DELETE FROM novel_search WHERE novel_id = :id"), {'id': novel_id})
+        if include_chapters and self.index_chapters:
+            db.session.execute(text("DELETE FROM chapter_search WHERE novel_id = :id"), {'id': novel_id})
+
+    def remove_chapter(self, chapter_id: int):
+        if self.index_chapters:
+            db.session.execute(text("DELETE FROM chapter_search WHERE chapter_id = :id"), {'id': chapter_id})
+
+    def reindex_novel_chapters(self, novel_id: int):
+        if not self.index_chapters:
+            return
+        db.session.flush()
+        db.session.execute(text("DELETE FROM chapter_search WHERE novel_id = :id"), {'id': novel_id})
+        rows = db.session.query(Chapter.id, Chapter.novel_id, Chapter.title, *Chapter.content_columns()).filter(
+            Chapter.novel_id == novel_id
+        ).yield_per(200)
+        self._insert_chapters(rows)
+
+    def _insert_chapters(self, rows: Iterable, batch_size: int = 200):
+        statement = text(
+            "INSERT INTO chapter_search(chapter_id, novel_id, document) VALUES (:id, :novel_id, "
+            "setweight(to_tsvector('simple', :title), 'A') || setweight(to_tsvector('simple', :content), 'D')) "
+            "ON CONFLICT (chapter_id) DO UPDATE SET document = EXCLUDED.document"
+        )
+        batch = []
+        for chapter_id, novel_id, title, *stored in rows:
+            batch.append({
+                'id': chapter_id,
+                'novel_id': novel_id,
+                'title': tokenize_for_index(title),
+                'content': tokenize_for_index(Chapter.decode_content(*stored)),
+            })
+            if len(batch) >= batch_size:
+                db.session.execute(statement, batch)
+                batch = []
+        if batch:
+            db.session.execute(statement, batch)
+
+    def rebuild(self) -> int:
+        db.session.execute(text("TRUNCATE novel_search"))
+        count = 0
+        for novel in Novel.query.order_by(Novel.id).yield_per(500):
+            self.index_novel(novel)
+            count += 1
+        if self.index_chapters:
+            db.session.execute(text("TRUNCATE chapter_search"))
+            rows = db.session.query(Chapter.id, Chapter.novel_id, Chapter.title, *Chapter.content_columns()).yield_per(200)
+            self._insert_chapters(rows)
+        db.session.commit()
+        return count
+
+    @staticmethod
+    def _build_tsquery(query: str) -> Optional[str]:
+        parts = []
+        for tokens, prefix in tokenize_query(query):
+            if prefix:
+                parts.append(f"'{tokens[0]}':*")
+            else:
+                parts.append('(' + ' <-> '.join(f"'{token}'" for token in tokens) + ')')
+        return ' & '.join(parts) if parts else None
+
+    def search(self, query: str, page: int, per_page: int) -> Tuple[List[int], int]:
+        tsquery = self._build_tsquery(query)
+        if not tsquery:
+            return [], 0
+        hits = (
+            "SELECT novel_id, ts_rank_cd(document, q) AS score FROM novel_search, "
+            "to_tsquery('simple', :tsquery) AS q WHERE document @@ q"
+        )
+        if self.index_chapters:
+            hits += (
+                f" UNION ALL SELECT novel_id, ts_rank_cd(document, q) * {CHAPTER_HIT_FACTOR} AS score "
+                "FROM chapter_search, to_tsquery('simple', :tsquery) AS q WHERE document @@ q"
+            )
+        params = {'tsquery': tsquery, 'limit': per_page, 'offset': (max(page, 1) - 1) * per_page}
+        total = db.session.execute(text(
+            f"SELECT count(DISTINCT novel_id) FROM ({hits}) AS hits"
+        ), params).scalar()
+        rows = db.session.execute(text(
+            f"SELECT novel_id FROM ({hits}) AS hits GROUP BY novel_id ORDER BY max(score) DESC, novel_id DESC "
+            "LIMIT :limit OFFSET :offset"
+        ), params)
+        return [row.novel_id for row in rows], total
+
+
+def _sqlite_has_fts5() -> bool:
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)"))
+            conn.execute(text("DROP TABLE IF EXISTS temp.fts5_probe"))
+        return True
+    except Exception:
+        return False
+
+
+class NovelSearch:
+    """全文检索扩展，根据数据库类型自动选择后端"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_BACKEND', 'auto')  # auto / like
+        app.config.setdefault('SEARCH_INDEX_CHAPTERS', False)
+        app.extensions['novel_search'] = None
+
+    @property
+    def backend(self):
+        """当前应用的检索后端（首次访问时创建，需要在应用上下文中调用）"""
+        backend = current_app.extensions.get('novel_search')
+        if backend is None:
+            backend = self._create_backend()
+            backend.create_schema()
+            current_app.extensions['novel_search'] = backend
+        return backend
+
+    def _create_backend(self):
+        index_chapters = bool(current_app.config['SEARCH_INDEX_CHAPTERS'])
+        if current_app.config['SEARCH_BACKEND'] == 'like':
+            return LikeSearchBackend(index_chapters)
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite' and _sqlite_has_fts5():
+            return SqliteFtsBackend(index_chapters)
+        if dialect == 'postgresql':
+            return PostgresFtsBackend(index_chapters)
+        return LikeSearchBackend(index_chapters)
+
+    def index_novel(self, novel):
+        """新增或更新小说的索引（与业务数据在同一事务中提交）"""
+        self.backend.index_novel(novel)
+
+    def reindex_novel(self, novel):
+        """导入后重建小说及其章节的索引"""
+        self.backend.index_novel(novel)
+        self.backend.reindex_novel_chapters(novel.id)
+
+    def remove_novel(self, novel_id: int):
+        self.backend.remove_novel(novel_id)
+
+    def index_chapter(self, chapter):
+        self.backend.index_chapter(chapter)
+
+    def remove_chapter(self, chapter_id: int):
+        self.backend.remove_chapter(chapter_id)
+
+    def rebuild(self) -> int:
+        """重建全部索引，返回索引的小说数量"""
+        return self.backend.rebuild()
+
+    def search(self, query: str, page: int = 1, per_page: int = 12) -> Tuple[List[Novel], int]:
+        """按相关度返回 (当前页小说列表, 命中总数)"""
+        novel_ids, total = self.backend.search(query, page, per_page)
+        if not novel_ids:
+            return [], total
+        novels = {novel.id: novel for novel in Novel.query.filter(Novel.id.in_(novel_ids))}
+        return [novels[novel_id] for novel_id in novel_ids if novel_id in novels], total
+
+
+novel_search = NovelSearch()
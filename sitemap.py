@@ -0,0 +1,199 @@
+"""
+站点地图
+/sitemap.xml 是站点地图索引，下面按协议上限（每个文件5万个URL）分片：
+pages（首页、固定页面和分类）、novels-N（小说详情）、chapters-N（章节），
+小说和章节按ID区间分片，每个分片用一次按ID顺序的查询流式生成，lastmod取真实的updated_at。
+生成的分片缓存在instance目录，每个分片记录自己的签名（行数、最大ID、最大更新时间），
+请求时签名变化才重新生成，所以新增或修改一本小说/一个章节只会重建它所在的分片。
+"""
+
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from models import db, Novel, Chapter
+
+# 协议规定每个站点地图最多5万个URL
+SHARD_SIZE = 50000
+STATIC_PAGES = ('/about', '/contact', '/privacy-policy', '/terms-of-service')
+DEFAULT_CATEGORIES = ('Recommended',)
+
+_SHARD_RE = re.compile(r'(pages|novels-\d+|chapters-\d+)')
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_OPEN = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_OPEN = '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+
+
+def _lastmod(value: Optional[datetime]) -> str:
+    return f'<lastmod>{value.strftime("%Y-%m-%dT%H:%M:%S+00:00")}</lastmod>' if value else ''
+
+
+def _url(loc: str, lastmod: Optional[datetime] = None) -> str:
+    return f'<url><loc>{escape(loc)}</loc>{_lastmod(lastmod)}</url>\n'
+
+
+class Sitemaps:
+    """站点地图索引和分片的生成与磁盘缓存"""
+
+    def __init__(self, app=None):
+        self.root = None
+        self.site_url = ''
+        self.shard_size = SHARD_SIZE
+        self.index_ttl = 300
+        self._index: Optional[Tuple[float, bytes]] = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SITE_URL', os.getenv('SITE_URL', 'https://taletap.org'))
+        app.config.setdefault('SITEMAP_DIR', os.path.join(app.instance_path, 'sitemaps'))
+        app.config.setdefault('SITEMAP_SHARD_SIZE', SHARD_SIZE)
+        app.config.setdefault('SITEMAP_INDEX_TTL', 300)
+
+        self.site_url = app.config['SITE_URL'].rstrip('/')
+        self.root = app.config['SITEMAP_DIR']
+        self.shard_size = min(app.config['SITEMAP_SHARD_SIZE'], SHARD_SIZE)
+        self.index_ttl = app.config['SITEMAP_INDEX_TTL']
+        os.makedirs(self.root, exist_ok=True)
+        app.extensions['sitemaps'] = self
+
+    @staticmethod
+    def is_shard(name: str) -> bool:
+        return bool(_SHARD_RE.fullmatch(name))
+
+    # 签名 -------------------------------------------------------------
+
+    def _shard_signatures(self, model) -> Dict[int, Tuple[int, int, Optional[datetime]]]:
+        """一次分组查询得到每个ID区间的(行数, 最大ID, 最大更新时间)"""
+        shard = (model.id // self.shard_size).label('shard')
+        rows = db.session.query(
+            shard, db.func.count(model.id), db.func.max(model.id), db.func.max(model.updated_at)
+        ).group_by(shard)
+        return {int(number): (count, max_id, updated) for number, count, max_id, updated in rows}
+
+    def _range_signature(self, model, number: int) -> Tuple[int, int, Optional[datetime]]:
+        low = number * self.shard_size
+        return db.session.query(
+            db.func.count(model.id), db.func.max(model.id), db.func.max(model.updated_at)
+        ).filter(model.id >= low, model.id < low + self.shard_size).one()
+
+    def _signature(self, name: str):
+        if name == 'pages':
+            signature = db.session.query(
+                db.func.count(Novel.id), db.func.max(Novel.id), db.func.max(Novel.updated_at)).one()
+        else:
+            kind, number = name.split('-')
+            signature = self._range_signature(Novel if kind == 'novels' else Chapter, int(number))
+        count, max_id, updated = signature
+        return [count, max_id, updated.isoformat() if updated else None]
+
+    # 分片内容 ---------------------------------------------------------
+
+    def _pages_urls(self) -> Iterator[str]:
+        latest = db.session.query(db.func.max(Novel.updated_at)).scalar()
+        yield _url(f'{self.site_url}/', latest)
+        for path in STATIC_PAGES:
+            yield _url(f'{self.site_url}{path}')
+        categories = {row[0] for row in db.session.query(Novel.category).filter(Novel.category.isnot(None)).distinct()}
+        for category in sorted(categories | set(DEFAULT_CATEGORIES)):
+            yield _url(f'{self.site_url}/category/{quote(category)}', latest)
+
+    def _novel_urls(self, number: int) -> Iterator[str]:
+        low = number * self.shard_size
+        # 目录分页不单独列出（章节都在chapters分片中），保证每个分片不超过5万个URL
+        rows = db.session.query(Novel.id, Novel.updated_at).filter(
+            Novel.id >= low, Novel.id < low + self.shard_size
+        ).order_by(Novel.id).yield_per(1000)
+        for novel_id, updated_at in rows:
+            yield _url(f'{self.site_url}/novel/{novel_id}', updated_at)
+
+    def _chapter_urls(self, number: int) -> Iterator[str]:
+        low = number * self.shard_size
+        rows = db.session.query(Chapter.id, Chapter.novel_id, Chapter.updated_at).filter(
+            Chapter.id >= low, Chapter.id < low + self.shard_size
+        ).order_by(Chapter.id).yield_per(5000)
+        for chapter_id, novel_id, updated_at in rows:
+            yield _url(f'{self.site_url}/novel/{novel_id}/chapter/{chapter_id}', updated_at)
+
+    def _urls(self, name: str) -> Iterator[str]:
+        if name == 'pages':
+            return self._pages_urls()
+        kind, number = name.split('-')
+        return self._novel_urls(int(number)) if kind == 'novels' else self._chapter_urls(int(number))
+
+    # 磁盘缓存 ---------------------------------------------------------
+
+    def _paths(self, name: str) -> Tuple[str, str]:
+        base = os.path.join(self.root, name)
+        return base + '.xml', base + '.json'
+
+    def _write_shard(self, name: str, signature: List):
+        xml_path, meta_path = self._paths(name)
+        tmp_path = f'{xml_path}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(XML_HEADER)
+            f.write(URLSET_OPEN)
+            for line in self._urls(name):
+                f.write(line)
+            f.write('</urlset>\n')
+        os.replace(tmp_path, xml_path)
+        # 签名最后写入，生成中断时下次请求会重新生成
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(signature, f)
+
+    def shard_path(self, name: str) -> Optional[str]:
+        """返回分片文件路径，数据有变化时先重新生成；分片不存在时返回None"""
+        signature = self._signature(name)
+        if name != 'pages' and signature[0] == 0:
+            return None
+        xml_path, meta_path = self._paths(name)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                fresh = json.load(f) == signature and os.path.exists(xml_path)
+        except (FileNotFoundError, ValueError):
+            fresh = False
+        if not fresh:
+            self._write_shard(name, signature)
+        return xml_path
+
+    def index(self) -> bytes:
+        """站点地图索引（按SITEMAP_INDEX_TTL在进程内缓存）"""
+        if self._index is not None and self._index[0] > time.time():
+            return self._index[1]
+        latest = db.session.query(db.func.max(Novel.updated_at)).scalar()
+        entries = [('pages', latest)]
+        for kind, model in (('novels', Novel), ('chapters', Chapter)):
+            for number, (_, _, updated) in sorted(self._shard_signatures(model).items()):
+                entries.append((f'{kind}-{number}', updated))
+        parts = [XML_HEADER, INDEX_OPEN]
+        for name, updated in entries:
+            parts.append(f'<sitemap><loc>{escape(self.site_url)}/sitemaps/{name}.xml</loc>{_lastmod(updated)}</sitemap>\n')
+        parts.append('</sitemapindex>\n')
+        body = ''.join(parts).encode('utf-8')
+        self._index = (time.time() + self.index_ttl, body)
+        return body
+
+    def clear(self):
+        self._index = None
+        for name in os.listdir(self.root):
+            os.remove(os.path.join(self.root, name))
+
+    def build_all(self) -> int:
+        """生成全部分片，返回分片数量"""
+        self._index = None
+        names = ['pages']
+        for kind, model in (('novels', Novel), ('chapters', Chapter)):
+            names.extend(f'{kind}-{number}' for number in sorted(self._shard_signatures(model)))
+        for name in names:
+            self.shard_path(name)
+        return len(names)
+
+
+sitemaps = Sitemaps()
@@ -0,0 +1,331 @@
+"""
+解析数据暂存区
+上传的小说解析后先暂存在这里，等待预览、导入或翻译。每个条目是instance目录下的一个子目录：
+章节逐个压缩（优先zstd，未安装时用zlib）后顺序写入数据文件，另存偏移索引，
+可以只读取某一章而不必解压整本小说。条目超过有效期后由后台线程清理，
+最近读取的头部和章节缓存在进程内（按字节数限制容量），每次读取时按头部文件的inode和修改时间校验，
+其他进程删除或重写的条目不会继续从缓存中返回。
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, Optional
+
+from page_cache import LRUByteCache
+
+try:
+    import zstandard
+except ImportError:  # 未安装时使用zlib
+    zstandard = None
+
+_KEY_RE = re.compile(r'[0-9a-f]{32}')
+
+HEADER_FILE = 'header.json'
+DATA_FILE = 'chapters.bin'
+INDEX_FILE = 'index.bin'
+ERROR_SUFFIX = '.error'
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('暂存数据使用zstd压缩，但zstandard未安装')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _encode_chapter(chapter: Dict) -> bytes:
+    return json.dumps(chapter, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+@dataclass
+class _CachedItem:
+    """进程内缓存的条目头部或章节"""
+    value: Dict
+    size: int
+
+
+class StagingWriter:
+    """逐章写入一个暂存条目；commit之前条目对读取方不可见"""
+
+    def __init__(self, store: 'StagingStore'):
+        self.store = store
+        self.key = uuid.uuid4().hex
+        self.codec = store.codec
+        self.chapter_count = 0
+        self._tmp_dir = os.path.join(store.root, self.key + '.tmp')
+        os.makedirs(self._tmp_dir)
+        self._data = open(os.path.join(self._tmp_dir, DATA_FILE), 'wb')
+        self._offsets = array('Q', [0])
+        self._closed = False
+
+    def add_chapter(self, chapter: Dict):
+        frame = _compress(self.codec, _encode_chapter(chapter))
+        self._data.write(frame)
+        self._offsets.append(self._offsets[-1] + len(frame))
+        self.chapter_count += 1
+
+    def add_chapters(self, chapters: Iterable[Dict]):
+        for chapter in chapters:
+            self.add_chapter(chapter)
+
+    def commit(self, header: Dict, ttl: Optional[int] = None) -> str:
+        """写入头部并发布条目，返回条目ID"""
+        self._data.close()
+        with open(os.path.join(self._tmp_dir, INDEX_FILE), 'wb') as f:
+            self._offsets.tofile(f)
+        with open(os.path.join(self._tmp_dir, HEADER_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                'header': header,
+                'chapter_count': self.chapter_count,
+                'codec': self.codec,
+                'expires_at': time.time() + (ttl or self.store.ttl)
+            }, f, ensure_ascii=False)
+        os.replace(self._tmp_dir, os.path.join(self.store.root, self.key))
+        self._closed = True
+        return self.key
+
+    def discard(self):
+        if not self._closed:
+            self._data.close()
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._closed = True
+
+    def fail(self, error: str):
+        """放弃写入并记录错误，供查询解析状态时返回"""
+        self.discard()
+        with open(os.path.join(self.store.root, self.key + ERROR_SUFFIX), 'w', encoding='utf-8') as f:
+            json.dump({'error': error}, f, ensure_ascii=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.discard()
+
+
+class StagingStore:
+    """解析数据暂存区"""
+
+    def __init__(self, app=None):
+        self.root = None
+        self.ttl = 6 * 3600
+        self.sweep_interval = 600
+        self.codec = 'zstd' if zstandard is not None else 'zlib'
+        self.memory: Optional[LRUByteCache] = None
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STAGING_DIR', os.path.join(app.instance_path, 'staging'))
+        app.config.setdefault('STAGING_TTL', int(os.getenv('STAGING_TTL', 6 * 3600)))
+        app.config.setdefault('STAGING_SWEEP_INTERVAL', 600)
+        app.config.setdefault('STAGING_MEMORY_MAX_BYTES', 16 * 1024 * 1024)
+
+        self.root = app.config['STAGING_DIR']
+        self.ttl = app.config['STAGING_TTL']
+        self.sweep_interval = app.config['STAGING_SWEEP_INTERVAL']
+        self.memory = LRUByteCache(app.config['STAGING_MEMORY_MAX_BYTES'])
+        os.makedirs(self.root, exist_ok=True)
+        app.extensions['staging_store'] = self
+
+    def _entry_dir(self, key: str) -> Optional[str]:
+        # 条目ID来自请求参数，只接受uuid格式，防止路径穿越
+        if not key or not _KEY_RE.fullmatch(key):
+            return None
+        return os.path.join(self.root, key)
+
+    def create(self) -> StagingWriter:
+        """开始写入一个新条目"""
+        self._start_sweeper()
+        return StagingWriter(self)
+
+    def put(self, header: Dict, chapters: Iterable[Dict], ttl: Optional[int] = None) -> str:
+        with self.create() as writer:
+            writer.add_chapters(chapters)
+            return writer.commit(header, ttl)
+
+    def _forget(self, key: str):
+        """丢弃进程内缓存的头部和章节"""
+        cached = self.memory.get(key)
+        if cached is not None:
+            for index in range(cached.value['chapter_count']):
+                self.memory.delete(f"{key}:{cached.value['version']}:{index}")
+            self.memory.delete(key)
+
+    def _load_meta(self, key: str) -> Optional[Dict]:
+        entry_dir = self._entry_dir(key)
+        if entry_dir is None:
+            return None
+        # 缓存的头部只在文件没有被删除或替换时使用（多个worker共用暂存目录）
+        try:
+            stat = os.stat(os.path.join(entry_dir, HEADER_FILE))
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+        version = f'{stat.st_ino}-{stat.st_mtime_ns}'
+        cached = self.memory.get(key)
+        if cached is not None and cached.value['version'] == version:
+            meta = cached.value
+        else:
+            self._forget(key)
+            try:
+                with open(os.path.join(entry_dir, HEADER_FILE), 'rb') as f:
+                    raw = f.read()
+            except FileNotFoundError:
+                return None
+            meta = dict(json.loads(raw), version=version)
+            self.memory.set(key, _CachedItem(meta, len(raw) + 256))
+        if meta['expires_at'] < time.time():
+            self.delete(key)
+            return None
+        return meta
+
+    def get_header(self, key: str) -> Optional[Dict]:
+        """返回条目头部（附带chapter_count），条目不存在或已过期时返回None"""
+        meta = self._load_meta(key)
+        if meta is None:
+            return None
+        return dict(meta['header'], chapter_count=meta['chapter_count'])
+
+    def get_status(self, key: str) -> Optional[Dict]:
+        """后台写入的条目状态：ready / pending / error；条目不存在时返回None"""
+        header = self.get_header(key)
+        if header is not None:
+            return {'status': 'ready', 'header': header}
+        entry_dir = self._entry_dir(key)
+        if entry_dir is None:
+            return None
+        try:
+            with open(entry_dir + ERROR_SUFFIX, 'r', encoding='utf-8') as f:
+                return {'status': 'error', 'error': json.load(f)['error']}
+        except FileNotFoundError:
+            pass
+        if os.path.isdir(entry_dir + '.tmp'):
+            return {'status': 'pending'}
+        return None
+
+    def _read_offsets(self, entry_dir: str, start: int, count: int) -> array:
+        offsets = array('Q')
+        with open(os.path.join(entry_dir, INDEX_FILE), 'rb') as f:
+            f.seek(start * offsets.itemsize)
+            offsets.fromfile(f, count)
+        return offsets
+
+    def get_chapter(self, key: str, index: int) -> Optional[Dict]:
+        """随机读取一章（只解压这一章）"""
+        meta = self._load_meta(key)
+        if meta is None or not 0 <= index < meta['chapter_count']:
+            return None
+        # 章节缓存键带上头部版本，条目被重写后不会读到旧章节
+        cache_key = f"{key}:{meta['version']}:{index}"
+        cached = self.memory.get(cache_key)
+        if cached is not None:
+            return cached.value
+        entry_dir = self._entry_dir(key)
+        try:
+            start, end = self._read_offsets(entry_dir, index, 2)
+            with open(os.path.join(entry_dir, DATA_FILE), 'rb') as f:
+                f.seek(start)
+                raw = _decompress(meta['codec'], f.read(end - start))
+        except FileNotFoundError:
+            return None
+        chapter = json.loads(raw)
+        self.memory.set(cache_key, _CachedItem(chapter, len(raw) + 256))
+        return chapter
+
+    def iter_chapters(self, key: str, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict]:
+        """按顺序读取章节[start, stop)；整本读取时不经过进程内缓存"""
+        meta = self._load_meta(key)
+        if meta is None:
+            raise KeyError(key)
+        stop = meta['chapter_count'] if stop is None else min(stop, meta['chapter_count'])
+        if start >= stop:
+            return
+        entry_dir = self._entry_dir(key)
+        offsets = self._read_offsets(entry_dir, start, stop - start + 1)
+        with open(os.path.join(entry_dir, DATA_FILE), 'rb') as f:
+            f.seek(offsets[0])
+            for begin, end in zip(offsets, offsets[1:]):
+                yield json.loads(_decompress(meta['codec'], f.read(end - begin)))
+
+    def delete(self, key: str):
+        entry_dir = self._entry_dir(key)
+        if entry_dir is None:
+            return
+        self._forget(key)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+    def sweep(self) -> int:
+        """删除过期条目、中断写入留下的临时目录和错误记录，返回删除的条目数"""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            leftover = name.endswith(('.tmp', ERROR_SUFFIX))
+            try:
+                if leftover:
+                    expired = os.path.getmtime(path) + self.ttl < now
+                else:
+                    with open(os.path.join(path, HEADER_FILE), 'r', encoding='utf-8') as f:
+                        expired = json.load(f)['expires_at'] < now
+            except (OSError, ValueError, KeyError):
+                continue
+            if expired:
+                if name.endswith(ERROR_SUFFIX):
+                    os.remove(path)
+                elif leftover:
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    self.delete(name)
+                removed += 1
+        return removed
+
+    def _start_sweeper(self):
+        """首次写入时启动后台清理线程"""
+        if self.sweep_interval <= 0:
+            return
+        with self._sweeper_lock:
+            if self._sweeper is not None:
+                return
+
+            def loop():
+                while True:
+                    time.sleep(self.sweep_interval)
+                    try:
+                        removed = self.sweep()
+                        if removed:
+                            print(f"暂存区已清理 {removed} 个过期条目")
+                    except Exception as e:
+                        print(f"暂存区清理失败: {e}")
+
+            self._sweeper = threading.Thread(target=loop, name='staging-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def stats(self) -> Dict:
+        entries = [name for name in os.listdir(self.root) if not name.endswith(('.tmp', ERROR_SUFFIX))]
+        return {
+            'entries': len(entries),
+            'codec': self.codec,
+            'memory_bytes': self.memory.current_bytes,
+            'memory_max_bytes': self.memory.max_bytes
+        }
+
+
+staging_store = StagingStore()
@@ -0,0 +1,89 @@
+// Tailwind配置：页面没有构建好的样式时由Tailwind CDN在浏览器中读取，
+// flask build-assets 调用Tailwind CLI时作为配置文件（content指定要扫描类名的文件）
+const config = {
+    darkMode: 'class',
+    theme: {
+        extend: {
+            colors: {
+                primary: {
+                    50: '#f0f9ff',
+                    100: '#e0f2fe',
+                    200: '#bae6fd',
+                    300: '#7dd3fc',
+                    400: '#38bdf8',
+                    500: '#0ea5e9',
+                    600: '#0284c7',
+                    700: '#0369a1',
+                    800: '#075985',
+                    900: '#0c4a6e',
+                },
+                accent: {
+                    50: '#fdf4ff',
+                    100: '#fae8ff',
+                    200: '#f5d0fe',
+                    300: '#f0abfc',
+                    400: '#e879f9',
+                    500: '#d946ef',
+                    600: '#c026d3',
+                    700: '#a21caf',
+                    800: '#86198f',
+                    900: '#701a75',
+                }
+            },
+            fontFamily: {
+                'reading': ['Georgia', 'Times New Roman', 'serif'],
+                'display': ['Inter', 'system-ui', 'sans-serif'],
+            },
+            animation: {
+                'fade-in': 'fadeIn 0.5s ease-in-out',
+                'slide-up': 'slideUp 0.6s ease-out',
+                'pulse-subtle': 'pulse 3s cubic-bezier(0.4, 0, 0.6, 1) infinite',
+                'float': 'float 6s ease-in-out infinite',
+            },
+            typography: {
+                DEFAULT: {
+                    css: {
+                        maxWidth: 'none',
+                        color: '#374151',
+                        a: {
+                            color: '#0ea5e9',
+                            '&:hover': {
+                                color: '#0284c7',
+                            },
+                        },
+                        'h1, h2, h3, h4': {
+                            color: '#111827',
+                            fontWeight: '600',
+                        },
+                        'blockquote': {
+                            borderLeftColor: '#0ea5e9',
+                        },
+                    },
+                },
+                dark: {
+                    css: {
+                        color: '#d1d5db',
+                        a: {
+                            color: '#38bdf8',
+                            '&:hover': {
+                                color: '#7dd3fc',
+                            },
+                        },
+                        'h1, h2, h3, h4': {
+                            color: '#f9fafb',
+                        },
+                    },
+                },
+            },
+        }
+    }
+};
+
+if (typeof module !== 'undefined') {
+    module.exports = {
+        content: ['./templates/**/*.html', './static/js/**/*.js'],
+        ...config,
+    };
+} else {
+    tailwind.config = config;
+}
@@ -0,0 +1,247 @@
+"""
+静态资源构建
+flask build-assets 把页面引用的CSS/JS复制到static/dist，文件名带内容哈希，并预先生成.gz/.br压缩版本；
+手写的CSS按模板和JS中出现过的类名去掉未使用的规则。安装了Tailwind CLI时同时按模板编译出精简的Tailwind样式，
+否则页面继续使用Tailwind CDN。运行时通过/assets/<文件名>按Accept-Encoding返回预压缩文件，并设置永久缓存。
+模板中用asset_url()引用资源，没有构建过时回退到原始文件。
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Set
+
+from flask import abort, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:  # 未安装时只生成.gz
+    brotli = None
+
+# 页面引用的资源（相对于static目录）
+ASSETS = ('css/reading.css', 'js/reading.js', 'js/adsense.js', 'js/tailwind.config.js')
+# 需要去掉未使用规则的手写CSS
+PURGE_ASSETS = {'css/reading.css'}
+TAILWIND_INPUT = 'src/tailwind.css'
+TAILWIND_CONFIG = 'js/tailwind.config.js'
+TAILWIND_OUTPUT = 'css/tailwind.css'
+# 未精简的完整Tailwind构建，只作为大小报告中的对比
+TAILWIND_FULL_BUILD = 'css/tailwind.min.css'
+
+MANIFEST_FILE = 'manifest.json'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_TOKEN_RE = re.compile(r'[A-Za-z0-9_-]+')
+_CLASS_RE = re.compile(r'\.(-?[A-Za-z_][\w-]*)')
+_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+
+
+def collect_tokens(root: str) -> Set[str]:
+    """模板和JS中出现过的所有单词，作为可能用到的类名集合（宁多勿少，JS里拼接的类名也能保留）"""
+    tokens = set()
+    paths = glob.glob(os.path.join(root, 'templates', '**', '*.html'), recursive=True)
+    paths += glob.glob(os.path.join(root, 'static', 'js', '**', '*.js'), recursive=True)
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            tokens.update(_TOKEN_RE.findall(f.read()))
+    return tokens
+
+
+def _split_blocks(css: str) -> List[tuple]:
+    """把CSS拆成(前导部分, 块内容)列表，块内容为None表示没有花括号的语句（如@import）"""
+    blocks = []
+    pos = 0
+    while pos < len(css):
+        brace = css.find('{', pos)
+        semicolon = css.find(';', pos)
+        if brace == -1:
+            if css[pos:].strip():
+                blocks.append((css[pos:].strip(), None))
+            break
+        if css[pos:brace].lstrip().startswith('@') and -1 < semicolon < brace:
+            blocks.append((css[pos:semicolon + 1].strip(), None))
+            pos = semicolon + 1
+            continue
+        depth, end = 0, brace
+        for end in range(brace, len(css)):
+            if css[end] == '{':
+                depth += 1
+            elif css[end] == '}':
+                depth -= 1
+                if depth == 0:
+                    break
+        blocks.append((css[pos:brace].strip(), css[brace + 1:end]))
+        pos = end + 1
+    return blocks
+
+
+def purge_css(css: str, tokens: Set[str]) -> str:
+    """去掉选择器中含有未使用类名的规则；@media等嵌套规则递归处理，@keyframes/@font-face原样保留"""
+    output = []
+    for prelude, body in _split_blocks(_COMMENT_RE.sub('', css)):
+        if body is None:
+            output.append(prelude)
+        elif prelude.startswith(('@media', '@supports')):
+            inner = purge_css(body, tokens)
+            if inner:
+                output.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            output.append(f'{prelude}{{{body}}}')
+        else:
+            selectors = [s for s in prelude.split(',') if all(c in tokens for c in _CLASS_RE.findall(s))]
+            if selectors:
+                output.append(f"{','.join(s.strip() for s in selectors)}{{{body}}}")
+    return minify_css('\n'.join(output))
+
+
+def minify_css(css: str) -> str:
+    """去掉注释和多余空白（不改动选择器中的后代空格）"""
+    css = _COMMENT_RE.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def find_tailwind_cli(configured: Optional[str] = None) -> Optional[str]:
+    return shutil.which(configured or 'tailwindcss')
+
+
+class StaticAssets:
+    """带内容哈希的静态资源：构建、清单和预压缩文件的返回"""
+
+    def __init__(self, app=None):
+        self.root = None
+        self.static_root = None
+        self.dist_root = None
+        self.tailwind_cli = None
+        self.manifest: Dict[str, str] = {}
+        self._files: Set[str] = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STATIC_ASSETS_DIR', os.path.join(app.static_folder, 'dist'))
+        app.config.setdefault('TAILWIND_CLI', os.getenv('TAILWIND_CLI'))
+
+        self.root = app.root_path
+        self.static_root = app.static_folder
+        self.dist_root = app.config['STATIC_ASSETS_DIR']
+        self.tailwind_cli = app.config['TAILWIND_CLI']
+        self.load_manifest()
+        app.add_url_rule('/assets/<path:filename>', endpoint='asset', view_func=self.serve)
+        app.add_template_global(self.url, 'asset_url')
+        app.add_template_global(self.has, 'has_asset')
+        app.extensions['static_assets'] = self
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.dist_root, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self._files = set(self.manifest.values())
+
+    def has(self, name: str) -> bool:
+        return name in self.manifest
+
+    def url(self, name: str) -> str:
+        """构建过的资源返回带哈希的地址，否则返回原始文件地址"""
+        built = self.manifest.get(name)
+        if built is None:
+            return url_for('static', filename=name)
+        return url_for('asset', filename=built)
+
+    def serve(self, filename):
+        """按Accept-Encoding返回预压缩的文件；文件名带哈希，内容永远不变"""
+        if filename not in self._files:
+            abort(404)
+        path = os.path.join(self.dist_root, filename)
+        encoding = None
+        for name, suffix in ENCODINGS:
+            if request.accept_encodings[name] and os.path.exists(path + suffix):
+                encoding, path = name, path + suffix
+                break
+        response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], conditional=True,
+                             etag=f'{filename}-{encoding or "identity"}', max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _build_tailwind(self, work_dir: str) -> Optional[str]:
+        """用Tailwind CLI按模板编译精简后的样式，返回输出文件路径；未安装CLI时返回None"""
+        cli = find_tailwind_cli(self.tailwind_cli)
+        if cli is None:
+            return None
+        output = os.path.join(work_dir, 'tailwind.css')
+        subprocess.run([
+            cli, '-c', os.path.join(self.static_root, TAILWIND_CONFIG),
+            '-i', os.path.join(self.static_root, TAILWIND_INPUT), '-o', output, '--minify'
+        ], cwd=self.root, check=True)
+        return output
+
+    def _write(self, name: str, data: bytes) -> str:
+        stem, ext = os.path.splitext(name)
+        built = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        path = os.path.join(self.dist_root, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+        return built
+
+    def build(self) -> List[Dict]:
+        """构建全部资源并写入清单，返回每个文件的大小报告"""
+        tokens = collect_tokens(self.root)
+        sources = {name: os.path.join(self.static_root, name) for name in ASSETS}
+        with tempfile.TemporaryDirectory() as work_dir:
+            tailwind = self._build_tailwind(work_dir)
+            if tailwind is not None:
+                sources[TAILWIND_OUTPUT] = tailwind
+            else:
+                print("未找到Tailwind CLI（可用TAILWIND_CLI指定），页面继续使用Tailwind CDN")
+
+            if os.path.isdir(self.dist_root):
+                shutil.rmtree(self.dist_root)
+            manifest = {}
+            report = []
+            for name, path in sources.items():
+                with open(path, 'rb') as f:
+                    data = f.read()
+                source_bytes = len(data)
+                if name == TAILWIND_OUTPUT:
+                    full_build = os.path.join(self.static_root, TAILWIND_FULL_BUILD)
+                    if os.path.exists(full_build):
+                        source_bytes = os.path.getsize(full_build)
+                elif name in PURGE_ASSETS:
+                    data = purge_css(data.decode('utf-8'), tokens).encode('utf-8')
+                manifest[name] = self._write(name, data)
+                built_path = os.path.join(self.dist_root, manifest[name])
+                report.append({
+                    'name': name,
+                    'source_bytes': source_bytes,
+                    'built_bytes': len(data),
+                    'gzip_bytes': os.path.getsize(built_path + '.gz'),
+                    'brotli_bytes': os.path.getsize(built_path + '.br') if brotli is not None else None,
+                })
+
+        with open(os.path.join(self.dist_root, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        self.load_manifest()
+        return report
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.py在导入时读取DATABASE_URL，必须在导入之前指向临时数据库
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='novel-tests-'), 'test.db')
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """使用临时SQLite数据库的应用，关闭页面缓存以保证每次请求都执行视图"""
+    from app import app as flask_app
+    from models import db, upgrade_schema
+    from page_cache import page_cache
+
+    flask_app.config['TESTING'] = True
+    monkeypatch.setattr(page_cache, 'enabled', False)
+    with flask_app.app_context():
+        db.create_all()
+        upgrade_schema()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
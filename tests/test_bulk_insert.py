@@ -0,0 +1,71 @@
+import csv
+import io
+from datetime import datetime
+
+from bulk_insert import COPY_COLUMNS, COPY_NULL_COLUMNS, COPY_SQL, _copy_rows, bulk_insert_chapters
+from models import db, Novel, Chapter
+
+TRICKY_CONTENT = '第一行，带逗号\n"引号"和""双引号""\r\nWindows换行\\反斜杠\\N\t制表符\n\nNULL'
+
+
+def read_copy_csv(text):
+    """按PostgreSQL COPY的CSV规则解析：引号内的空字符串只有在FORCE_NULL列中才是NULL"""
+    rows = []
+    for record in csv.reader(io.StringIO(text, newline='')):
+        row = dict(zip(COPY_COLUMNS, record))
+        rows.append({column: None if column in COPY_NULL_COLUMNS and value == '' else value
+                     for column, value in row.items()})
+    return rows
+
+
+def test_copy_csv_round_trips_quoting_and_nulls():
+    updated_at = datetime(2024, 1, 2, 3, 4, 5, 678901)
+    plain = {
+        'novel_id': 7, 'chapter_number': 1, 'title': '', 'content': TRICKY_CONTENT,
+        'content_blob': None, 'content_encoding': None, 'word_count': len(TRICKY_CONTENT),
+        'content_hash': 'abc123', 'simhash': -9223372036854775808, 'updated_at': updated_at,
+    }
+    compressed = dict(plain, chapter_number=2, title='标题,"带引号"', content='',
+                      content_blob=b'\x00\x01,"\n\xff', content_encoding='zstd:3', simhash=None)
+    captured = []
+
+    _copy_rows(lambda buffer: captured.append(buffer.getvalue()), [plain, compressed])
+
+    assert len(captured) == 1
+    # 每个字段都加了引号，未加引号的空字段在CSV格式下会被当作NULL
+    assert captured[0].startswith('"7","1","",')
+    first, second = read_copy_csv(captured[0])
+    assert first == {
+        'novel_id': '7', 'chapter_number': '1', 'title': '', 'content': TRICKY_CONTENT,
+        'content_blob': None, 'content_encoding': None, 'word_count': str(len(TRICKY_CONTENT)),
+        'content_hash': 'abc123', 'simhash': '-9223372036854775808', 'updated_at': '2024-01-02T03:04:05.678901',
+    }
+    # 非空列的空字符串必须保持为空字符串，不能变成NULL
+    assert second['content'] == ''
+    assert second['title'] == '标题,"带引号"'
+    assert second['content_blob'] == '\\x00012c220aff'
+    assert second['content_encoding'] == 'zstd:3'
+    assert second['simhash'] is None
+
+
+def test_copy_force_null_covers_every_nullable_column():
+    table = Chapter.__table__
+    assert set(COPY_NULL_COLUMNS) == {column for column in COPY_COLUMNS if table.c[column].nullable}
+    assert 'title' not in COPY_NULL_COLUMNS and 'content' not in COPY_NULL_COLUMNS
+    assert f"FORCE_NULL ({', '.join(COPY_NULL_COLUMNS)})" in COPY_SQL
+
+
+def test_bulk_insert_executemany_path(app):
+    novel = Novel(title='黑暗森林', author='刘慈欣', description='科幻小说', category='科幻')
+    db.session.add(novel)
+    db.session.flush()
+
+    result = bulk_insert_chapters(novel.id, [('第1章', TRICKY_CONTENT), ('第2章', '')], start_number=3, batch_size=1)
+    db.session.commit()
+
+    assert result.rows == 2
+    chapters = Chapter.query.filter_by(novel_id=novel.id).order_by(Chapter.chapter_number).all()
+    assert [(c.chapter_number, c.title, c.content, c.word_count) for c in chapters] == [
+        (3, '第1章', TRICKY_CONTENT, len(TRICKY_CONTENT)), (4, '第2章', '', 0),
+    ]
+    assert chapters[0].content_hash is not None
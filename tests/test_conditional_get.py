@@ -0,0 +1,45 @@
+from models import db, Novel, Chapter
+from page_cache import page_cache
+
+
+def add_novel(title, category='Fantasy'):
+    novel = Novel(title=title, description='简介', author='作者', category=category)
+    db.session.add(novel)
+    db.session.flush()
+    db.session.add(Chapter(novel_id=novel.id, chapter_number=1, title='第1章', content='正文内容。' * 100))
+    db.session.commit()
+    return novel
+
+
+def revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+def test_novel_etag_changes_when_related_novels_or_covers_change(client):
+    novel = add_novel('测试小说')
+    url = f'/novel/{novel.id}'
+    first = client.get(url)
+    etag = first.headers['ETag']
+    assert first.headers.get('Last-Modified') is None
+    assert revalidate(client, url, etag).status_code == 304
+
+    # 同类新书出现在“相关小说”中，但不会修改这本小说的updated_at
+    add_novel('另一本小说')
+    page_cache.invalidate_novel()
+    assert revalidate(client, url, etag).status_code == 200
+
+    # 封面缩略图生成完毕时只使列表类页面的标签失效
+    etag = client.get(url).headers['ETag']
+    page_cache.invalidate('novels')
+    assert revalidate(client, url, etag).status_code == 200
+
+
+def test_chapter_etag_changes_when_chapter_tag_is_invalidated(client):
+    novel = add_novel('测试小说')
+    chapter_id = Chapter.query.filter_by(novel_id=novel.id).one().id
+    url = f'/novel/{novel.id}/chapter/{chapter_id}'
+    etag = client.get(url).headers['ETag']
+    assert revalidate(client, url, etag).status_code == 304
+
+    page_cache.invalidate(f'chapter:{chapter_id}')
+    assert revalidate(client, url, etag).status_code == 200
@@ -0,0 +1,56 @@
+import os
+import threading
+import time
+
+from cover_images import CoverImages, GC_GRACE_SECONDS, GC_LOCK_NAME
+
+
+def make_covers(tmp_path, monkeypatch, reference_count):
+    covers = CoverImages()
+    covers.root = str(tmp_path / 'img')
+    covers.variant_root = str(tmp_path / 'img' / 'variants')
+    monkeypatch.setattr(CoverImages, 'reference_count', staticmethod(reference_count))
+    return covers
+
+
+def test_reuse_during_release_keeps_the_file(tmp_path, monkeypatch):
+    source = tmp_path / 'cover.jpg'
+    source.write_bytes(b'cover-bytes')
+    reused = {}
+    threads = []
+
+    def reference_count(filename):
+        # 回收方已确认文件过了保护期，此时另一个请求上传了同一张图片
+        thread = threading.Thread(target=lambda: reused.setdefault('filename', covers.import_file(str(source))))
+        thread.start()
+        thread.join(0.3)
+        threads.append(thread)
+        return 0
+
+    covers = make_covers(tmp_path, monkeypatch, reference_count)
+    filename = covers.import_file(str(source))
+    path = os.path.join(covers.root, filename)
+    old = time.time() - GC_GRACE_SECONDS - 60
+    os.utime(path, (old, old))
+
+    assert covers.release(filename) is True
+    threads[0].join()
+    assert reused['filename'] == filename
+    # 复用方在删除之后重新写入了文件，新的引用不会指向不存在的封面
+    assert os.path.exists(path)
+    assert os.path.getmtime(path) > old
+
+
+def test_collect_garbage_keeps_lock_file(tmp_path, monkeypatch):
+    covers = make_covers(tmp_path, monkeypatch, lambda filename: 0)
+    source = tmp_path / 'cover.jpg'
+    source.write_bytes(b'cover-bytes')
+    path = os.path.join(covers.root, covers.import_file(str(source)))
+    lock_path = os.path.join(covers.root, 'covers', GC_LOCK_NAME)
+    old = time.time() - GC_GRACE_SECONDS - 60
+    for stale in (path, lock_path):
+        os.utime(stale, (old, old))
+
+    assert covers.collect_garbage() == 1
+    assert not os.path.exists(path)
+    assert os.path.exists(lock_path)
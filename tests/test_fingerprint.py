@@ -0,0 +1,38 @@
+from fingerprint import find_duplicate_novel, import_chapters
+from models import db, Novel
+
+NOTICE = ('请假', '今天有事请假一天，明天恢复更新，感谢大家的支持。')
+
+
+def chapters(prefix, count):
+    return [(f'第{i}章', f'{prefix}的第{i}章正文，' + '内容' * (20 + i)) for i in range(1, count + 1)]
+
+
+def import_novel(title, author, items):
+    outcome = import_chapters(lambda: Novel(title=title, author=author, description='简介', category='Fantasy'),
+                              title, author, items)
+    db.session.commit()
+    return outcome
+
+
+def test_reimport_of_same_novel_is_detected(app):
+    original = import_novel('原书', '作者甲', chapters('原书', 12))
+    outcome = import_novel('原书', '作者甲', chapters('原书', 15))
+    assert not outcome.created
+    assert outcome.novel.id == original.novel.id
+    assert outcome.inserted == 3
+
+
+def test_repeated_boilerplate_chapter_does_not_match(app):
+    # 已有小说中同一条请假公告重复了5次
+    existing = chapters('旧书', 5) + [NOTICE] * 5
+    import_novel('旧书', '作者甲', existing)
+    upload = [NOTICE] + chapters('新书', 9)
+    assert find_duplicate_novel('新书', '作者乙', upload) is None
+    assert import_novel('新书', '作者乙', upload).created
+
+
+def test_single_shared_chapter_with_other_title_does_not_match(app):
+    import_novel('旧书', '作者甲', chapters('旧书', 5) + [NOTICE])
+    upload = [NOTICE, ('第1章', '完全不同的一本小说的正文。' * 10)]
+    assert find_duplicate_novel('新书', '作者乙', upload) is None
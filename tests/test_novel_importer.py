@@ -0,0 +1,87 @@
+from novel_importer import NovelImporter, ReferenceNovelImporter, Language, SNIFF_WINDOW_BYTES
+
+RARE_CHAR = '\U00020000'  # 只有GB18030能编码，GBK不能
+
+
+def write_gbk_novel(path, chapter_count=120, extra: bytes = b'', extra_chapter=None):
+    """生成GBK编码的小说；extra_chapter章的正文中插入额外的字节（不在编码检测的采样窗口内）"""
+    parts = ['书名：测试小说\n作者：测试作者\n'.encode('gbk')]
+    for number in range(1, chapter_count + 1):
+        parts.append(f'第{number}章 标题{number}\n'.encode('gbk'))
+        body = '这是一段用于测试编码的正文内容。' * 120 + '\n'
+        if number == extra_chapter:
+            parts.append(body.encode('gbk') + extra + '\n'.encode('gbk'))
+        parts.append(body.encode('gbk'))
+    data = b''.join(parts)
+    path.write_bytes(data)
+    return data
+
+
+def stream(path):
+    novel_info, chapters = NovelImporter().stream_novel_file(str(path))
+    return novel_info, list(chapters)
+
+
+def test_gb18030_only_character_outside_sample(tmp_path):
+    path = tmp_path / 'novel.txt'
+    data = write_gbk_novel(path, extra=('稀有字' + RARE_CHAR).encode('gb18030'), extra_chapter=30)
+    # 第30章位于开头和中间的采样窗口之间
+    offset = data.index(RARE_CHAR.encode('gb18030'))
+    assert SNIFF_WINDOW_BYTES < offset < len(data) // 2
+
+    novel_info, chapters = stream(path)
+    assert novel_info.encoding == 'gb18030'
+    assert len(chapters) == 120
+    assert RARE_CHAR in chapters[29].content
+    assert novel_info.decode_errors == 0
+
+
+def test_invalid_byte_outside_sample_is_replaced(tmp_path):
+    path = tmp_path / 'novel.txt'
+    data = write_gbk_novel(path, extra=b'\xff' + '坏字节之后的正文'.encode('gbk'), extra_chapter=30)
+    assert SNIFF_WINDOW_BYTES < data.index(b'\xff') < len(data) // 2
+
+    novel_info, chapters = stream(path)
+    assert len(chapters) == 120
+    assert novel_info.decode_errors == 1
+    assert '�坏字节之后的正文' in chapters[29].content
+
+
+# 覆盖各条标题规则、首字符预筛选的边界以及需要清理的行
+CHINESE_LINES = [
+    '第1章 开端', '第十二章　风起', '第3回 夜宴', '第三回 中文数字不算回目', '序章', '楔子 往事', '大结局',
+    '12. 数字标题', '１２. 全角数字', '第一百零一章', '第章 缺少序号', '  第5章 前后有空白  ',
+    '正文以第开头的句子', '2024年的冬天', '更多电子书请访问 www.example.com', '<p>段落</p>',
+    '『本书连载中』', 'http://example.com/novel', '尾声：终局', '甲',
+]
+ENGLISH_LINES = [
+    'Chapter 1: The Start', 'chapter 2 lower case', 'CHAPTER 3: LOUD', 'Ch. 4 Short', 'ch5 tight', 'CH 6',
+    '7. Numbered', '8 Numbered without dot', 'Prologue', 'epilogue: the end', 'Preface', 'Afterword',
+    'A quiet morning.', 'Peter walked in.', 'Chapters are long.', '٣ Arabic-Indic digit', '2024 was cold.',
+    'E-mail: someone@example.com', 'Each day passed.', 'x',
+]
+
+
+def synthetic_text(lines, heading_every=3, repeat=40):
+    body = []
+    for index in range(repeat * len(lines)):
+        if index % heading_every == 0:
+            body.append(lines[index % len(lines)])
+        body.append(f'正文段落{index}，some body text {index}.')
+        body.append(lines[(index * 7) % len(lines)])
+    return '\n'.join(body)
+
+
+def test_precompiled_matcher_matches_reference_implementation():
+    importer, reference = NovelImporter(), ReferenceNovelImporter()
+    for language, lines in ((Language.CHINESE, CHINESE_LINES), (Language.ENGLISH, ENGLISH_LINES)):
+        for line in lines:
+            line = line.strip()
+            assert (importer.match_chapter_heading(line, language) is None) == \
+                (reference.match_chapter_heading(line, language) is None), line
+
+        text = synthetic_text(lines)
+        assert importer.clean_content(text, language) == reference.clean_content(text, language)
+        chapters = importer.split_chapters(text, language)
+        assert chapters == reference.split_chapters(text, language)
+        assert len(chapters) > len(lines)
@@ -0,0 +1,59 @@
+import re
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Novel, Chapter
+
+# 章节正文所在的列（明文content和压缩后的content_blob）
+CONTENT_COLUMN_RE = re.compile(r'\bchapter\.(content|content_blob)\b')
+CHAPTER_TEXT = '正文内容。' * 2000
+
+
+@pytest.fixture
+def novel_id(app):
+    novel = Novel(title='测试小说', description='简介', author='作者', category='Fantasy')
+    db.session.add(novel)
+    db.session.flush()
+    for number in range(1, 26):
+        db.session.add(Chapter(novel_id=novel.id, chapter_number=number, title=f'第{number}章', content=CHAPTER_TEXT))
+    db.session.commit()
+    return novel.id
+
+
+@pytest.fixture
+def statements(app):
+    """记录请求期间执行的SQL"""
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        captured.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield captured
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def content_reads(statements):
+    return [statement for statement in statements if CONTENT_COLUMN_RE.search(statement)]
+
+
+def test_table_of_contents_does_not_load_chapter_content(client, novel_id, statements):
+    for url in (f'/novel/{novel_id}', f'/novel/{novel_id}/page/2'):
+        statements.clear()
+        response = client.get(url)
+        assert response.status_code == 200
+        assert '第1章'.encode() in response.data or '第21章'.encode() in response.data
+        assert CHAPTER_TEXT[:50].encode() not in response.data
+        assert content_reads(statements) == []
+        # 目录页的查询数量是固定的，不随章节数增长
+        assert len(statements) <= 10
+
+
+def test_chapter_page_still_loads_content(client, novel_id, statements):
+    chapter_id = db.session.query(Chapter.id).filter_by(novel_id=novel_id, chapter_number=1).scalar()
+    response = client.get(f'/novel/{novel_id}/chapter/{chapter_id}')
+    assert response.status_code == 200
+    # 确认监听器能捕获到正文读取，上面的断言才有意义
+    assert content_reads(statements)
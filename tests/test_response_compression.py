@@ -0,0 +1,40 @@
+import gzip
+
+from flask import Flask, make_response
+
+from response_compression import CachedCompress
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config['COMPRESS_ALGORITHM'] = ['gzip']
+    compress = CachedCompress(app)
+    state = {'body': 'A' * 4096}
+
+    @app.route('/page')
+    def page():
+        # 弱ETag只覆盖部分内容：正文变化（长度不变）时ETag保持不变
+        response = make_response(state['body'])
+        response.set_etag('novel-1', weak=True)
+        return response
+
+    return app, compress, state
+
+
+def fetch(client):
+    response = client.get('/page', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    return gzip.decompress(response.data).decode()
+
+
+def test_same_etag_with_changed_body_is_not_served_from_cache():
+    app, compress, state = make_app()
+    client = app.test_client()
+
+    assert fetch(client) == 'A' * 4096
+    assert fetch(client) == 'A' * 4096
+    assert compress.stats()['hits'] == 1
+
+    state['body'] = 'B' * 4096
+    assert fetch(client) == 'B' * 4096
+    assert compress.stats()['misses'] == 2
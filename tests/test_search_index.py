@@ -0,0 +1,20 @@
+from sqlalchemy import text
+
+from models import db, Novel
+from search_index import novel_search
+
+
+def test_existing_novels_searchable_after_index_is_created(app, monkeypatch):
+    # 模拟升级前的数据库：小说已经存在，检索表还没有创建
+    db.session.execute(text("DROP TABLE IF EXISTS novel_fts"))
+    db.session.add_all([
+        Novel(title='黑暗森林', author='刘慈欣', description='科幻小说', category='科幻'),
+        Novel(title='倾城之恋', author='张爱玲', description='言情小说', category='言情'),
+    ])
+    db.session.commit()
+    monkeypatch.setitem(app.extensions, 'novel_search', None)
+
+    novels, total = novel_search.search('黑暗')
+    assert novel_search.backend.name == 'sqlite-fts5'
+    assert total == 1
+    assert [novel.title for novel in novels] == ['黑暗森林']
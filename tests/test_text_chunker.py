@@ -0,0 +1,53 @@
+import time
+
+from text_chunker import chunk_text, join_chunks, split_sentences
+
+
+def texts(chunks):
+    return [chunk.text for chunk in chunks]
+
+
+def test_reassembled_chunks_keep_paragraph_boundaries():
+    paragraphs = ['第一段。很短。', '', 'Second paragraph. It has two sentences.', '第三段' * 50 + '。' + '结尾' * 50 + '！']
+    text = '\n'.join(paragraphs)
+    chunks = chunk_text(text, max_tokens=60)
+    assert len(chunks) > 1
+    assert join_chunks(texts(chunks), chunks) == text
+
+
+def test_long_paragraph_split_by_sentences():
+    paragraph = ''.join(f'这是第{i}句话。' for i in range(40))
+    chunks = chunk_text(paragraph, max_tokens=30)
+    # 同一段落拆出的后续分段标记为continues，并且都在句末断开
+    assert [chunk.continues for chunk in chunks] == [False] + [True] * (len(chunks) - 1)
+    assert all(chunk.text.endswith('。') for chunk in chunks)
+    assert join_chunks(texts(chunks), chunks) == paragraph
+
+
+def test_translated_chunks_rejoin_with_separator():
+    text = 'One. Two. Three.\nFour.'
+    chunks = chunk_text(text, max_tokens=3)
+    translated = [chunk.text.strip() for chunk in chunks]
+    joined = join_chunks(translated, chunks, sentence_separator=' ')
+    assert joined.split('\n') == ['One. Two. Three.', 'Four.']
+
+
+def test_chunks_stay_within_budget():
+    text = '\n'.join(['段落内容。' * 30, 'word ' * 200, '无标点' * 300])
+    for chunk in chunk_text(text, max_tokens=50):
+        assert chunk.tokens <= 50
+
+
+def test_long_run_without_punctuation_is_linear():
+    text = 'a' * 50000 + '\n' + '字' * 50000
+    started = time.monotonic()
+    chunks = chunk_text(text)
+    assert time.monotonic() - started < 1.0
+    assert join_chunks(texts(chunks), chunks) == text
+    assert all(chunk.tokens <= 1000 for chunk in chunks)
+
+
+def test_split_sentences_round_trip():
+    paragraph = '他说：“走吧。”她没回答！Then he left. Done?'
+    assert ''.join(split_sentences(paragraph)) == paragraph
+
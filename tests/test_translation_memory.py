@@ -0,0 +1,40 @@
+import sqlite3
+
+from translation_memory import TranslationMemory
+
+
+def table_sum(memory):
+    return sum(size for size, in memory._conn.execute('SELECT size FROM memory'))
+
+
+def test_running_total_tracks_inserts_replacements_and_evictions(tmp_path):
+    memory = TranslationMemory(path=str(tmp_path / 'memory.db'), max_bytes=100)
+    statements = []
+    memory._conn.set_trace_callback(statements.append)
+
+    memory.store('a', 'x' * 30)
+    memory.store('b', 'y' * 30)
+    memory.store('a', 'x' * 10)  # 替换已有条目只计入大小差
+    assert memory.stats()['bytes'] == 40 == table_sum(memory)
+
+    memory.store('c', 'z' * 50)
+    memory.store('d', 'w' * 40)  # 超过上限，淘汰最久未使用的条目直到不超过90字节
+    assert memory.stats()['bytes'] == table_sum(memory) <= 90
+    assert memory.lookup('a') is None and memory.lookup('d') == ('w' * 40, 0.0)
+    # 写入时不再对整张表求和
+    assert not [sql for sql in statements if 'SUM(' in sql.upper()]
+
+
+def test_existing_file_without_meta_table_is_counted_once(tmp_path):
+    path = str(tmp_path / 'memory.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE memory (key TEXT PRIMARY KEY, value TEXT NOT NULL, cost REAL NOT NULL DEFAULT 0, '
+                 'size INTEGER NOT NULL, last_used REAL NOT NULL)')
+    conn.executemany('INSERT INTO memory VALUES (?, ?, 0, ?, 0)', [('a', 'aaa', 3), ('b', 'bbbb', 4)])
+    conn.commit()
+    conn.close()
+
+    memory = TranslationMemory(path=path)
+    assert memory.stats()['bytes'] == 7
+    memory.store('c', 'cc')
+    assert TranslationMemory(path=path).stats()['bytes'] == 9
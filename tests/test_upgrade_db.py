@@ -0,0 +1,43 @@
+from sqlalchemy import text
+
+from models import db, Novel, Chapter, missing_columns
+
+
+def _old_novel_with_chapters(count):
+    """模拟升级前的数据：章节没有序号和字数"""
+    novel = Novel(title='黑暗森林', author='刘慈欣', description='科幻小说', category='科幻')
+    db.session.add(novel)
+    db.session.flush()
+    for i in range(count):
+        db.session.add(Chapter(novel_id=novel.id, title=f'第{i + 1}章', content='正文' * (i + 1)))
+    db.session.commit()
+    db.session.execute(text("UPDATE chapter SET chapter_number = NULL, word_count = NULL"))
+    db.session.commit()
+    return novel
+
+
+def test_next_chapter_number_counts_unnumbered_chapters(app):
+    novel = _old_novel_with_chapters(3)
+
+    assert novel.next_chapter_number() == 4
+
+
+def test_upgrade_db_adds_columns_and_backfills(app):
+    novel = _old_novel_with_chapters(3)
+    db.session.execute(text("DROP INDEX ix_chapter_novel_number"))
+    db.session.execute(text("ALTER TABLE chapter DROP COLUMN chapter_number"))
+    db.session.commit()
+    assert [column.name for _, column in missing_columns()] == ['chapter_number']
+
+    result = app.test_cli_runner().invoke(args=['upgrade-db'])
+
+    assert result.exit_code == 0, result.output
+    assert missing_columns() == []
+    db.session.expire_all()
+    chapters = Chapter.query.filter_by(novel_id=novel.id).order_by(Chapter.id).all()
+    assert [chapter.chapter_number for chapter in chapters] == [1, 2, 3]
+    assert [chapter.word_count for chapter in chapters] == [2, 4, 6]
+    novel = db.session.get(Novel, novel.id)
+    assert novel.chapter_count == 3
+    assert novel.last_chapter_id == chapters[-1].id
+    assert novel.next_chapter_number() == 4
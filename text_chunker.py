@@ -0,0 +1,133 @@
+"""
+翻译分段
+按段落和句子（支持中文标点。！？）把章节正文打包成不超过token预算的分段，
+避免在句子中间截断；每个分段附带token估算，用于估算翻译费用。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterable, List
+
+# 句末标点（含其后的引号/括号），中文标点后不需要空格
+_SENTENCE_END_RE = re.compile(r'(?<=[。！？!?…；;])[”’」』）)\]]*|(?<=[.])[”’"\')\]]*(?=\s)')
+_CJK_RE = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+
+# 每个分段默认的token预算（googletrans单次请求上限约5000字符）
+DEFAULT_MAX_TOKENS = 1000
+
+
+@dataclass
+class Chunk:
+    """一个翻译分段"""
+    text: str
+    tokens: int
+    continues: bool = False  # 与上一个分段属于同一段落（段落过长被按句子拆开）
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：汉字约1个token，其他字符约4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return _tokens(cjk, len(text) - cjk)
+
+
+def _tokens(cjk: int, other: int) -> int:
+    """按汉字数和其他字符数估算token，用于逐段累加计数（与estimate_tokens结果一致）"""
+    if not cjk and not other:
+        return 0
+    return cjk + (other + 3) // 4
+
+
+def split_sentences(paragraph: str) -> List[str]:
+    """按句末标点拆分句子，拆分后直接拼接即可还原原文"""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(paragraph):
+        end = match.end()
+        if end > start:
+            sentences.append(paragraph[start:end])
+            start = end
+    if start < len(paragraph):
+        sentences.append(paragraph[start:])
+    return sentences
+
+
+def _hard_split(text: str, max_tokens: int) -> List[str]:
+    """没有标点的超长句子只能按长度切分（逐字符累加计数，不重复估算已有部分）"""
+    pieces = []
+    start = cjk = other = 0
+    for index, char in enumerate(text):
+        is_cjk = _CJK_RE.match(char) is not None
+        if index > start and _tokens(cjk + is_cjk, other + (not is_cjk)) > max_tokens:
+            pieces.append(text[start:index])
+            start, cjk, other = index, 0, 0
+        cjk += is_cjk
+        other += not is_cjk
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def chunk_text(text: str, max_tokens: int = DEFAULT_MAX_TOKENS) -> List[Chunk]:
+    """把正文打包为分段：优先整段打包，段落超出预算时按句子拆分，句子仍超出时按长度切分"""
+    max_tokens = max(1, max_tokens)
+    chunks: List[Chunk] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    def flush(continues=False):
+        nonlocal current, current_tokens
+        if current:
+            chunks.append(Chunk('\n'.join(current), current_tokens, continues))
+        current = []
+        current_tokens = 0
+
+    for paragraph in text.split('\n'):
+        tokens = estimate_tokens(paragraph) + 1  # 换行符
+        if current and current_tokens + tokens <= max_tokens:
+            current.append(paragraph)
+            current_tokens += tokens
+            continue
+        flush()
+        if tokens <= max_tokens:
+            current = [paragraph]
+            current_tokens = tokens
+            continue
+
+        # 单个段落超出预算：按句子打包，同一段落内的后续分段标记为continues
+        parts: List[str] = []
+        piece_cjk = piece_other = 0
+        first = True
+        for sentence in split_sentences(paragraph):
+            for part in ([sentence] if estimate_tokens(sentence) <= max_tokens else _hard_split(sentence, max_tokens)):
+                cjk = len(_CJK_RE.findall(part))
+                other = len(part) - cjk
+                if parts and _tokens(piece_cjk + cjk, piece_other + other) > max_tokens:
+                    chunks.append(Chunk(''.join(parts), _tokens(piece_cjk, piece_other), not first))
+                    first = False
+                    parts = []
+                    piece_cjk = piece_other = 0
+                parts.append(part)
+                piece_cjk += cjk
+                piece_other += other
+        if parts:
+            chunks.append(Chunk(''.join(parts), _tokens(piece_cjk, piece_other), not first))
+    flush()
+    return chunks
+
+
+def join_chunks(texts: Iterable[str], chunks: List[Chunk], sentence_separator: str = '') -> str:
+    """把（翻译后的）分段按原来的段落结构拼回；同一段落内的分段用sentence_separator连接"""
+    result = ''
+    for index, (text, chunk) in enumerate(zip(texts, chunks)):
+        if index:
+            result += sentence_separator if chunk.continues else '\n'
+        result += text
+    return result
+
+
+def estimate_request_tokens(chunks: List[Chunk], prompt: str = None) -> int:
+    """估算翻译这些分段需要的输入token（提示词每个请求发送一次）"""
+    prompt_tokens = estimate_tokens(prompt) if prompt else 0
+    return sum(chunk.tokens + prompt_tokens for chunk in chunks)
@@ -0,0 +1,135 @@
+"""
+并发翻译调度
+用线程池并发发送翻译请求，令牌桶限制请求速率，遇到限流(429)或超时时
+指数退避并临时降低速率；结果按输入顺序返回。
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+
+class TokenBucket:
+    """线程安全的令牌桶，rate为每秒补充的令牌数"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """取得一个令牌，不足时阻塞等待"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self):
+        """被限流时速率减半（不低于原速率的1/16）"""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.base_rate / 16, self.rate / 2)
+
+    def recover(self):
+        """请求成功后逐步恢复速率"""
+        with self._lock:
+            if self.rate < self.base_rate:
+                self._refill()
+                self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
+
+
+def is_retryable(exc: Exception) -> bool:
+    """判断异常是否为限流或超时（可以退避后重试）"""
+    if isinstance(exc, TimeoutError) or 'Timeout' in type(exc).__name__:
+        return True
+    status = getattr(exc, 'status_code', None) or getattr(getattr(exc, 'response', None), 'status_code', None)
+    if status == 429:
+        return True
+    message = str(exc)
+    return '429' in message or 'Too Many Requests' in message or 'Throttling' in message
+
+
+class TranslationExecutor:
+    """并发执行翻译请求：max_in_flight限制同时进行的请求数，rate/burst控制请求速率
+    两个限制都作用于executor实例，多个任务共用同一个executor时合计不超过max_in_flight。
+    """
+
+    def __init__(self, max_in_flight: int = 4, rate: float = 2.0, burst: int = 4,
+                 max_retries: int = 4, base_delay: float = 1.0):
+        self.max_in_flight = max(1, max_in_flight)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self.bucket = TokenBucket(rate, max(1, burst))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> 'TranslationExecutor':
+        """从app.config或环境变量读取配置"""
+        return cls(
+            max_in_flight=int(config.get('TRANSLATION_MAX_IN_FLIGHT', 4)),
+            rate=float(config.get('TRANSLATION_RATE_LIMIT', 2.0)),
+            burst=int(config.get('TRANSLATION_RATE_BURST', 4)),
+        )
+
+    def call(self, fn: Callable, *args):
+        """在速率限制下调用fn，限流或超时时退避重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                # 退避等待期间不占用名额
+                with self._slots:
+                    self.bucket.acquire()
+                    result = fn(*args)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                self.bucket.throttle()
+                retry_after = getattr(e, 'retry_after', None)
+                delay = retry_after if retry_after else self.base_delay * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, self.base_delay))
+                continue
+            self.bucket.recover()
+            return result
+
+    def imap_unordered(self, fn: Callable, items: Sequence,
+                       on_error: Optional[Callable] = None) -> Iterator[Tuple[int, object]]:
+        """并发处理items，按完成顺序在调用线程中产出(序号, 结果)
+        on_error(item, exc)提供失败时的替代结果；未提供时异常直接抛出。
+        每次调用使用自己的线程，实际同时进行的请求数由executor共用的名额限制。
+        """
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='translate') as pool:
+            futures = {pool.submit(self.call, fn, item): index for index, item in enumerate(items)}
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if on_error is None:
+                            raise
+                        result = on_error(items[index], e)
+                    yield index, result
+            finally:
+                # 调用方提前退出时取消尚未开始的请求
+                for future in futures:
+                    future.cancel()
+
+    def map(self, fn: Callable, items: Sequence, on_error: Optional[Callable] = None) -> List:
+        """并发处理items，结果按输入顺序返回"""
+        results = [None] * len(items)
+        for index, result in self.imap_unordered(fn, items, on_error):
+            results[index] = result
+        return results
@@ -0,0 +1,574 @@
+"""
+后台翻译任务
+任务和逐章检查点保存在数据库中，由独立的worker进程（flask run-translation-worker）
+领取执行；任意web进程都可以查询进度，worker崩溃后任务会从最后完成的章节继续。
+执行中的任务由独立线程定期刷新心跳，写入检查点前先确认任务仍由本worker持有。
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from flask import current_app
+
+from models import db, Novel, TranslationJob, TranslationJobChapter
+from novel_importer import NovelInfo, ChapterInfo, Language
+from translation_executor import TranslationExecutor
+from translation_memory import get_translation_memory, make_key, MemoryUsage
+from glossary import GlossaryMatcher, glossary_key, load_glossary
+
+# worker超过该时间未刷新心跳，任务视为中断，可以被其他worker接管
+HEARTBEAT_TIMEOUT = timedelta(minutes=5)
+# 心跳刷新间隔（秒），与翻译进度无关，远小于HEARTBEAT_TIMEOUT
+HEARTBEAT_INTERVAL = 30
+# 单个任务最多执行次数（包括中断后的重试）
+MAX_ATTEMPTS = 3
+# 已结束的任务保留时间
+FINISHED_JOB_RETENTION = timedelta(days=7)
+
+
+class QueueFullError(Exception):
+    """排队中的任务过多"""
+
+
+class JobLostError(Exception):
+    """任务已被其他worker接管（本worker的心跳曾经超时）"""
+
+
+class LocalTranslator:
+    """离线替身翻译器：不调用任何外部服务，用于开发和测试"""
+
+    model = 'local'
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.total_cost = 0.0
+
+    def last_call_cost(self) -> float:
+        return 0.0
+
+    def translate_text(self, text: str, custom_prompt: str = None) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        return f"[EN] {text}" if text else text
+
+    def translate_metadata(self, novel_info: NovelInfo, custom_prompt: str = None):
+        return self.translate_text(novel_info.title), self.translate_text(novel_info.description)
+
+    def translate_chapter(self, novel_info: NovelInfo, chapter: ChapterInfo, custom_prompt: str = None) -> ChapterInfo:
+        return ChapterInfo(
+            title=self.translate_text(chapter.title, custom_prompt),
+            content=self.translate_text(chapter.content, custom_prompt),
+            chapter_number=chapter.chapter_number
+        )
+
+
+class QwenTranslator:
+    """把QwenNovelTranslator的整本翻译接口适配为逐章调用，以便逐章保存检查点
+    章节会被并发翻译，每个线程使用独立的QwenNovelTranslator实例。
+    """
+
+    model = 'qwen'
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key
+        self._local = threading.local()
+        self._translators = []
+        self._lock = threading.Lock()
+
+    @property
+    def _translator(self):
+        if not hasattr(self._local, 'translator'):
+            from novel_translator_qwen import QwenNovelTranslator
+            translator = QwenNovelTranslator(api_key=self.api_key)
+            with self._lock:
+                self._translators.append(translator)
+            self._local.translator = translator
+        return self._local.translator
+
+    @property
+    def total_cost(self) -> float:
+        with self._lock:
+            return sum(translator.total_cost for translator in self._translators)
+
+    def last_call_cost(self) -> float:
+        """当前线程上一次translate_chapter产生的费用"""
+        return getattr(self._local, 'last_cost', 0.0)
+
+    def translate_metadata(self, novel_info: NovelInfo, custom_prompt: str = None):
+        meta = NovelInfo(
+            title=novel_info.title,
+            author=novel_info.author,
+            description=novel_info.description,
+            language=novel_info.language,
+            category=novel_info.category,
+            chapters=[]
+        )
+        success, translated, _ = self._translator.translate_novel(meta, custom_prompt=custom_prompt)
+        if not success:
+            return novel_info.title, novel_info.description
+        return translated.title, translated.description
+
+    def translate_chapter(self, novel_info: NovelInfo, chapter: ChapterInfo, custom_prompt: str = None) -> ChapterInfo:
+        # 简介已单独翻译，这里只带上书名作为上下文
+        single = NovelInfo(
+            title=novel_info.title,
+            author=novel_info.author,
+            description='',
+            language=novel_info.language,
+            category=novel_info.category,
+            chapters=[chapter]
+        )
+        translator = self._translator
+        cost_before = translator.total_cost
+        success, translated, message = translator.translate_novel(single, custom_prompt=custom_prompt)
+        self._local.last_cost = translator.total_cost - cost_before
+        if not success or not translated.chapters:
+            raise RuntimeError(message or '翻译失败')
+        return translated.chapters[0]
+
+
+def create_translator(backend: str, api_key: str = None):
+    """根据配置创建翻译器：'qwen'（默认）或离线的'local'"""
+    if backend == 'local':
+        return LocalTranslator(delay=float(os.getenv('LOCAL_TRANSLATOR_DELAY', '0')))
+    return QwenTranslator(api_key=api_key)
+
+
+def _initial_progress(total_chapters: int) -> Dict:
+    return {
+        'current_chapter': 0,
+        'total_chapters': total_chapters,
+        'current_chapter_title': '',
+        'success_count': 0,
+        'error_count': 0,
+        'estimated_cost': 0.0,
+        'elapsed_time': 0.0,
+        'progress_percent': 0.0,
+        'success_rate': 100.0
+    }
+
+
+def _novel_info_from_payload(data: Dict) -> NovelInfo:
+    return NovelInfo(
+        title=data['title'],
+        author=data['author'],
+        description=data['description'],
+        language=Language(data.get('language', Language.CHINESE.value)),
+        category=data['category'],
+        chapters=[
+            ChapterInfo(title=ch['title'], content=ch['content'], chapter_number=ch.get('chapter_number'))
+            for ch in data['chapters']
+        ]
+    )
+
+
+def enqueue_job(kind: str, payload: Dict, max_pending: int = 20) -> str:
+    """创建翻译任务并返回任务ID；排队任务过多时抛出QueueFullError"""
+    pending = TranslationJob.query.filter(TranslationJob.status.in_(['queued', 'translating'])).count()
+    if pending >= max_pending:
+        raise QueueFullError(f'当前有 {pending} 个翻译任务在排队，请稍后再试')
+
+    job = TranslationJob(
+        id=str(uuid.uuid4()),
+        kind=kind,
+        status='queued',
+        payload=json.dumps(payload, ensure_ascii=False),
+        progress=json.dumps({'progress': _initial_progress(len(payload['novel_info']['chapters']))})
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def _job_result_meta(job: TranslationJob, payload: Dict, state: Dict) -> Dict:
+    """翻译结果中除章节以外的信息"""
+    novel_info = payload['novel_info']
+    result = {
+        'title': state.get('title', novel_info['title']),
+        'author': novel_info['author'],
+        'description': state.get('description', novel_info['description']),
+    }
+    if job.kind == 'novel':
+        result['category'] = payload.get('category') or novel_info['category']
+        result['cover_filename'] = payload.get('cover_filename')
+    return result
+
+
+def _job_result(job: TranslationJob, payload: Dict, state: Dict) -> Dict:
+    """从检查点组装完整的翻译结果（包含全部译文）"""
+    chapters = [
+        {'title': ch.title, 'content': ch.content, 'chapter_number': ch.chapter_number}
+        for ch in job.chapters.order_by(TranslationJobChapter.chapter_index)
+    ]
+    result = _job_result_meta(job, payload, state)
+    result['chapters'] = chapters
+    if job.kind == 'novel':
+        # 纯文本版本，供前端下载
+        parts = [result['title'], f"作者: {result['author']}", result['description']]
+        parts.extend(f"{ch['title']}\n\n{ch['content']}" for ch in chapters)
+        result['content'] = '\n\n'.join(parts)
+    return result
+
+
+def get_job_status(job_id: str) -> Optional[Dict]:
+    """返回任务进度（与原先内存中的进度字典格式一致），任务不存在时返回None"""
+    job = db.session.get(TranslationJob, job_id)
+    if job is None:
+        return None
+    state = json.loads(job.progress or '{}')
+    payload = json.loads(job.payload)
+    data = {
+        'status': 'translating' if job.status == 'queued' else job.status,
+        'queued': job.status == 'queued',
+        'progress': state.get('progress', _initial_progress(0)),
+        'log_messages': [],
+    }
+    for key in ('log_message', 'log_level'):
+        if key in state:
+            data[key] = state[key]
+    if job.kind == 'novel':
+        data['cover_filename'] = payload.get('cover_filename')
+        data['category'] = payload.get('category')
+    else:
+        data['novel_id'] = payload.get('novel_id')
+
+    if job.status == 'completed':
+        data['result'] = _job_result(job, payload, state)
+        data['stats'] = state.get('stats', {})
+    elif job.status == 'error':
+        data['error'] = job.error
+    return data
+
+
+def get_job_snapshot(job_id: str) -> Optional[Dict]:
+    """读取任务的精简进度（扁平字典，不读取任务参数和译文），任务不存在时返回None"""
+    row = db.session.query(TranslationJob.status, TranslationJob.progress, TranslationJob.error).filter(
+        TranslationJob.id == job_id).first()
+    if row is None:
+        return None
+    state = json.loads(row.progress or '{}')
+    snapshot = dict(state.get('progress', {}))
+    snapshot['status'] = 'translating' if row.status == 'queued' else row.status
+    snapshot['queued'] = row.status == 'queued'
+    for key in ('log_message', 'log_level'):
+        if key in state:
+            snapshot[key] = state[key]
+    if row.status == 'completed':
+        snapshot['stats'] = state.get('stats', {})
+    elif row.status == 'error':
+        snapshot['error'] = row.error
+    return snapshot
+
+
+def get_job_result_meta(job_id: str) -> Optional[Dict]:
+    """已完成任务的结果信息（不含章节正文）"""
+    job = db.session.get(TranslationJob, job_id)
+    if job is None:
+        return None
+    result = _job_result_meta(job, json.loads(job.payload), json.loads(job.progress or '{}'))
+    result['chapter_count'] = job.chapters.count()
+    return result
+
+
+def list_job_chapters(job_id: str, page: int = 1, per_page: int = 50) -> Dict:
+    """分页返回任务中已完成的章节译文"""
+    pagination = TranslationJobChapter.query.filter_by(job_id=job_id).order_by(
+        TranslationJobChapter.chapter_index
+    ).paginate(page=page, per_page=per_page, max_per_page=200, error_out=False)
+    return {
+        'chapters': [
+            {'title': ch.title, 'content': ch.content, 'chapter_number': ch.chapter_number, 'failed': ch.failed}
+            for ch in pagination.items
+        ],
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'total': pagination.total,
+        'has_next': pagination.has_next
+    }
+
+
+def claim_next_job(worker_id: str) -> Optional[TranslationJob]:
+    """领取一个排队中或心跳超时的任务；用条件更新保证多个worker不会领取同一任务"""
+    stale_before = datetime.utcnow() - HEARTBEAT_TIMEOUT
+    claimable = db.or_(
+        TranslationJob.status == 'queued',
+        db.and_(TranslationJob.status == 'translating', TranslationJob.heartbeat_at < stale_before)
+    )
+    candidates = [row[0] for row in db.session.query(TranslationJob.id).filter(claimable)
+                  .order_by(TranslationJob.created_at).limit(5)]
+    for job_id in candidates:
+        now = datetime.utcnow()
+        result = db.session.execute(
+            db.update(TranslationJob).where(TranslationJob.id == job_id, claimable).values(
+                status='translating',
+                worker_id=worker_id,
+                heartbeat_at=now,
+                started_at=db.func.coalesce(TranslationJob.started_at, now),
+                attempts=TranslationJob.attempts + 1
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return db.session.get(TranslationJob, job_id)
+    return None
+
+
+def _update_owned_job(job_id: str, worker_id: str, **values) -> bool:
+    """刷新心跳并更新任务字段，只在任务仍由该worker执行时生效；返回是否仍持有任务（不提交）"""
+    result = db.session.execute(
+        db.update(TranslationJob).where(
+            TranslationJob.id == job_id,
+            TranslationJob.worker_id == worker_id,
+            TranslationJob.status == 'translating'
+        ).values(heartbeat_at=datetime.utcnow(), **values),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount == 1
+
+
+class JobHeartbeat:
+    """在独立线程中定期刷新任务心跳
+    单章翻译或限流退避耗时超过HEARTBEAT_TIMEOUT时，任务也不会被其他worker当作中断任务接管。
+    """
+
+    def __init__(self, app, job_id: str, worker_id: str, interval: float = HEARTBEAT_INTERVAL):
+        self.app = app
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id[:8]}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    owned = _update_owned_job(self.job_id, self.worker_id)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"刷新翻译任务 {self.job_id} 心跳失败: {e}")
+                    continue
+                finally:
+                    db.session.remove()
+            if not owned:
+                return
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _finish_job(job: TranslationJob, worker_id: str, payload: Dict, status: str, error: str = None):
+    # 任务结束后不再保留API密钥
+    payload.pop('api_key', None)
+    owned = _update_owned_job(job.id, worker_id, payload=json.dumps(payload, ensure_ascii=False),
+                              status=status, error=error, finished_at=datetime.utcnow())
+    db.session.commit()
+    if not owned:
+        print(f"翻译任务 {job.id} 已被其他worker接管，不再更新状态")
+
+
+def run_job(job: TranslationJob, backend: str = 'qwen', executor: TranslationExecutor = None):
+    """执行任务，跳过已有检查点的章节；章节并发翻译，每完成一章保存一次检查点"""
+    executor = executor or TranslationExecutor()
+    payload = json.loads(job.payload)
+    # 领取时写入的worker_id；提交后job会重新从数据库加载，不能再用job.worker_id判断是否仍持有任务
+    worker_id = job.worker_id
+    if job.attempts > MAX_ATTEMPTS:
+        _finish_job(job, worker_id, payload, 'error', f'任务已中断 {job.attempts - 1} 次，不再重试')
+        return
+
+    novel_info = _novel_info_from_payload(payload['novel_info'])
+    if payload.get('description'):
+        novel_info.description = payload['description']
+    custom_prompt = payload.get('custom_prompt') or None
+    translator = create_translator(backend, payload.get('api_key'))
+
+    # 追加章节时使用所属小说的术语表，整本翻译时按原文书名和作者查找
+    novel = db.session.get(Novel, int(payload['novel_id'])) if payload.get('novel_id') else None
+    source = novel if novel is not None else novel_info
+    matcher = GlossaryMatcher(load_glossary(glossary_key(source.title, source.author)))
+
+    state = json.loads(job.progress or '{}')
+    progress = state.get('progress') or _initial_progress(len(novel_info.chapters))
+    # 之前的执行中已经产生的费用
+    base_cost = progress.get('estimated_cost', 0.0)
+    memory = get_translation_memory()
+    usage = MemoryUsage(progress.get('memory_hits', 0), progress.get('memory_misses', 0),
+                        progress.get('memory_saved_cost', 0.0))
+
+    def save_state(chapter: TranslationJobChapter = None):
+        """保存进度和章节检查点；先确认任务仍由本worker执行，再写入检查点"""
+        progress.update(usage.to_progress())
+        progress['estimated_cost'] = base_cost + translator.total_cost
+        progress['elapsed_time'] = (datetime.utcnow() - job.started_at).total_seconds()
+        done = progress['success_count'] + progress['error_count']
+        progress['progress_percent'] = done / progress['total_chapters'] * 100 if progress['total_chapters'] else 100.0
+        progress['success_rate'] = progress['success_count'] / done * 100 if done else 100.0
+        state['progress'] = progress
+        if not _update_owned_job(job.id, worker_id, progress=json.dumps(state, ensure_ascii=False)):
+            db.session.rollback()
+            raise JobLostError(job.id)
+        if chapter is not None:
+            db.session.add(chapter)
+        db.session.commit()
+
+    heartbeat = JobHeartbeat(current_app._get_current_object(), job.id, worker_id)
+    heartbeat.start()
+    try:
+        if job.kind == 'novel' and 'title' not in state:
+            state['title'], state['description'] = translator.translate_metadata(novel_info, custom_prompt)
+            save_state()
+
+        finished = {row[0] for row in db.session.query(TranslationJobChapter.chapter_index)
+                    .filter(TranslationJobChapter.job_id == job.id)}
+        pending = [(index, chapter) for index, chapter in enumerate(novel_info.chapters) if index not in finished]
+
+        def chapter_prompt(chapter):
+            # 只附加本章出现的术语，保持提示词简短
+            return matcher.build_prompt(custom_prompt, f"{chapter.title}\n{chapter.content}")
+
+        def memory_key(chapter):
+            return make_key(f"{chapter.title}\n{chapter.content}", chapter_prompt(chapter), translator.model)
+
+        def translate(item):
+            chapter = item[1]
+            translated = translator.translate_chapter(novel_info, chapter, chapter_prompt(chapter))
+            if memory is not None:
+                memory.store(memory_key(chapter), json.dumps(
+                    {'title': translated.title, 'content': translated.content}, ensure_ascii=False
+                ), translator.last_call_cost())
+            return translated
+
+        def translation_failed(item, error):
+            print(f"翻译第{item[0] + 1}章失败: {error}")
+            return None
+
+        def results():
+            # 先查翻译记忆，命中的章节不占用翻译请求的速率配额
+            misses = []
+            for item in pending:
+                cached = memory.lookup(memory_key(item[1])) if memory is not None else None
+                if cached is None:
+                    if memory is not None:
+                        usage.record_miss()
+                    misses.append(item)
+                    continue
+                usage.record_hit(cached[1])
+                data = json.loads(cached[0])
+                yield item, ChapterInfo(title=data['title'], content=data['content'],
+                                        chapter_number=item[1].chapter_number)
+            for position, translated in executor.imap_unordered(translate, misses, on_error=translation_failed):
+                yield misses[position], translated
+
+        # 检查点在当前线程中写入（数据库会话不能跨线程使用）
+        for (index, chapter), translated in results():
+            progress['current_chapter_title'] = chapter.title
+            failed = translated is None
+            if failed:
+                # 翻译失败时保留原文
+                translated = chapter
+                progress['error_count'] += 1
+            else:
+                progress['success_count'] += 1
+            progress['current_chapter'] = progress['success_count'] + progress['error_count']
+
+            state['log_message'] = f"正在翻译: {chapter.title}"
+            state['log_level'] = 'error' if failed else 'info'
+            save_state(TranslationJobChapter(
+                job_id=job.id,
+                chapter_index=index,
+                chapter_number=translated.chapter_number,
+                title=translated.title,
+                content=translated.content,
+                failed=failed
+            ))
+
+        state['log_message'] = f"翻译完成！共 {progress['total_chapters']} 章"
+        state['log_level'] = 'success'
+        state['stats'] = {
+            'success_count': progress['success_count'],
+            'error_count': progress['error_count'],
+            'total_cost': base_cost + translator.total_cost,
+            'elapsed_time': progress['elapsed_time'],
+            'success_rate': progress['success_rate'],
+            **usage.to_progress()
+        }
+        save_state()
+        _finish_job(job, worker_id, payload, 'completed')
+    except JobLostError:
+        # 其他worker已经从检查点继续执行，本worker直接放弃，不写入任何结果
+        print(f"翻译任务 {job.id} 已被其他worker接管，停止执行")
+    except Exception as e:
+        db.session.rollback()
+        print(f"翻译任务 {job.id} 出错: {e}")
+        _finish_job(job, worker_id, payload, 'error', str(e))
+    finally:
+        heartbeat.stop()
+
+
+def purge_finished_jobs() -> int:
+    """删除超过保留期的已结束任务（连同检查点），返回删除的任务数"""
+    cutoff = datetime.utcnow() - FINISHED_JOB_RETENTION
+    job_ids = [row[0] for row in db.session.query(TranslationJob.id).filter(
+        TranslationJob.status.in_(['completed', 'error']), TranslationJob.finished_at < cutoff)]
+    if job_ids:
+        TranslationJobChapter.query.filter(TranslationJobChapter.job_id.in_(job_ids)).delete(
+            synchronize_session=False)
+        TranslationJob.query.filter(TranslationJob.id.in_(job_ids)).delete(synchronize_session=False)
+        db.session.commit()
+    return len(job_ids)
+
+
+def run_worker(app, concurrency: int = 2, poll_interval: float = 2.0, backend: str = 'qwen',
+               stop_event: threading.Event = None, executor: TranslationExecutor = None):
+    """启动固定大小的worker线程池，持续领取并执行任务，直到stop_event被设置
+    同一进程内的任务共用executor，速率限制对整个进程生效。
+    """
+    stop_event = stop_event or threading.Event()
+    executor = executor or TranslationExecutor()
+    host = f"{socket.gethostname()}-{os.getpid()}"
+
+    def loop(slot: int):
+        worker_id = f"{host}-{slot}"
+        while not stop_event.is_set():
+            with app.app_context():
+                job = claim_next_job(worker_id)
+                if job is None:
+                    db.session.remove()
+                else:
+                    print(f"[{worker_id}] 开始翻译任务 {job.id}（第{job.attempts}次执行）")
+                    run_job(job, backend, executor)
+                    db.session.remove()
+                    continue
+            stop_event.wait(poll_interval)
+
+    with app.app_context():
+        purged = purge_finished_jobs()
+        if purged:
+            print(f"已清理 {purged} 个过期的翻译任务")
+
+    threads = [threading.Thread(target=loop, args=(slot,), name=f"translation-worker-{slot}")
+               for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+    return threads
@@ -0,0 +1,169 @@
+"""
+翻译记忆
+按（规范化原文 + 提示词 + 模型）的哈希缓存翻译结果，保存在本地SQLite文件中，
+超过容量上限时按最近使用时间淘汰。重新翻译同一内容时无需再次调用翻译服务。
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional, Tuple
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'translation_memory.db')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """规范化原文：统一全角/半角形式并合并空白，避免排版差异导致缓存不命中"""
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFKC', text or '')).strip()
+
+
+def make_key(text: str, prompt: str = None, model: str = '') -> str:
+    """计算缓存键"""
+    digest = hashlib.sha256()
+    for part in (model or '', prompt or '', normalize_text(text)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class TranslationMemory:
+    """基于SQLite的翻译缓存，max_bytes限制译文总大小"""
+
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        # 多个worker线程共用一个连接，访问由锁串行化
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS memory ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, cost REAL NOT NULL DEFAULT 0, '
+            'size INTEGER NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_memory_last_used ON memory (last_used)')
+        # 译文总大小保存在单行的meta表中，随每次写入和淘汰在同一个事务里更新，不必每次SUM整张表
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS memory_meta ('
+            'id INTEGER PRIMARY KEY CHECK (id = 1), total_bytes INTEGER NOT NULL)'
+        )
+        self._conn.commit()
+        self._conn.execute('BEGIN IMMEDIATE')
+        # 旧版本创建的文件没有meta行，只在这里统计一次
+        self._conn.execute(
+            'INSERT OR IGNORE INTO memory_meta (id, total_bytes) SELECT 1, COALESCE(SUM(size), 0) FROM memory'
+        )
+        self._conn.commit()
+
+    def _total_bytes(self) -> int:
+        # web进程和翻译worker共用同一个文件，总大小从数据库读取，不在进程内计数
+        return self._conn.execute('SELECT total_bytes FROM memory_meta WHERE id = 1').fetchone()[0]
+
+    def lookup(self, key: str) -> Optional[Tuple[str, float]]:
+        """返回(译文, 当初翻译花费的费用)，未命中时返回None"""
+        with self._lock:
+            row = self._conn.execute('SELECT value, cost FROM memory WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE memory SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+            return row[0], row[1]
+
+    def store(self, key: str, value: str, cost: float = 0.0):
+        """保存译文，超过容量时淘汰最久未使用的条目"""
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # 先取得写锁，其他进程在提交前不能写入，被替换条目的大小、总大小和淘汰结果一致
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT size FROM memory WHERE key = ?', (key,)).fetchone()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO memory (key, value, cost, size, last_used) VALUES (?, ?, ?, ?, ?)',
+                    (key, value, cost, size, time.time())
+                )
+                total = self._total_bytes() + size - (row[0] if row else 0)
+                if total > self.max_bytes:
+                    total = self._evict(total, int(self.max_bytes * 0.9))
+                self._conn.execute('UPDATE memory_meta SET total_bytes = ? WHERE id = 1', (total,))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _evict(self, total: int, target_bytes: int) -> int:
+        """按最近使用时间从旧到新删除，直到总大小不超过target_bytes，返回删除后的总大小"""
+        rows = self._conn.execute('SELECT key, size FROM memory ORDER BY last_used')
+        victims = []
+        for key, size in rows:
+            if total <= target_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM memory WHERE key = ?', victims)
+        return total
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM memory').fetchone()[0]
+            total = self._total_bytes()
+        return {'entries': entries, 'bytes': total, 'max_bytes': self.max_bytes}
+
+
+class MemoryUsage:
+    """单次翻译中翻译记忆的命中统计（线程安全）"""
+
+    def __init__(self, hits: int = 0, misses: int = 0, saved_cost: float = 0.0):
+        self.hits = hits
+        self.misses = misses
+        self.saved_cost = saved_cost
+        self._lock = threading.Lock()
+
+    def record_hit(self, cost: float):
+        with self._lock:
+            self.hits += 1
+            self.saved_cost += cost
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total * 100 if total else 0.0
+
+    def to_progress(self):
+        """进度数据中的翻译记忆字段"""
+        return {
+            'memory_hits': self.hits,
+            'memory_misses': self.misses,
+            'memory_hit_rate': round(self.hit_rate, 1),
+            'memory_saved_cost': round(self.saved_cost, 4),
+        }
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_translation_memory() -> Optional[TranslationMemory]:
+    """进程内共享的翻译记忆；TRANSLATION_MEMORY=0时禁用"""
+    global _memory
+    if os.getenv('TRANSLATION_MEMORY', '1') == '0':
+        return None
+    with _memory_lock:
+        if _memory is None:
+            _memory = TranslationMemory(
+                path=os.getenv('TRANSLATION_MEMORY_PATH', DEFAULT_PATH),
+                max_bytes=int(float(os.getenv('TRANSLATION_MEMORY_MAX_MB', '256')) * 1024 * 1024)
+            )
+        return _memory
@@ -0,0 +1,57 @@
+"""
+上传文件流式落盘
+Werkzeug解析multipart请求时直接把上传内容写入临时目录，同时计算SHA-256（用于识别重复上传），
+解析器直接读取这个文件，不再需要file.save()再复制一遍。请求结束时临时文件自动删除，
+交给后台解析的文件调用detach()后由接收方负责删除。
+"""
+
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+
+
+class HashingUploadFile:
+    """写入时计算SHA-256的临时文件"""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile('w+b', dir=directory, suffix='.upload', delete=False)
+        self.name = self._file.name
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._detached = False
+
+    def write(self, data) -> int:
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def detach(self) -> str:
+        """交出临时文件的所有权（请求结束时不再删除），返回文件路径"""
+        self._file.close()
+        self._detached = True
+        return self.name
+
+    def close(self):
+        self._file.close()
+        if not self._detached and os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __getattr__(self, name):
+        # read/seek/tell等操作交给底层文件
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """上传的文件直接写入UPLOAD_TMP_DIR并计算哈希"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return HashingUploadFile(current_app.config['UPLOAD_TMP_DIR'])